@@ -0,0 +1,166 @@
+"""
+Асинхронные представления для работы под ASGI.
+
+Django 3.2 не умеет асинхронно обращаться к базе, а представления DRF
+синхронные, поэтому асинхронное представление выполняет обычное
+в ограниченном пуле потоков (ASYNC_VIEW_THREADS) и не держит событийный
+цикл. Медленные запросы занимают поток пула, а не процесс-обработчик,
+и соединения ждут в цикле, а не в очереди gunicorn.
+
+Маршруты async_urlpatterns подключаются перед обычными, когда включена
+настройка ASYNC_VIEWS (её включает backend/asgi.py).
+
+Потоковые ответы (выгрузка списка покупок) Django 3.2 перебирает
+синхронно прямо в событийном цикле, а генераторы выгрузки читают базу.
+ASGIHandler перебирает и закрывает их в потоке пула по мере отправки
+клиенту, через очередь не длиннее STREAM_BUFFER частей.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers import asgi
+from django.db import close_old_connections
+from django.urls import path
+
+from .views import IngredientViewSet, RecipeViewSet, TagViewSet
+
+STREAM_BUFFER = 16
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.ASYNC_VIEW_THREADS, thread_name_prefix='api-view'
+)
+
+_done = object()
+
+
+def run_view(view, request, *args, **kwargs):
+    try:
+        return view(request, *args, **kwargs)
+    finally:
+        # В потоках пула нет request_finished, соединения закрываем сами.
+        close_old_connections()
+
+
+async def stream_in_thread(response):
+    """
+    Части потокового ответа, прочитанные в одном потоке пула.
+    Поток ждёт, пока в очереди не освободится место, а при закрытии
+    генератора (клиент отключился) прекращает чтение. Ответ
+    закрывается в том же потоке: курсоры выгрузки принадлежат
+    его соединению с базой.
+    """
+    loop = asyncio.get_event_loop()
+    queue = asyncio.Queue(STREAM_BUFFER)
+    stopped = threading.Event()
+
+    def put(item):
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    def produce():
+        try:
+            for part in response:
+                put(part)
+                if stopped.is_set():
+                    break
+        finally:
+            # close() отправляет request_finished, он закрывает соединения.
+            response.close()
+            put(_done)
+
+    producer = loop.run_in_executor(executor, produce)
+    try:
+        while True:
+            part = await queue.get()
+            if part is _done:
+                break
+            yield part
+    finally:
+        stopped.set()
+        while not queue.empty():
+            queue.get_nowait()
+        await producer
+
+
+def response_headers(response):
+    """Заголовки и cookies, как в django.core.handlers.asgi"""
+    headers = []
+    for header, value in response.items():
+        if isinstance(header, str):
+            header = header.encode('ascii')
+        if isinstance(value, str):
+            value = value.encode('latin1')
+        headers.append((bytes(header), bytes(value)))
+    for cookie in response.cookies.values():
+        headers.append((
+            b'Set-Cookie', cookie.output(header='').encode('ascii').strip()
+        ))
+    return headers
+
+
+class ASGIHandler(asgi.ASGIHandler):
+    """Обработчик ASGI, читающий потоковые ответы в пуле потоков"""
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            await super().send_response(response, send)
+            return
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': response_headers(response),
+        })
+        parts = stream_in_thread(response)
+        try:
+            async for part in parts:
+                for chunk, _ in self.chunk_bytes(part):
+                    await send({
+                        'type': 'http.response.body',
+                        'body': chunk,
+                        'more_body': True,
+                    })
+        finally:
+            await parts.aclose()
+        await send({'type': 'http.response.body'})
+
+
+def as_async(view):
+    """Асинхронная обёртка представления, выполняемого в пуле потоков"""
+    run = sync_to_async(
+        partial(run_view, view), thread_sensitive=False, executor=executor
+    )
+
+    @wraps(view)
+    async def async_view(request, *args, **kwargs):
+        return await run(request, *args, **kwargs)
+
+    return async_view
+
+
+def viewset_view(viewset, actions, **initkwargs):
+    """
+    Представление набора, как его строит роутер: с параметрами
+    @action (permission_classes и другими) для дополнительных действий.
+    """
+    for name in actions.values():
+        initkwargs.update(getattr(getattr(viewset, name), 'kwargs', {}))
+    return as_async(viewset.as_view(actions, **initkwargs))
+
+
+async_urlpatterns = [
+    path('tags/', viewset_view(
+        TagViewSet, {'get': 'list'}, basename='tags', detail=False)),
+    path('ingredients/', viewset_view(
+        IngredientViewSet, {'get': 'list'}, basename='ingredients',
+        detail=False)),
+    path('recipes/download_shopping_cart/', viewset_view(
+        RecipeViewSet, {'get': 'download_shopping_cart'}, basename='recipes',
+        detail=False)),
+    path('recipes/<int:pk>/', viewset_view(
+        RecipeViewSet, {'get': 'retrieve', 'put': 'update',
+                        'patch': 'partial_update', 'delete': 'destroy'},
+        basename='recipes', detail=True)),
+]
@@ -0,0 +1,180 @@
+"""
+Вспомогательные функции для бенчмарков.
+
+Данные создаются bulk-вставками внутри транзакции, которая
+откатывается после замеров, поэтому команды можно запускать
+на рабочей базе.
+"""
+import random
+import time
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from foodgram import cart
+from foodgram.models import (Amount, FavouriteRecipe, Ingredient, Recipe,
+                             ShoppingList, Tag, TagRecipe)
+from rest_framework.authtoken.models import Token
+from users.models import Subscription
+
+User = get_user_model()
+
+BATCH_SIZE = 5000
+
+
+class RollbackError(Exception):
+    pass
+
+
+@contextmanager
+def rollback():
+    """Выполняет блок в транзакции и откатывает все изменения"""
+    try:
+        with transaction.atomic():
+            yield
+            raise RollbackError
+    except RollbackError:
+        pass
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(percent / 100 * len(values))))
+    return values[index]
+
+
+def measure(func, repeat=10):
+    """Запускает func repeat раз и возвращает статистику в миллисекундах"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'min': round(min(timings), 3),
+        'p50': round(percentile(timings, 50), 3),
+        'p95': round(percentile(timings, 95), 3),
+        'p99': round(percentile(timings, 99), 3),
+        'max': round(max(timings), 3),
+    }
+
+
+def create_users(count, prefix='bench'):
+    suffix = User.objects.count()
+    User.objects.bulk_create(
+        (User(username=f'{prefix}_{suffix}_{num}',
+              email=f'{prefix}_{suffix}_{num}@example.com',
+              password='!')
+         for num in range(count)),
+        batch_size=BATCH_SIZE
+    )
+    return list(
+        User.objects.filter(username__startswith=f'{prefix}_{suffix}_')
+    )
+
+
+def create_ingredients(count):
+    start = Ingredient.objects.count()
+    Ingredient.objects.bulk_create(
+        (Ingredient(name=f'ингредиент {start + num}', measurement_unit='г')
+         for num in range(count)),
+        batch_size=BATCH_SIZE
+    )
+    return list(Ingredient.objects.values_list('id', flat=True))
+
+
+def create_tags():
+    for slug, color in zip(('breakfast', 'lunch', 'dinner'),
+                           (color for color, _ in Tag.COLOR_CHOICES)):
+        Tag.objects.get_or_create(
+            slug=slug, defaults={'name': slug, 'color': color}
+        )
+    return list(Tag.objects.values_list('id', flat=True))
+
+
+def create_recipes(authors, count, ingredients, per_recipe=8, tags=()):
+    """
+    Создаёт count рецептов со случайными ингредиентами и тегами
+    и возвращает их id.
+    """
+    last_id = Recipe.objects.order_by('-id').values_list(
+        'id', flat=True).first() or 0
+    Recipe.objects.bulk_create(
+        (Recipe(author_id=random.choice(authors).id, name=f'рецепт {num}',
+                text='описание', cooking_time=random.randint(1, 120))
+         for num in range(count)),
+        batch_size=BATCH_SIZE
+    )
+    recipes = list(
+        Recipe.objects.filter(id__gt=last_id).values_list('id', flat=True)
+    )
+    Amount.objects.bulk_create(
+        (Amount(recipe_id=recipe, ingredient_id=ingredient,
+                amount=random.randint(1, 500))
+         for recipe in recipes
+         for ingredient in random.sample(ingredients, per_recipe)),
+        batch_size=BATCH_SIZE
+    )
+    if tags:
+        TagRecipe.objects.bulk_create(
+            (TagRecipe(recipe_id=recipe, tag_id=tag)
+             for recipe in recipes
+             for tag in random.sample(tags, random.randint(1, len(tags)))),
+            batch_size=BATCH_SIZE
+        )
+    return recipes
+
+
+def fill_shopping_cart(user, recipes):
+    ShoppingList.objects.bulk_create(
+        (ShoppingList(user=user, recipe_id=recipe) for recipe in recipes),
+        batch_size=BATCH_SIZE
+    )
+    cart.rebuild([user.id])
+
+
+def pairs(users, targets, per_user, exclude_self=False):
+    """per_user случайных различных targets на каждого пользователя"""
+    for user in users:
+        choices = [
+            target for target in targets
+            if not exclude_self or target != user.id
+        ]
+        for target in random.sample(choices, min(per_user, len(choices))):
+            yield user.id, target
+
+
+def create_favorites(users, recipes, per_user):
+    FavouriteRecipe.objects.bulk_create(
+        (FavouriteRecipe(user_id=user, recipe_id=recipe)
+         for user, recipe in pairs(users, recipes, per_user)),
+        batch_size=BATCH_SIZE
+    )
+
+
+def create_subscriptions(users, authors, per_user):
+    Subscription.objects.bulk_create(
+        (Subscription(user_id=user, author_id=author)
+         for user, author in pairs(
+             users, [author.id for author in authors], per_user, True
+        )),
+        batch_size=BATCH_SIZE
+    )
+
+
+def create_carts(users, recipes, per_user):
+    ShoppingList.objects.bulk_create(
+        (ShoppingList(user_id=user, recipe_id=recipe)
+         for user, recipe in pairs(users, recipes, per_user)),
+        batch_size=BATCH_SIZE
+    )
+    cart.rebuild([user.id for user in users])
+
+
+def create_tokens(users):
+    Token.objects.bulk_create(
+        (Token(user=user, key=Token.generate_key()) for user in users),
+        batch_size=BATCH_SIZE
+    )
+    return dict(Token.objects.filter(
+        user__in=users).values_list('user_id', 'key'))
@@ -0,0 +1,140 @@
+"""
+Кэш ответов со списком и страницей рецепта.
+
+В кэше лежит общая для всех пользователей часть ответа: флаги
+is_favorited, is_in_shopping_cart и is_subscribed в ней сброшены.
+Анонимный пользователь получает её как есть, для авторизованного
+флаги страницы восстанавливаются тремя короткими запросами.
+Ключ записи содержит метки версий рецептов (foodgram.versions)
+и справочников, по ним же строятся ETag и Last-Modified. Ответ
+авторизованному пользователю получает только слабый ETag с его флагами.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from foodgram import reference, versions
+from foodgram.models import FavouriteRecipe, ShoppingList
+from rest_framework import status
+from rest_framework.response import Response
+from users.models import Subscription
+
+USER_FLAGS = ('is_favorited', 'is_in_shopping_cart')
+
+
+def recipes_in(data):
+    """Рецепты ответа: страница списка, список или один рецепт"""
+    if isinstance(data, dict) and 'results' in data:
+        return data['results']
+    if isinstance(data, list):
+        return data
+    return [data]
+
+
+def with_flags(recipe, favorites=(), cart=(), subscriptions=()):
+    """Рецепт с флагами пользователя, если они есть в ответе (?fields=)"""
+    recipe = dict(recipe)
+    for flag, ids in zip(USER_FLAGS, (favorites, cart)):
+        if flag in recipe:
+            recipe[flag] = recipe['id'] in ids
+    if 'author' in recipe:
+        recipe['author'] = {
+            **recipe['author'],
+            'is_subscribed': recipe['author']['id'] in subscriptions,
+        }
+    return recipe
+
+
+def replace_recipes(data, recipes):
+    if isinstance(data, dict) and 'results' in data:
+        return {**data, 'results': recipes}
+    if isinstance(data, list):
+        return recipes
+    return recipes[0]
+
+
+def user_flags(user, recipes):
+    ids = [recipe['id'] for recipe in recipes]
+    authors = {
+        recipe['author']['id'] for recipe in recipes if 'author' in recipe
+    }
+    return (
+        set(FavouriteRecipe.objects.filter(
+            user=user, recipe_id__in=ids
+        ).values_list('recipe_id', flat=True)),
+        set(ShoppingList.objects.filter(
+            user=user, recipe_id__in=ids
+        ).values_list('recipe_id', flat=True)),
+        set(Subscription.objects.filter(
+            user=user, author_id__in=authors
+        ).values_list('author_id', flat=True)),
+    )
+
+
+class RecipeResponseCacheMixin:
+    """
+    Кэширует ответы list и retrieve, см. cached_response.
+    Фильтры по избранному и списку покупок зависят от пользователя,
+    такие ответы не кэшируются.
+    """
+    uncached_params = USER_FLAGS
+
+    def is_cacheable(self, request):
+        return not any(
+            request.query_params.get(param) for param in self.uncached_params
+        )
+
+    def cached_response(self, request, names, build):
+        """
+        Ответ из кэша по меткам версий names или build(),
+        если записи нет. На совпавшие If-None-Match
+        и If-Modified-Since возвращается 304.
+        """
+        if not self.is_cacheable(request):
+            return build()
+        stamps = versions.get_many(names)
+        key = 'recipe_response:' + hashlib.md5(repr((
+            request.build_absolute_uri(),
+            sorted(stamps.items()),
+            reference.get_version(reference.TAGS),
+            reference.get_version(reference.INGREDIENTS),
+        )).encode()).hexdigest()
+        shared = cache.get(key)
+        if shared is None:
+            response = build()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            data = response.data
+            shared = replace_recipes(
+                data, [with_flags(recipe) for recipe in recipes_in(data)]
+            )
+            cache.set(key, shared, settings.RECIPE_CACHE_TIMEOUT)
+        elif request.user.is_authenticated:
+            flags = user_flags(request.user, recipes_in(shared))
+            data = replace_recipes(shared, [
+                with_flags(recipe, *flags) for recipe in recipes_in(shared)
+            ])
+        else:
+            data = shared
+        etag = quote_etag(hashlib.md5(repr((key, [
+            [recipe.get(flag) for flag in USER_FLAGS]
+            + [recipe.get('author', {}).get('is_subscribed')]
+            for recipe in recipes_in(data)
+        ])).encode()).hexdigest())
+        headers = {}
+        last_modified = None
+        if request.user.is_authenticated:
+            # Флаги пользователя меняются без меток версий: валидатор
+            # ответа только ETag, учитывающий флаги.
+            etag = 'W/' + etag
+        else:
+            last_modified = max(stamps.values()) // 10 ** 6 + 1
+            headers['Last-Modified'] = http_date(last_modified)
+        response = Response(data, headers={'ETag': etag, **headers})
+        patch_vary_headers(response, ('Authorization', ))
+        return get_conditional_response(
+            request, etag=etag, last_modified=last_modified,
+            response=response
+        )
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+from . import truetype
+
+
+@register(Tags.compatibility, deploy=True)
+def check_pdf_font(app_configs, **kwargs):
+    """Без читаемого шрифта PDF_FONT_FILE выгрузка в PDF недоступна"""
+    path = settings.PDF_FONT_FILE
+    try:
+        truetype.load(path)
+    except OSError as error:
+        problem = f'не открывается: {error.strerror}'
+    except truetype.FORMAT_ERRORS as error:
+        problem = f'не читается как TrueType: {error}'
+    else:
+        return []
+    return [Warning(
+        f'Шрифт PDF_FONT_FILE {path!r} {problem}',
+        hint='Укажите в PDF_FONT_FILE шрифт TrueType с кириллицей '
+             '(в образе - fonts-dejavu-core), иначе формат pdf '
+             'выгрузки списка покупок недоступен',
+        id='api.W001',
+    )]
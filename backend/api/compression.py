@@ -0,0 +1,143 @@
+"""
+Сжатие ответов gzip и brotli.
+
+CompressionMiddleware - GZipMiddleware Django с правилами
+COMPRESSION_CONTENT_TYPES (типы и порог размера тела для каждого),
+выбором кодировки по порядку COMPRESSION_ENCODINGS среди принятых
+клиентом и исключением путей COMPRESSION_EXCLUDE_PATHS: ответы
+с токенами не должны давать утечку через размер (BREACH). gzip
+сжимает сам GZipMiddleware, brotli (если установлен пакет Brotli) -
+так же, но своим компрессором. Потоковые ответы (выгрузка списка
+покупок) сжимаются по частям.
+
+Сильный ETag сжатого ответа остаётся сильным, но получает суффикс
+кодировки ("abc" -> "abc-gzip"): побайтно разные варианты имеют разные
+валидаторы. В If-None-Match суффикс принятой кодировки снимается
+до представления, поэтому условные запросы сравниваются с ETag
+несжатого ответа, а ответ 304 получает ETag варианта клиента.
+"""
+import re
+
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ACCEPT_ENCODING = re.compile(r'\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([\d.]+))?')
+
+ENCODINGS = ('gzip', 'br') if brotli is not None else ('gzip', )
+
+
+def brotli_stream(chunks, level):
+    compressor = brotli.Compressor(quality=level)
+    for chunk in chunks:
+        data = compressor.process(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def variant_etag(etag, encoding):
+    """Сильный ETag сжатого варианта ответа"""
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def accepted_encodings(header):
+    """Кодировки из Accept-Encoding с ненулевым q"""
+    accepted = set()
+    for item in header.split(','):
+        match = ACCEPT_ENCODING.match(item)
+        if match is None:
+            continue
+        name, quality = match.groups()
+        try:
+            if quality is not None and float(quality) <= 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(name.lower())
+    return accepted
+
+
+def choose_encoding(header):
+    accepted = accepted_encodings(header)
+    for encoding in settings.COMPRESSION_ENCODINGS:
+        if encoding in ENCODINGS and encoding in accepted:
+            return encoding
+    return None
+
+
+def min_size(response):
+    """Порог сжатия для типа ответа или None, если тип не сжимается"""
+    content_type = response.get('Content-Type', '').split(';')[0].strip()
+    return settings.COMPRESSION_CONTENT_TYPES.get(content_type.lower())
+
+
+class CompressionMiddleware(GZipMiddleware):
+
+    def negotiate(self, request):
+        """Кодировка для ответа на request или None"""
+        if request.path.startswith(settings.COMPRESSION_EXCLUDE_PATHS):
+            return None
+        return choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+
+    def process_request(self, request):
+        encoding = self.negotiate(request)
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if encoding is None or not if_none_match:
+            return
+        request.META['HTTP_IF_NONE_MATCH'] = if_none_match.replace(
+            f'-{encoding}"', '"'
+        )
+        request.compression_if_none_match = if_none_match
+
+    def process_response(self, request, response):
+        encoding = self.negotiate(request)
+        etag = response.get('ETag')
+        strong = bool(etag) and etag.startswith('"')
+        if response.status_code == 304:
+            sent = getattr(request, 'compression_if_none_match', '')
+            if strong and encoding and variant_etag(etag, encoding) in sent:
+                response['ETag'] = variant_etag(etag, encoding)
+            return response
+        threshold = min_size(response)
+        if (threshold is None or response.has_header('Content-Encoding')
+                or request.path.startswith(
+                    settings.COMPRESSION_EXCLUDE_PATHS)):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding', ))
+        if encoding is None or (
+                not response.streaming and len(response.content) < threshold):
+            return response
+        if encoding == 'gzip':
+            # Кодировка уже выбрана по q: GZipMiddleware ищет в заголовке
+            # только слово gzip с учётом регистра.
+            request.META['HTTP_ACCEPT_ENCODING'] = 'gzip'
+            response = super().process_response(request, response)
+        else:
+            response = self.compress_brotli(response)
+        if strong and response.get('Content-Encoding') == encoding:
+            response['ETag'] = variant_etag(etag, encoding)
+        return response
+
+    @staticmethod
+    def compress_brotli(response):
+        """То же, что GZipMiddleware делает для gzip"""
+        level = settings.COMPRESSION_LEVELS['br']
+        if response.streaming:
+            response.streaming_content = brotli_stream(
+                response.streaming_content, level
+            )
+            del response['Content-Length']
+        else:
+            content = brotli.compress(response.content, quality=level)
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response['Content-Length'] = str(len(content))
+        response['Content-Encoding'] = 'br'
+        return response
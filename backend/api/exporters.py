@@ -0,0 +1,260 @@
+"""
+Выгрузка списка покупок в разных форматах.
+
+Экспортёр получает итератор строк агрегированного queryset
+и отдаёт содержимое файла по частям, поэтому ответ передаётся
+через StreamingHttpResponse и не собирается целиком в памяти.
+"""
+import csv
+import hashlib
+import zlib
+from itertools import chain, islice
+
+from django.conf import settings
+from django.utils.functional import cached_property
+
+from . import truetype
+
+TITLE = 'Список покупок'
+
+
+class BaseExporter:
+    content_type = None
+    extension = None
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    @classmethod
+    def available(cls):
+        return True
+
+    @staticmethod
+    def format_row(row):
+        return (
+            f'{row["ingredient__name"]} - '
+            f'{row["amount"]} {row["ingredient__measurement_unit"]}'
+        )
+
+    def render(self):
+        raise NotImplementedError
+
+
+class TextExporter(BaseExporter):
+    content_type = 'text/plain; charset=utf-8'
+    extension = 'txt'
+
+    def render(self):
+        yield f'{TITLE}:\n'
+        for row in self.rows:
+            yield f'{self.format_row(row)}\n'
+
+
+class Echo:
+    """Псевдофайл для csv.writer: возвращает записанную строку"""
+
+    def write(self, value):
+        return value
+
+
+class CsvExporter(BaseExporter):
+    content_type = 'text/csv; charset=utf-8'
+    extension = 'csv'
+    header = ('Ингредиент', 'Количество', 'Единица измерения')
+
+    def render(self):
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.header)
+        for row in self.rows:
+            yield writer.writerow((
+                row['ingredient__name'],
+                row['amount'],
+                row['ingredient__measurement_unit']
+            ))
+
+
+class PdfExporter(BaseExporter):
+    """
+    Минимальный генератор PDF без внешних зависимостей.
+
+    Страницы пишутся в поток по мере чтения строк, смещения объектов
+    запоминаются для таблицы xref в конце файла. Текст выводится
+    шрифтом TrueType из PDF_FONT_FILE: номера глифов (Identity-H)
+    собираются по мере вывода, а в конце файла пишутся подмножество
+    шрифта с этими глифами, их ширины и ToUnicode CMap, по которой
+    текст копируется и ищется в просмотрщике.
+    """
+    content_type = 'application/pdf'
+    extension = 'pdf'
+    page_width = 595
+    page_height = 842
+    margin = 50
+    font_size = 11
+    leading = 16
+    cmap_block = 100
+
+    def __init__(self, rows):
+        super().__init__(rows)
+        self.offset = 0
+        self.offsets = {}
+        self.used = {}
+
+    @classmethod
+    def available(cls):
+        try:
+            truetype.load(settings.PDF_FONT_FILE)
+        except (OSError, ) + truetype.FORMAT_ERRORS:
+            return False
+        return True
+
+    @cached_property
+    def font(self):
+        return truetype.load(settings.PDF_FONT_FILE)
+
+    @property
+    def lines_per_page(self):
+        return (self.page_height - 2 * self.margin) // self.leading
+
+    def emit(self, data):
+        self.offset += len(data)
+        return data
+
+    def write_object(self, number, body):
+        self.offsets[number] = self.offset
+        return self.emit(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+
+    def write_stream(self, number, data, extra=b''):
+        return self.write_object(number, b'<< /Length %d%s >>\nstream\n%s\n'
+                                 b'endstream' % (len(data), extra, data))
+
+    def glyphs(self, line):
+        """Строка в номерах глифов для Tj, отсутствующие - .notdef"""
+        codes = []
+        for char in line:
+            gid = self.font.cmap.get(ord(char), 0)
+            if gid:
+                self.used.setdefault(gid, char)
+            codes.append(b'%04X' % gid)
+        return b''.join(codes)
+
+    def paginate(self):
+        lines = chain(
+            (f'{TITLE}:', ''), (self.format_row(row) for row in self.rows)
+        )
+        page = list(islice(lines, self.lines_per_page))
+        while page:
+            yield page
+            page = list(islice(lines, self.lines_per_page))
+
+    def page_content(self, lines):
+        text = b' '.join(b'<%s> Tj T*' % self.glyphs(line) for line in lines)
+        return b'BT /F1 %d Tf %d TL %d %d Td %s ET' % (
+            self.font_size, self.leading, self.margin,
+            self.page_height - self.margin, text
+        )
+
+    def font_name(self):
+        """Имя подмножества: шесть букв от набора глифов и имя шрифта"""
+        digest = hashlib.md5(repr(sorted(self.used)).encode()).digest()
+        tag = ''.join(chr(ord('A') + byte % 26) for byte in digest[:6])
+        return f'{tag}+{self.font.name}'.encode()
+
+    def to_unicode(self):
+        items = sorted(self.used.items())
+        blocks = []
+        for start in range(0, len(items), self.cmap_block):
+            block = items[start:start + self.cmap_block]
+            blocks.append(b'%d beginbfchar\n%s\nendbfchar' % (
+                len(block), b'\n'.join(
+                    b'<%04X> <%s>' % (gid, char.encode('utf-16-be').hex()
+                                      .upper().encode())
+                    for gid, char in block
+                )
+            ))
+        return (
+            b'/CIDInit /ProcSet findresource begin\n12 dict begin\n'
+            b'begincmap\n/CIDSystemInfo << /Registry (Adobe) '
+            b'/Ordering (UCS) /Supplement 0 >> def\n'
+            b'/CMapName /Adobe-Identity-UCS def\n/CMapType 2 def\n'
+            b'1 begincodespacerange\n<0000> <FFFF>\nendcodespacerange\n'
+            b'%s\nendcmap\nCMapName currentdict /CMap defineresource pop\n'
+            b'end\nend' % b'\n'.join(blocks)
+        )
+
+    def font_objects(self, number):
+        """Объекты шрифта /F1 (номер 3) и его частей с номера number"""
+        font = self.font
+        name = self.font_name()
+        widths = b' '.join(
+            b'%d [%d]' % (gid, font.width(gid)) for gid in sorted(self.used)
+        )
+        yield self.write_object(3, (
+            b'<< /Type /Font /Subtype /Type0 /BaseFont /%s '
+            b'/Encoding /Identity-H /DescendantFonts [%d 0 R] '
+            b'/ToUnicode %d 0 R >>'
+        ) % (name, number, number + 3))
+        yield self.write_object(number, (
+            b'<< /Type /Font /Subtype /CIDFontType2 /BaseFont /%s '
+            b'/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) '
+            b'/Supplement 0 >> /FontDescriptor %d 0 R '
+            b'/CIDToGIDMap /Identity /DW %d /W [%s] >>'
+        ) % (name, number + 1, font.width(0), widths))
+        yield self.write_object(number + 1, (
+            b'<< /Type /FontDescriptor /FontName /%s /Flags 32 '
+            b'/FontBBox [%s] /ItalicAngle %d /Ascent %d /Descent %d '
+            b'/CapHeight %d /StemV 80 /FontFile2 %d 0 R >>'
+        ) % (
+            name, b' '.join(b'%d' % font.scale(value) for value in font.bbox),
+            round(font.italic_angle), font.scale(font.ascent),
+            font.scale(font.descent), font.scale(font.cap_height),
+            number + 2
+        ))
+        data = font.subset(self.used)
+        yield self.write_stream(
+            number + 2, zlib.compress(data),
+            b' /Length1 %d /Filter /FlateDecode' % len(data)
+        )
+        yield self.write_stream(number + 3, self.to_unicode())
+
+    def render(self):
+        yield self.emit(b'%PDF-1.4\n')
+        yield self.write_object(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+        pages = []
+        number = 4
+        for lines in self.paginate():
+            yield self.write_stream(number, self.page_content(lines))
+            yield self.write_object(number + 1, (
+                b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] '
+                b'/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>'
+            ) % (self.page_width, self.page_height, number))
+            pages.append(number + 1)
+            number += 2
+        kids = b' '.join(b'%d 0 R' % page for page in pages)
+        yield self.write_object(
+            2, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(pages))
+        )
+        yield from self.font_objects(number)
+        number += 4
+        xref = self.offset
+        yield b'xref\n0 %d\n0000000000 65535 f \n' % number
+        yield b''.join(
+            b'%010d 00000 n \n' % self.offsets[num] for num in range(1, number)
+        )
+        yield (
+            b'trailer\n<< /Size %d /Root 1 0 R >>\n'
+            b'startxref\n%d\n%%%%EOF\n' % (number, xref)
+        )
+
+
+EXPORTERS = {
+    exporter.extension: exporter
+    for exporter in (TextExporter, CsvExporter, PdfExporter)
+}
+
+
+def available_exporters():
+    """Форматы, которые можно выгрузить: для PDF нужен файл шрифта"""
+    return {
+        extension: exporter for extension, exporter in EXPORTERS.items()
+        if exporter.available()
+    }
@@ -0,0 +1,153 @@
+"""
+Быстрая сериализация списков рецептов.
+
+FastRecipeSerializer строит те же словари, что RecipeSerializer,
+но без полей DRF и без объектов моделей для связанных строк: теги
+берутся из кэша справочников, состав и авторы страницы - тремя
+запросами values_list(), строки собираются по заранее заданным
+спискам полей. Рецепты страницы нужны только со своими столбцами
+и аннотациями is_favorited и is_in_shopping_cart, без prefetch.
+Время групп полей TIMED_FIELDS (загрузка и сборка строк) попадает
+в разделы инструментирования FastRecipeSerializer.<поле>.
+"""
+from collections import defaultdict
+from operator import attrgetter
+
+from django.contrib.auth import get_user_model
+from foodgram import images, reference
+from foodgram.models import Amount, TagRecipe
+
+from .instrumentation import section, timed
+from .serializers import RecipeSerializer
+from .sparse_fields import check_fields
+
+User = get_user_model()
+
+AUTHOR_FIELDS = ('email', 'id', 'username', 'first_name', 'last_name')
+INGREDIENT_FIELDS = ('id', 'name', 'measurement_unit', 'amount')
+INGREDIENT_COLUMNS = ('recipe_id', 'ingredient_id', 'ingredient__name',
+                      'ingredient__measurement_unit', 'amount')
+TIMED_FIELDS = ('tags', 'ingredients', 'author', 'thumbnails')
+
+
+def annotation(name):
+    """Аннотация рецепта или False, если её нет (аноним)"""
+    return lambda recipe: getattr(recipe, name, False)
+
+
+def image_url(image, request):
+    if not image:
+        return None
+    if request is None:
+        return image.url
+    return request.build_absolute_uri(image.url)
+
+
+def tags_by_recipe(recipe_ids):
+    tags = reference.tags_by_id()[1]
+    result = defaultdict(list)
+    for recipe, tag in TagRecipe.objects.filter(
+            recipe_id__in=recipe_ids
+    ).order_by('tag_id').values_list('recipe_id', 'tag_id'):
+        result[recipe].append(dict(tags[tag]))
+    return result
+
+
+def ingredients_by_recipe(recipe_ids):
+    result = defaultdict(list)
+    for recipe, *row in Amount.objects.filter(
+            recipe_id__in=recipe_ids
+    ).order_by('id').values_list(*INGREDIENT_COLUMNS):
+        result[recipe].append(dict(zip(INGREDIENT_FIELDS, row)))
+    return result
+
+
+def authors_by_id(author_ids):
+    return {
+        row[1]: dict(zip(AUTHOR_FIELDS, row))
+        for row in User.objects.filter(
+            id__in=author_ids).values_list(*AUTHOR_FIELDS)
+    }
+
+
+class FastRecipeSerializer:
+    """
+    Только для чтения списков: data - список словарей в формате
+    RecipeSerializer, extra_fields - атрибуты рецептов, добавляемые
+    в конец (missing_count подбора по ингредиентам). Поля
+    из context['sparse_fields'] выводятся и загружаются только они.
+    """
+
+    def __init__(self, recipes, context, extra_fields=()):
+        self.recipes = list(recipes)
+        self.context = context
+        self.fields = RecipeSerializer.Meta.fields + tuple(extra_fields)
+        sparse = context.get('sparse_fields')
+        if sparse is not None:
+            check_fields(sparse, self.fields)
+            self.fields = tuple(
+                field for field in self.fields if field in sparse
+            )
+
+    @property
+    def data(self):
+        with section('serialize'):
+            return self.build()
+
+    def section_name(self, field):
+        return f'{type(self).__name__}.{field}'
+
+    def accessors(self):
+        """Функции полей от рецепта в порядке вывода"""
+        ids = [recipe.id for recipe in self.recipes]
+        request = self.context.get('request')
+        accessors = {
+            'id': attrgetter('id'),
+            'is_favorited': annotation('is_favorited'),
+            'is_in_shopping_cart': annotation('is_in_shopping_cart'),
+            'name': attrgetter('name'),
+            'text': attrgetter('text'),
+            'cooking_time': attrgetter('cooking_time'),
+        }
+        if 'tags' in self.fields:
+            with section(self.section_name('tags')):
+                tags = tags_by_recipe(ids)
+            accessors['tags'] = lambda recipe: tags.get(recipe.id, [])
+        if 'ingredients' in self.fields:
+            with section(self.section_name('ingredients')):
+                ingredients = ingredients_by_recipe(ids)
+            accessors['ingredients'] = lambda recipe: ingredients.get(
+                recipe.id, []
+            )
+        if 'author' in self.fields:
+            with section(self.section_name('author')):
+                authors = authors_by_id(
+                    {recipe.author_id for recipe in self.recipes}
+                )
+            subscriptions = set()
+            if request is not None and request.user.is_authenticated:
+                subscriptions = self.context.get('subscriptions') or set()
+            accessors['author'] = lambda recipe: {
+                **authors[recipe.author_id],
+                'is_subscribed': recipe.author_id in subscriptions,
+            }
+        accessors['image'] = lambda recipe: image_url(recipe.image, request)
+        accessors['thumbnails'] = lambda recipe: (
+            images.thumbnail_urls(recipe, request)
+            if recipe.image else {}
+        )
+        accessors.update({
+            field: timed(self.section_name(field), accessors[field])
+            for field in TIMED_FIELDS if field in accessors
+        })
+        return [
+            (field, accessors.get(field) or attrgetter(field))
+            for field in self.fields
+        ]
+
+    def build(self):
+        accessors = self.accessors()
+        return [
+            {field: accessor(recipe) for field, accessor in accessors}
+            for recipe in self.recipes
+        ]
@@ -1,22 +1,51 @@
+from django import forms
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import FilterSet, filters
-from foodgram.models import Recipe
-from rest_framework.filters import SearchFilter
+from foodgram import search
+from foodgram.models import Recipe, TagRecipe
+from foodgram.reference import tag_ids_by_slug
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
 
 
-class IngredientSearchFilter(SearchFilter):
-    search_param = 'name'
+class SlugListField(forms.Field):
+    widget = forms.SelectMultiple
+
+    def to_python(self, value):
+        return [slug for slug in value or () if slug]
+
+
+class TagSlugFilter(filters.Filter):
+    """
+    Рецепты хотя бы с одним из тегов. Slug переводятся в id
+    по кэшу тегов, отбор идёт через EXISTS без дублей рецептов.
+    """
+    field_class = SlugListField
+
+    def filter(self, queryset, value):
+        if not value:
+            return queryset
+        tag_ids = tag_ids_by_slug()
+        tags = [tag_ids[slug] for slug in value if slug in tag_ids]
+        if not tags:
+            return queryset.none()
+        return queryset.filter(Exists(TagRecipe.objects.filter(
+            recipe=OuterRef('pk'), tag_id__in=tags
+        )))
 
 
 class RecipeFilterSet(FilterSet):
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    tags = TagSlugFilter()
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart',
+                  'search')
 
     def filter_is_favorited(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
@@ -27,3 +56,30 @@ class RecipeFilterSet(FilterSet):
         if self.request.user.is_authenticated and value:
             return queryset.filter(shopping__user=self.request.user)
         return queryset
+
+    def filter_search(self, queryset, name, value):
+        return search.filter_queryset(queryset, value)
+
+
+class RecipeOrderingFilter(BaseFilterBackend):
+    """
+    Порядок рецептов по ?ordering=: popular - по счётчикам избранного
+    и списков покупок (индекс recipe_popular_idx), newest - по дате.
+    Курсорная пагинация получает тот же порядок.
+    """
+    ordering_param = 'ordering'
+    orderings = {
+        'newest': ('-pub_date', '-id'),
+        'popular': ('-favorites_count', '-cart_count', '-id'),
+    }
+
+    def filter_queryset(self, request, queryset, view):
+        value = request.query_params.get(self.ordering_param)
+        if value is None:
+            return queryset
+        if value not in self.orderings:
+            raise ValidationError({
+                self.ordering_param:
+                    f'Доступные значения: {", ".join(self.orderings)}'
+            })
+        return queryset.order_by(*self.orderings[value])
@@ -0,0 +1,245 @@
+"""
+Инструментирование запросов: время и число SQL-запросов, повторяющиеся
+запросы (признак N+1), время сериализации и отдельных полей.
+
+Включается настройкой INSTRUMENTATION_ENABLED: в MIDDLEWARE добавляется
+InstrumentationMiddleware, а маршрут metrics/ отдаёт накопленные
+метрики в текстовом формате Prometheus (только с адресов
+INSTRUMENTATION_METRICS_IPS). Результаты каждого запроса попадают
+в заголовок Server-Timing и в журнал api.instrumentation одной
+JSON-строкой. Когда инструментирование выключено, section(), timed()
+и TimedMethodField ничего не измеряют.
+"""
+import json
+import logging
+import re
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from threading import Lock
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+_profile = ContextVar('profile', default=None)
+
+SQL_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+SQL_LISTS = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+SERVER_TIMING_NAME = re.compile(r'[^\w.-]')
+
+
+def fingerprint(sql):
+    """Запрос без значений: одинаковые отпечатки - один и тот же запрос"""
+    sql = SQL_LITERALS.sub('?', sql)
+    return SQL_LISTS.sub('(...)', sql)
+
+
+class Profile:
+
+    def __init__(self, request):
+        self.started = time.perf_counter()
+        self.method = request.method
+        self.path = request.path
+        self.view = None
+        self.action = None
+        self.db_ms = 0.0
+        self.queries = Counter()
+        self.sections = defaultdict(lambda: [0.0, 0])
+        self.active = Counter()
+
+    def execute(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_ms += (time.perf_counter() - start) * 1000
+            self.queries[fingerprint(sql)] += 1
+
+    def duplicates(self):
+        threshold = settings.INSTRUMENTATION_DUPLICATE_THRESHOLD
+        return [
+            {'sql': sql, 'count': count}
+            for sql, count in self.queries.most_common()
+            if count >= threshold
+        ]
+
+    def summary(self, status):
+        return {
+            'method': self.method,
+            'path': self.path,
+            'view': self.view,
+            'action': self.action,
+            'status': status,
+            'total_ms': round((time.perf_counter() - self.started) * 1000, 3),
+            'db_ms': round(self.db_ms, 3),
+            'queries': sum(self.queries.values()),
+            'duplicates': self.duplicates(),
+            'sections': {
+                name: {'ms': round(elapsed, 3), 'count': count}
+                for name, (elapsed, count) in self.sections.items()
+            },
+        }
+
+
+@contextmanager
+def section(name):
+    """
+    Добавляет время блока к разделу name текущего запроса.
+    Вложенные блоки с тем же именем не считаются повторно.
+    """
+    profile = _profile.get()
+    if profile is None or profile.active[name]:
+        yield
+        return
+    profile.active[name] += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.active[name] -= 1
+        record = profile.sections[name]
+        record[0] += (time.perf_counter() - start) * 1000
+        record[1] += 1
+
+
+def timed(name, func):
+    """func, время вызовов которой добавляется к разделу name"""
+    if _profile.get() is None:
+        return func
+
+    def wrapper(*args, **kwargs):
+        with section(name):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class TimedMethodField(serializers.SerializerMethodField):
+    """SerializerMethodField, время которого учитывается отдельно"""
+
+    def to_representation(self, value):
+        if _profile.get() is None:
+            return super().to_representation(value)
+        with section(f'{type(self.parent).__name__}.{self.method_name}'):
+            return super().to_representation(value)
+
+
+class TimedSerializerMixin:
+    """Время сериализации объектов в разделе serialize"""
+
+    def to_representation(self, instance):
+        with section('serialize'):
+            return super().to_representation(instance)
+
+
+class Metrics:
+    """Накопленные по представлениям счётчики для экспорта"""
+
+    fields = ('requests', 'errors', 'seconds', 'db_seconds', 'queries',
+              'duplicate_queries')
+
+    def __init__(self):
+        self.lock = Lock()
+        self.values = defaultdict(Counter)
+
+    def add(self, summary):
+        key = (summary['view'] or 'unknown', summary['action'] or '')
+        with self.lock:
+            values = self.values[key]
+            values['requests'] += 1
+            values['errors'] += summary['status'] >= 500
+            values['seconds'] += summary['total_ms'] / 1000
+            values['db_seconds'] += summary['db_ms'] / 1000
+            values['queries'] += summary['queries']
+            values['duplicate_queries'] += sum(
+                item['count'] for item in summary['duplicates']
+            )
+
+    def export(self):
+        lines = []
+        with self.lock:
+            items = sorted(self.values.items())
+            for field in self.fields:
+                name = f'foodgram_{field}_total'
+                lines.append(f'# TYPE {name} counter')
+                lines.extend(
+                    f'{name}{{view="{view}",action="{action}"}} '
+                    f'{round(values[field], 6)}'
+                    for (view, action), values in items
+                )
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+def server_timing(summary):
+    parts = [
+        f'total;dur={summary["total_ms"]}',
+        f'db;dur={summary["db_ms"]};desc="{summary["queries"]} queries"',
+    ]
+    parts.extend(
+        f'{SERVER_TIMING_NAME.sub("_", name)};dur={values["ms"]}'
+        f';desc="{values["count"]}x"'
+        for name, values in summary['sections'].items()
+    )
+    return ', '.join(parts)
+
+
+class InstrumentationMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        profile = Profile(request)
+        token = _profile.set(profile)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(profile.execute)
+                    )
+                response = self.get_response(request)
+        finally:
+            _profile.reset(token)
+        summary = profile.summary(response.status_code)
+        metrics.add(summary)
+        if settings.INSTRUMENTATION_SERVER_TIMING:
+            response['Server-Timing'] = server_timing(summary)
+        logger.info(json.dumps(summary, ensure_ascii=False))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = _profile.get()
+        view_class = getattr(view_func, 'cls', None)
+        profile.view = (
+            view_class.__name__ if view_class else view_func.__name__
+        )
+        actions = getattr(view_func, 'actions', None) or {}
+        profile.action = actions.get(request.method.lower())
+
+    def process_template_response(self, request, response):
+        # Ответ DRF рендерится после этого метода, время считается
+        # до вызова post_render_callback.
+        rendering = section('render')
+        rendering.__enter__()
+
+        def rendered(response):
+            rendering.__exit__(None, None, None)
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+def metrics_view(request):
+    if request.META.get('REMOTE_ADDR') not in (
+            settings.INSTRUMENTATION_METRICS_IPS):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        metrics.export(), content_type='text/plain; version=0.0.4'
+    )
@@ -0,0 +1,98 @@
+import json
+
+from api.benchmarks import (create_favorites, create_ingredients,
+                            create_recipes, create_subscriptions, create_tags,
+                            create_users, measure, rollback)
+from api.renderers import FastJSONRenderer
+from api.views import RecipeViewSet
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+MODES = {
+    'drf': (False, JSONRenderer),
+    'fast': (True, FastJSONRenderer),
+}
+
+
+class Command(BaseCommand):
+    """
+    Сравниваем сериализацию и рендеринг страницы списка рецептов:
+    RecipeSerializer с JSONRenderer и FastRecipeSerializer
+    с FastJSONRenderer. Ответы обоих путей должны совпадать побайтно
+    """
+    help = 'compare DRF and fast serialization of recipe list pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-sizes', type=int, nargs='+',
+                            default=[6, 20, 50, 100])
+        parser.add_argument('--authors', type=int, default=20)
+        parser.add_argument('--ingredients', type=int, default=500)
+        parser.add_argument('--per-recipe', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def request(self, user):
+        request = APIRequestFactory().get('/api/recipes/')
+        if user is None:
+            request.user = AnonymousUser()
+        else:
+            force_authenticate(request, user)
+        return request
+
+    def render_page(self, request, size, renderer_class):
+        """Запрос страницы, сериализация и рендеринг, как в build_list"""
+        view = RecipeViewSet(action_map={'get': 'list'}, args=(),
+                             kwargs={}, format_kwarg=None)
+        view.request = view.initialize_request(request)
+        view.headers = {}
+        recipes = list(
+            view.get_queryset().order_by('-pub_date', '-id')[:size]
+        )
+        return renderer_class().render(view.serialize_list(recipes))
+
+    def run(self, request, size, options):
+        result = {}
+        bodies = {}
+        for mode, (fast, renderer_class) in MODES.items():
+            with override_settings(FAST_RECIPE_SERIALIZATION=fast):
+                with CaptureQueriesContext(connection) as queries:
+                    bodies[mode] = self.render_page(
+                        request, size, renderer_class
+                    )
+                timings = measure(
+                    lambda: self.render_page(request, size, renderer_class),
+                    options['repeat']
+                )
+            result[mode] = {'queries': len(queries), 'ms': timings}
+        if bodies['drf'] != bodies['fast']:
+            raise CommandError(f'Ответы различаются на странице {size}')
+        result['bytes'] = len(bodies['fast'])
+        result['speedup'] = round(
+            result['drf']['ms']['p50'] / result['fast']['ms']['p50'], 2
+        )
+        return result
+
+    def handle(self, *args, **options):
+        results = []
+        with rollback():
+            authors = create_users(options['authors'], prefix='serialize')
+            reader, = create_users(1, prefix='reader')
+            recipes = create_recipes(
+                authors, max(options['page_sizes']),
+                create_ingredients(options['ingredients']),
+                options['per_recipe'], create_tags()
+            )
+            create_favorites([reader], recipes, len(recipes) // 3)
+            create_subscriptions([reader], authors, len(authors) // 2)
+            for user in (None, reader):
+                request = self.request(user)
+                for size in options['page_sizes']:
+                    results.append({
+                        'user': 'anonymous' if user is None else 'reader',
+                        'page_size': size,
+                        **self.run(request, size, options),
+                    })
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,178 @@
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+import requests
+from api.benchmarks import percentile
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from foodgram.models import Recipe, ShoppingList
+from rest_framework.authtoken.models import Token
+
+SERVERS = {
+    'wsgi': ['backend.wsgi:application'],
+    'asgi': ['backend.asgi:application',
+             '--worker-class', 'uvicorn.workers.UvicornWorker'],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    """
+    Сравниваем пропускную способность WSGI (синхронные процессы
+    gunicorn) и ASGI (uvicorn и асинхронные представления) при разном
+    числе одновременных соединений. Серверы запускаются командой
+    на свободных портах или задаются адресами уже запущенных.
+    Нужны данные в базе, например после loadtest --keep
+    """
+    help = 'compare WSGI and ASGI throughput under concurrent connections'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, nargs='+',
+                            default=[1, 8, 32, 64])
+        parser.add_argument('--duration', type=float, default=10,
+                            help='seconds per run')
+        parser.add_argument('--workers', type=int, default=2,
+                            help='gunicorn workers for both servers')
+        parser.add_argument('--threads', type=int,
+                            default=settings.ASYNC_VIEW_THREADS,
+                            help='ASYNC_VIEW_THREADS of the ASGI server')
+        parser.add_argument('--wsgi-url', help='running WSGI server')
+        parser.add_argument('--asgi-url', help='running ASGI server')
+        parser.add_argument('--output', help='write the JSON report here')
+
+    def endpoints(self):
+        """Запросы: имя и функция от сессии, возвращающая ответ"""
+        recipes = list(Recipe.objects.values_list('id', flat=True)[:1000])
+        if not recipes:
+            raise CommandError(
+                'Нет рецептов: заполните базу, например loadtest --keep'
+            )
+        user_id = ShoppingList.objects.values_list(
+            'user_id', flat=True).first() or Recipe.objects.values_list(
+            'author_id', flat=True).first()
+        token, _ = Token.objects.get_or_create(user_id=user_id)
+        headers = {'Authorization': f'Token {token.key}'}
+        return [
+            ('tags', lambda session, url: session.get(f'{url}/api/tags/')),
+            ('ingredients', lambda session, url: session.get(
+                f'{url}/api/ingredients/', params={'name': 'ин'})),
+            ('recipe_detail', lambda session, url: session.get(
+                f'{url}/api/recipes/{random.choice(recipes)}/')),
+            ('download_shopping_cart', lambda session, url: session.get(
+                f'{url}/api/recipes/download_shopping_cart/',
+                headers=headers)),
+        ]
+
+    @contextmanager
+    def server(self, mode, options):
+        url = options[f'{mode}_url']
+        if url:
+            yield url.rstrip('/')
+            return
+        port = free_port()
+        env = dict(os.environ, ASYNC_VIEW_THREADS=str(options['threads']))
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', *SERVERS[mode],
+             '--workers', str(options['workers']),
+             '--bind', f'127.0.0.1:{port}', '--log-level', 'warning'],
+            cwd=settings.BASE_DIR, env=env
+        )
+        url = f'http://127.0.0.1:{port}'
+        try:
+            self.wait(url, process)
+            yield url
+        finally:
+            process.terminate()
+            process.wait()
+
+    def wait(self, url, process, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f'Сервер {url} завершился')
+            try:
+                requests.get(f'{url}/api/tags/', timeout=1)
+                return
+            except requests.ConnectionError:
+                time.sleep(0.2)
+        raise CommandError(f'Сервер {url} не запустился за {timeout} с')
+
+    def client(self, url, request, deadline, results):
+        timings, errors = [], 0
+        with requests.Session() as session:
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    errors += request(session, url).status_code >= 400
+                except requests.RequestException:
+                    errors += 1
+                timings.append((time.perf_counter() - start) * 1000)
+        results.append((timings, errors))
+
+    def run(self, url, request, concurrency, duration):
+        results = []
+        deadline = time.monotonic() + duration
+        clients = [
+            threading.Thread(
+                target=self.client, args=(url, request, deadline, results)
+            )
+            for _ in range(concurrency)
+        ]
+        started = time.monotonic()
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        elapsed = time.monotonic() - started
+        timings = [value for values, _ in results for value in values]
+        return {
+            'requests': len(timings),
+            'errors': sum(errors for _, errors in results),
+            'rps': round(len(timings) / elapsed, 1),
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'p99_ms': round(percentile(timings, 99), 3),
+        }
+
+    def handle(self, *args, **options):
+        report = {
+            'workers': options['workers'],
+            'async_view_threads': options['threads'],
+            'duration': options['duration'],
+            'results': {},
+        }
+        endpoints = self.endpoints()
+        with ExitStack() as stack:
+            urls = {
+                mode: stack.enter_context(self.server(mode, options))
+                for mode in SERVERS
+            }
+            for name, request in endpoints:
+                for mode, url in urls.items():
+                    for concurrency in options['concurrency']:
+                        result = self.run(
+                            url, request, concurrency, options['duration']
+                        )
+                        report['results'].setdefault(name, {}).setdefault(
+                            mode, {})[concurrency] = result
+                        if options['verbosity'] > 1:
+                            self.stderr.write(
+                                f'{name} {mode} x{concurrency}: {result}'
+                            )
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output)
+        self.stdout.write(output)
@@ -0,0 +1,58 @@
+import json
+import tracemalloc
+
+from api.benchmarks import (create_ingredients, create_recipes, create_users,
+                            fill_shopping_cart, measure, rollback)
+from api.exporters import available_exporters
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIClient
+
+
+class Command(BaseCommand):
+    """
+    Замеряет выгрузку списка покупок для больших корзин
+    """
+    help = 'benchmark download_shopping_cart for large shopping carts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, nargs='+',
+                            default=[10, 100, 500])
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--per-recipe', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def download(self, client, extension):
+        response = client.get(
+            '/api/recipes/download_shopping_cart/', {'format': extension}
+        )
+        return sum(len(chunk) for chunk in response.streaming_content)
+
+    def handle(self, *args, **options):
+        results = []
+        with rollback():
+            ingredients = create_ingredients(options['ingredients'])
+            for size in options['recipes']:
+                user, = create_users(1, prefix='cart')
+                recipes = create_recipes(
+                    [user], size, ingredients, options['per_recipe']
+                )
+                fill_shopping_cart(user, recipes)
+                client = APIClient()
+                client.force_authenticate(user)
+                for extension in available_exporters():
+                    tracemalloc.start()
+                    body = self.download(client, extension)
+                    _, peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+                    timings = measure(
+                        lambda: self.download(client, extension),
+                        options['repeat']
+                    )
+                    results.append({
+                        'recipes': size,
+                        'format': extension,
+                        'bytes': body,
+                        'peak_memory_kb': peak // 1024,
+                        'ms': timings,
+                    })
+        self.stdout.write(json.dumps(results, indent=2))
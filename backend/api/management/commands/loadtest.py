@@ -0,0 +1,227 @@
+import json
+import platform
+import random
+import time
+
+from api.benchmarks import (create_carts, create_favorites, create_ingredients,
+                            create_recipes, create_subscriptions, create_tags,
+                            create_tokens, create_users, percentile, rollback)
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from foodgram import counters, search
+from rest_framework.test import APIClient
+
+
+class Command(BaseCommand):
+    """
+    Нагрузочный прогон API: создаём синтетические данные bulk-вставками,
+    проходим реальные маршруты через тестовый клиент и пишем в JSON
+    пропускную способность, перцентили задержки и число запросов к базе
+    """
+    help = 'seed a synthetic dataset and load-test the API routes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--recipes', type=int, default=2000)
+        parser.add_argument('--ingredients', type=int, default=1000)
+        parser.add_argument('--per-recipe', type=int, default=8)
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='favourite recipes per user')
+        parser.add_argument('--cart', type=int, default=5,
+                            help='shopping cart recipes per user')
+        parser.add_argument('--subscriptions', type=int, default=10,
+                            help='followed authors per user')
+        parser.add_argument('--requests', type=int, default=50,
+                            help='measured requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--endpoints', nargs='+',
+                            help='only these endpoint names')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='write the JSON report here')
+        parser.add_argument('--compare',
+                            help='previous JSON report to compare with')
+        parser.add_argument('--keep', action='store_true',
+                            help='keep the generated data')
+
+    def seed(self, options):
+        random.seed(options['seed'])
+        started = time.perf_counter()
+        users = create_users(options['users'], prefix='load')
+        ingredients = create_ingredients(options['ingredients'])
+        tags = create_tags()
+        recipes = create_recipes(
+            users, options['recipes'], ingredients, options['per_recipe'],
+            tags
+        )
+        create_favorites(users, recipes, options['favorites'])
+        create_carts(users, recipes, options['cart'])
+        create_subscriptions(users, users, options['subscriptions'])
+        counters.reconcile()
+        search.update_documents(recipes)
+        self.data = {
+            'users': users,
+            'tokens': create_tokens(users),
+            'recipes': recipes,
+            'ingredients': ingredients,
+        }
+        return round(time.perf_counter() - started, 3)
+
+    def client(self):
+        user = random.choice(self.data['users'])
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.data["tokens"][user.id]}'
+        )
+        return client
+
+    def anonymous(self):
+        return APIClient()
+
+    def toggle_favorite(self, client):
+        url = reverse('api:favorite',
+                      args=[random.choice(self.data['recipes'])])
+        response = client.post(url)
+        if response.status_code == 400:
+            return client.delete(url)
+        return response
+
+    def endpoints(self):
+        """Имя, клиент и запрос: функция от клиента, возвращающая ответ"""
+        recipes = self.data['recipes']
+        ingredients = self.data['ingredients']
+        list_url = reverse('api:recipes-list')
+        return [
+            ('recipes_list_anonymous', self.anonymous,
+             lambda client: client.get(list_url)),
+            ('recipes_list', self.client,
+             lambda client: client.get(
+                 list_url, {'page': random.randint(1, 20)})),
+            ('recipes_list_tags', self.client,
+             lambda client: client.get(
+                 list_url, {'tags': ['breakfast', 'lunch']})),
+            ('recipes_list_favorited', self.client,
+             lambda client: client.get(list_url, {'is_favorited': 1})),
+            ('recipes_popular', self.client,
+             lambda client: client.get(list_url, {'ordering': 'popular'})),
+            ('recipes_search', self.client,
+             lambda client: client.get(list_url, {
+                 'search': f'ингредиент {random.randint(0, 99)}'})),
+            ('recipe_detail', self.client,
+             lambda client: client.get(reverse(
+                 'api:recipes-detail', args=[random.choice(recipes)]))),
+            ('recipes_feed', self.client,
+             lambda client: client.get(reverse('api:recipes-feed'))),
+            ('recipes_cookable', self.client,
+             lambda client: client.get(reverse('api:recipes-cookable'), {
+                 'ingredients': ','.join(
+                     map(str, random.sample(ingredients, 15)))})),
+            ('recipes_similar', self.client,
+             lambda client: client.get(reverse(
+                 'api:recipes-similar', args=[random.choice(recipes)]))),
+            ('download_shopping_cart', self.client,
+             lambda client: client.get(
+                 reverse('api:recipes-download-shopping-cart'))),
+            ('favorite_toggle', self.client, self.toggle_favorite),
+            ('tags', self.anonymous,
+             lambda client: client.get(reverse('api:tags-list'))),
+            ('ingredients_search', self.anonymous,
+             lambda client: client.get(reverse('api:ingredients-list'), {
+                 'name': random.choice(['ин', 'ингр', 'ингредиент 1'])})),
+            ('users_list', self.client,
+             lambda client: client.get(reverse('users:users-list'))),
+            ('users_me', self.client,
+             lambda client: client.get(reverse('users:users-me'))),
+            ('subscriptions', self.client,
+             lambda client: client.get(
+                 reverse('users:users-subscriptions'),
+                 {'recipes_limit': 3})),
+        ]
+
+    def call(self, request, client):
+        response = request(client)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def run(self, make_client, request, options):
+        for _ in range(options['warmup']):
+            self.call(request, make_client())
+        timings, queries, errors = [], [], 0
+        started = time.perf_counter()
+        for _ in range(options['requests']):
+            client = make_client()
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                response = self.call(request, client)
+                timings.append((time.perf_counter() - start) * 1000)
+            queries.append(len(context.captured_queries))
+            errors += response.status_code >= 400
+        elapsed = time.perf_counter() - started
+        return {
+            'requests': len(timings),
+            'errors': errors,
+            'rps': round(len(timings) / elapsed, 1),
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'p99_ms': round(percentile(timings, 99), 3),
+            'queries_avg': round(sum(queries) / len(queries), 2),
+            'queries_max': max(queries),
+        }
+
+    def compare(self, results, path):
+        with open(path, encoding='utf-8') as file:
+            baseline = json.load(file)['endpoints']
+        return {
+            name: {
+                key: round(result[key] / baseline[name][key], 3)
+                for key in ('p50_ms', 'p95_ms', 'queries_avg')
+                if baseline[name].get(key)
+            }
+            for name, result in results.items() if name in baseline
+        }
+
+    def measure(self, options):
+        seed_seconds = self.seed(options)
+        for cache in caches.all():
+            cache.clear()
+        results = {}
+        for name, make_client, request in self.endpoints():
+            if options['endpoints'] and name not in options['endpoints']:
+                continue
+            results[name] = self.run(make_client, request, options)
+            if options['verbosity'] > 1:
+                self.stderr.write(f'{name}: {results[name]}')
+        return seed_seconds, results
+
+    def handle(self, *args, **options):
+        if options['keep']:
+            seed_seconds, results = self.measure(options)
+        else:
+            with rollback():
+                seed_seconds, results = self.measure(options)
+        report = {
+            'started_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'dataset': {
+                key: options[key] for key in (
+                    'users', 'recipes', 'ingredients', 'per_recipe',
+                    'favorites', 'cart', 'subscriptions', 'seed'
+                )
+            },
+            'seed_seconds': seed_seconds,
+            'endpoints': results,
+        }
+        if options['compare']:
+            report['ratio_to_baseline'] = self.compare(
+                results, options['compare']
+            )
+        output = json.dumps(report, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output)
+        self.stdout.write(output)
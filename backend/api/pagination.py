@@ -1,7 +1,247 @@
-from rest_framework.pagination import PageNumberPagination
+import binascii
+import hashlib
+import json
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (CursorPagination, PageNumberPagination,
+                                       _reverse_ordering)
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class LimitPagePagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'page_size'
     max_page_size = 6
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Курсорная пагинация без OFFSET и обязательного COUNT(*).
+    Порядок - действующий порядок queryset (фильтры ordering и search),
+    без него - атрибут cursor_ordering представления; он дополняется -id.
+    Позиция курсора - значения всех полей порядка в JSON, при разборе
+    приводятся к типам полей (даты, числа), поэтому повторы первого
+    поля (popular, pub_date, ранг поиска) не сдвигают страницы.
+    Ответ сохраняет поля count/next/previous/results: count
+    кэшируется на PAGINATION_COUNT_CACHE_TIMEOUT секунд,
+    а с ?count=false не считается вовсе.
+    """
+    page_size = 6
+    page_size_query_param = 'page_size'
+    max_page_size = 6
+    ordering = ('-pub_date', '-id')
+    count_query_param = 'count'
+    tiebreaker = '-id'
+
+    def get_ordering(self, request, queryset, view):
+        ordering = tuple(queryset.query.order_by)
+        if not ordering or not all(
+                isinstance(order, str) for order in ordering):
+            ordering = tuple(getattr(view, 'cursor_ordering', self.ordering))
+        if ordering[-1].lstrip('-') not in ('id', 'pk'):
+            ordering += (self.tiebreaker, )
+        return ordering
+
+    def get_count(self, queryset, request):
+        if request.query_params.get(self.count_query_param) == 'false':
+            return None
+        try:
+            sql = str(queryset.query)
+        except EmptyResultSet:
+            # Фильтр заведомо пуст (несуществующий тег, пустой поиск).
+            return 0
+        key = 'pagination_count:' + hashlib.md5(sql.encode()).hexdigest()
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(key, count, settings.PAGINATION_COUNT_CACHE_TIMEOUT)
+        return count
+
+    def get_fields(self, queryset):
+        """Поля порядка: аннотации queryset или поля модели"""
+        fields = []
+        for order in self.ordering:
+            name = order.lstrip('-')
+            if name in queryset.query.annotations:
+                fields.append(queryset.query.annotations[name].output_field)
+            elif name == 'pk':
+                fields.append(queryset.model._meta.pk)
+            else:
+                fields.append(queryset.model._meta.get_field(name))
+        return fields
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for order in ordering:
+            field = order.lstrip('-')
+            if isinstance(instance, dict):
+                value = instance[field]
+            else:
+                value = getattr(instance, field)
+            if hasattr(value, 'isoformat'):
+                value = value.isoformat()
+            elif isinstance(value, Decimal):
+                value = str(value)
+            values.append(value)
+        return json.dumps(values)
+
+    def decode_position(self, position):
+        try:
+            values = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            values = [
+                field.to_python(value)
+                for field, value in zip(self.fields, values)
+            ]
+        except (TypeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        if None in values:
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def position_filter(self, position, reverse):
+        """Строки после позиции: сравнение кортежей полей порядка"""
+        condition, equal = Q(), Q()
+        for order, value in zip(self.ordering, position):
+            field = order.lstrip('-')
+            lookup = 'lt' if reverse != order.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        CursorPagination.paginate_queryset с фильтром по всем полям
+        порядка вместо первого: позиции уникальны, смещение не нужно.
+        """
+        self.count = self.get_count(queryset, request)
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.fields = self.get_fields(queryset)
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            offset, reverse, position = 0, False, None
+        else:
+            offset, reverse, position = self.cursor
+        if reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            queryset = queryset.filter(self.position_filter(
+                self.decode_position(position), reverse
+            ))
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = results[:self.page_size]
+        following = None
+        if len(results) > len(self.page):
+            following = self._get_position_from_instance(
+                results[-1], self.ordering
+            )
+        if reverse:
+            self.page.reverse()
+            self.has_next = position is not None or offset > 0
+            self.has_previous = following is not None
+            self.next_position = position
+            self.previous_position = following
+        else:
+            self.has_next = following is not None
+            self.has_previous = position is not None or offset > 0
+            self.next_position = following
+            self.previous_position = position
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+
+class OptionalKeysetPaginationMixin:
+    """
+    Включает KeysetPagination по ?pagination=cursor или ?cursor=,
+    иначе используется pagination_class представления.
+    """
+    keyset_pagination_class = KeysetPagination
+
+    def use_keyset_pagination(self):
+        params = self.request.query_params
+        return params.get('pagination') == 'cursor' or 'cursor' in params
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.use_keyset_pagination():
+                self._paginator = self.keyset_pagination_class()
+            else:
+                self._paginator = super().paginator
+        return self._paginator
+
+
+class FeedPagination:
+    """
+    Курсор ленты подписок: позиция (pub_date, id) последнего рецепта
+    страницы в base64. Ответ содержит только next и results.
+    """
+    page_size = 6
+    page_size_query_param = 'page_size'
+    max_page_size = 6
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            pub_date, pk = b64decode(
+                encoded.encode()).decode().rsplit('|', 1)
+            pub_date = parse_datetime(pub_date)
+            pk = int(pk)
+        except (TypeError, ValueError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if pub_date is None:
+            raise NotFound(self.invalid_cursor_message)
+        return pub_date, pk
+
+    def encode_cursor(self, position):
+        pub_date, pk = position
+        return b64encode(f'{pub_date.isoformat()}|{pk}'.encode()).decode()
+
+    def get_paginated_response(self, request, positions, data, size):
+        next_link = None
+        if len(positions) == size:
+            next_link = replace_query_param(
+                request.build_absolute_uri(), self.cursor_query_param,
+                self.encode_cursor(positions[-1])
+            )
+        return Response(OrderedDict([
+            ('next', next_link),
+            ('results', data)
+        ]))
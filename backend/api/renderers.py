@@ -0,0 +1,42 @@
+"""
+JSON-рендерер на orjson.
+
+Вывод совпадает с JSONRenderer DRF при настройках по умолчанию
+(UNICODE_JSON, COMPACT_JSON): компактный UTF-8 без экранирования
+не-ASCII символов. Типы, которые orjson не знает или пишет иначе
+(datetime, Decimal, ленивые строки), передаются энкодеру DRF.
+Без orjson, с отступами (?indent= и браузерный API) и на значениях,
+которые orjson не принимает, работает обычный JSONRenderer.
+"""
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ORJSON_OPTIONS = (
+    orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+    if orjson else 0
+)
+
+
+class FastJSONRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or not self.compact
+                or self.ensure_ascii
+                or self.get_indent(accepted_media_type,
+                                   renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(
+                data, default=self.encoder_class().default,
+                option=ORJSON_OPTIONS
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Как и DRF, экранируем U+2028 и U+2029 для совместимости с JS.
+        return ret.replace(
+            '\u2028'.encode(), b'\\u2028'
+        ).replace('\u2029'.encode(), b'\\u2029')
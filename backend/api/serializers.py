@@ -1,14 +1,19 @@
+from django.conf import settings
 from django.db import transaction
 from django.shortcuts import get_object_or_404
 from drf_extra_fields.fields import Base64ImageField
+from foodgram import cart, counters, images, reference
 from foodgram.models import (Amount, FavouriteRecipe, Ingredient, Recipe,
-                             ShoppingList, Tag, TagRecipe)
+                             ShoppingCartIngredient, ShoppingList, Tag,
+                             TagRecipe)
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
-from rest_framework.validators import UniqueTogetherValidator
-from users.models import Subscription, User
+from users.models import AuthorStats, Subscription, User
 from users.serializers import CustomUserSerializer
 
+from .instrumentation import TimedMethodField, TimedSerializerMixin
+from .sparse_fields import SparseFieldsMixin
+
 
 class TagSerializer(serializers.ModelSerializer):
     color = serializers.ChoiceField(choices=Tag.COLOR_CHOICES)
@@ -37,6 +42,18 @@ class AmountSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
+class ShoppingCartIngredientSerializer(serializers.ModelSerializer):
+    id = serializers.ReadOnlyField(source='ingredient.id')
+    name = serializers.ReadOnlyField(source='ingredient.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredient.measurement_unit'
+    )
+
+    class Meta:
+        model = ShoppingCartIngredient
+        fields = ('id', 'name', 'measurement_unit', 'amount')
+
+
 class AmountPostSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField()
     amount = serializers.IntegerField()
@@ -46,6 +63,19 @@ class AmountPostSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
+class ThumbnailsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии изображения по размерам"""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        if not recipe.image:
+            return {}
+        return images.thumbnail_urls(recipe, self.context.get('request'))
+
+
 # class Base64ImageField(serializers.ImageField):
 #     def to_internal_value(self, data):
 #         if isinstance(data, str) and data.startswith('data:image'):
@@ -56,36 +86,101 @@ class AmountPostSerializer(serializers.ModelSerializer):
 #         return super().to_internal_value(data)
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(SparseFieldsMixin, TimedSerializerMixin,
+                       serializers.ModelSerializer):
     tags = TagSerializer(many=True)
     author = CustomUserSerializer(read_only=True)
-    ingredients = serializers.SerializerMethodField(read_only=True)
+    ingredients = TimedMethodField(read_only=True)
     image = Base64ImageField()
-    is_favorited = serializers.SerializerMethodField()
-    is_in_shopping_cart = serializers.SerializerMethodField()
+    thumbnails = ThumbnailsField()
+    is_favorited = TimedMethodField()
+    is_in_shopping_cart = TimedMethodField()
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author',
                   'ingredients', 'is_favorited', 'is_in_shopping_cart',
-                  'name', 'image', 'text', 'cooking_time')
+                  'name', 'image', 'thumbnails', 'text', 'cooking_time')
 
     def get_ingredients(self, obj):
-        queryset = Amount.objects.filter(recipe=obj)
-        return AmountSerializer(queryset, many=True).data
+        return AmountSerializer(obj.amount.all(), many=True).data
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         author = self.context.get('request').user
+        if author.is_anonymous:
+            return False
         return FavouriteRecipe.objects.filter(
             user=author, recipe=obj.id).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         author = self.context.get('request').user
+        if author.is_anonymous:
+            return False
         return ShoppingList.objects.filter(user=author, recipe=obj.id).exists()
 
 
+class CookableRecipeSerializer(RecipeSerializer):
+    missing_count = serializers.IntegerField(read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ('missing_count', )
+
+
+class SimilarRecipeSerializer(RecipeSerializer):
+    similarity = serializers.FloatField(read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ('similarity', )
+
+
+class SimilarQuerySerializer(serializers.Serializer):
+    limit = serializers.IntegerField(
+        min_value=1, max_value=settings.SIMILAR_RECIPES_MAX_LIMIT,
+        default=settings.SIMILAR_RECIPES_LIMIT
+    )
+
+
+class CookableQuerySerializer(serializers.Serializer):
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False
+    )
+    max_missing = serializers.IntegerField(
+        min_value=0, max_value=5, default=2
+    )
+
+    def to_internal_value(self, data):
+        # ?ingredients=1,2&ingredients=3
+        if hasattr(data, 'getlist'):
+            data = {
+                'ingredients': [
+                    value for item in data.getlist('ingredients')
+                    for value in item.split(',') if value
+                ],
+                **({'max_missing': data['max_missing']}
+                   if 'max_missing' in data else {})
+            }
+        return super().to_internal_value(data)
+
+
+class CachedTagField(serializers.PrimaryKeyRelatedField):
+    """Тег по id из кэша справочных данных без запроса к базе"""
+
+    def to_internal_value(self, data):
+        try:
+            tag = reference.tags().get(int(data))
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if tag is None:
+            self.fail('does_not_exist', pk_value=data)
+        return tag
+
+
 class RecipePostSerializer(serializers.ModelSerializer):
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = CachedTagField(
         many=True,
         queryset=Tag.objects.all()
     )
@@ -97,12 +192,40 @@ class RecipePostSerializer(serializers.ModelSerializer):
         fields = ('tags', 'ingredients', 'name',
                   'image', 'text', 'cooking_time')
 
+    def validate_tags(self, value):
+        """Повтор тега нарушил бы уникальность связи рецепт-тег"""
+        if len(value) != len({tag.id for tag in value}):
+            raise serializers.ValidationError(
+                'Теги в рецепте не должны повторяться'
+            )
+        return value
+
+    def validate_ingredients(self, value):
+        """
+        Все ингредиенты загружаются одним запросом, повторы
+        и несуществующие id отклоняются до сохранения рецепта.
+        """
+        ids = [item['id'] for item in value]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError(
+                'Ингредиенты в рецепте не должны повторяться'
+            )
+        ingredients = Ingredient.objects.in_bulk(ids)
+        missing = [pk for pk in ids if pk not in ingredients]
+        if missing:
+            raise serializers.ValidationError(
+                f'Ингредиенты не найдены: {missing}'
+            )
+        for item in value:
+            item['ingredient'] = ingredients[item['id']]
+        return value
+
     def create_ingredients(self, recipe, ingredients):
         Amount.objects.bulk_create(
             Amount(
                 recipe=recipe,
-                ingredient=Ingredient.objects.get(id=ingredient['id']),
-                amount=ingredient.get('amount')
+                ingredient=ingredient['ingredient'],
+                amount=ingredient['amount']
             ) for ingredient in ingredients
         )
 
@@ -114,6 +237,44 @@ class RecipePostSerializer(serializers.ModelSerializer):
             ) for tag in tags
         )
 
+    def update_ingredients(self, recipe, ingredients):
+        """
+        Сравнивает текущие и новые количества: удаляются, обновляются
+        и создаются только изменившиеся строки Amount.
+        """
+        incoming = {item['id']: item for item in ingredients}
+        old_amounts = []
+        to_update, to_delete = [], []
+        for amount in Amount.objects.filter(recipe=recipe):
+            old_amounts.append((amount.ingredient_id, amount.amount))
+            item = incoming.pop(amount.ingredient_id, None)
+            if item is None:
+                to_delete.append(amount.id)
+            elif amount.amount != item['amount']:
+                amount.amount = item['amount']
+                to_update.append(amount)
+        if to_delete:
+            with cart.maintained():
+                Amount.objects.filter(id__in=to_delete).delete()
+        Amount.objects.bulk_update(to_update, ('amount', ))
+        self.create_ingredients(recipe, incoming.values())
+        if to_delete or to_update or incoming:
+            cart.change_recipe(recipe, old_amounts, (
+                (item['id'], item['amount']) for item in ingredients
+            ))
+
+    def update_tags(self, recipe, tags):
+        current = set(TagRecipe.objects.filter(
+            recipe=recipe).values_list('tag_id', flat=True))
+        incoming = {tag.id: tag for tag in tags}
+        removed = current - incoming.keys()
+        if removed:
+            TagRecipe.objects.filter(
+                recipe=recipe, tag_id__in=removed).delete()
+        self.create_tags(recipe, (
+            tag for pk, tag in incoming.items() if pk not in current
+        ))
+
     @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
@@ -121,32 +282,38 @@ class RecipePostSerializer(serializers.ModelSerializer):
         recipe = Recipe.objects.create(**validated_data)
         self.create_tags(recipe, tags)
         self.create_ingredients(recipe, ingredients)
+        counters.change_author(recipe.author_id, 1)
+        images.schedule(recipe.image.name)
         return recipe
 
     @transaction.atomic
     def update(self, instance, validated_data):
+        old_image = instance.image.name
         instance.name = validated_data.get('name', instance.name)
         instance.image = validated_data.get('image', instance.image)
         instance.text = validated_data.get('text', instance.text)
         instance.cooking_time = validated_data.get(
             'cooking_time', instance.cooking_time
         )
-        TagRecipe.objects.filter(recipe=instance).delete()
-        Amount.objects.filter(recipe=instance).delete()
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('amount')
-        self.create_tags(instance, tags)
-        self.create_ingredients(instance, ingredients)
+        if 'tags' in validated_data:
+            self.update_tags(instance, validated_data.pop('tags'))
+        if 'amount' in validated_data:
+            self.update_ingredients(instance, validated_data.pop('amount'))
         instance.save()
+        if 'image' in validated_data:
+            images.schedule(instance.image.name)
+            if old_image != instance.image.name:
+                images.discard(old_image)
         return instance
 
 
 class ShowFavouriteShoppingSerializer(serializers.ModelSerializer):
     image = Base64ImageField()
+    thumbnails = ThumbnailsField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'thumbnails', 'cooking_time')
 
 
 class ShoppingListSerializer(serializers.ModelSerializer):
@@ -154,12 +321,9 @@ class ShoppingListSerializer(serializers.ModelSerializer):
     class Meta:
         model = ShoppingList
         fields = ('user', 'recipe')
-        validators = [
-            UniqueTogetherValidator(
-                queryset=ShoppingList.objects.all(),
-                fields=('user', 'recipe')
-            )
-        ]
+        # Повтор проверяется в validate с понятным сообщением,
+        # UniqueTogetherValidator сделал бы тот же запрос ещё раз.
+        validators = []
 
     def validate(self, data):
         request = self.context.get('request')
@@ -185,12 +349,7 @@ class FavouriteRecipeSerializer(serializers.ModelSerializer):
     class Meta:
         model = FavouriteRecipe
         fields = ('user', 'recipe')
-        validators = [
-            UniqueTogetherValidator(
-                queryset=FavouriteRecipe.objects.all(),
-                fields=('user', 'recipe')
-            )
-        ]
+        validators = []
 
     def validate(self, data):
         request = self.context.get('request')
@@ -211,12 +370,38 @@ class FavouriteRecipeSerializer(serializers.ModelSerializer):
         }).data
 
 
-class ShowSubscriptionSerializer(serializers.ModelSerializer):
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список id рецептов для пакетных изменений избранного и покупок"""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.RECIPE_LIST_BATCH_SIZE
+    )
+
+
+class RecipeListResultSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    status = serializers.CharField()
+
+
+class RecipesLimitSerializer(serializers.Serializer):
+    recipes_limit = serializers.IntegerField(min_value=0, required=False)
+
+
+def get_recipes_limit(request):
+    """Проверенный параметр ?recipes_limit= или None"""
+    serializer = RecipesLimitSerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data.get('recipes_limit')
+
+
+class ShowSubscriptionSerializer(SparseFieldsMixin, TimedSerializerMixin,
+                                 serializers.ModelSerializer):
     """Сериализатор для отображения подписок текущего пользователя"""
 
-    is_subscribed = serializers.SerializerMethodField()
-    recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    is_subscribed = TimedMethodField()
+    recipes = TimedMethodField()
+    recipes_count = TimedMethodField()
 
     class Meta:
         model = User
@@ -235,22 +420,33 @@ class ShowSubscriptionSerializer(serializers.ModelSerializer):
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
+        subscriptions = self.context.get('subscriptions')
+        if subscriptions is not None:
+            return obj.id in subscriptions
         return Subscription.objects.filter(user=user, author=obj).exists()
 
     def get_recipes(self, obj):
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
-        recipes = Recipe.objects.filter(author=obj)
-        limit = request.query_params.get('recipes_limit')
-        if limit:
-            recipes = recipes[:int(limit)]
+        previews = self.context.get('recipes')
+        if previews is not None:
+            recipes = previews.get(obj.id, [])
+        else:
+            recipes = Recipe.objects.filter(author=obj)
+            limit = get_recipes_limit(request)
+            if limit is not None:
+                recipes = recipes[:limit]
         return ShowFavouriteShoppingSerializer(
             recipes, many=True, context={'request': request}
         ).data
 
     def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj).count()
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
+        return AuthorStats.objects.filter(user=obj).values_list(
+            'recipes_count', flat=True
+        ).first() or 0
 
 
 class SubscriptionSerializer(serializers.ModelSerializer):
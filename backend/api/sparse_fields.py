@@ -0,0 +1,44 @@
+"""
+Выборочные поля ответа: ?fields=id,name,image.
+
+Представление кладёт запрошенные поля в context['sparse_fields'],
+сериализатор с SparseFieldsMixin удаляет остальные поля верхнего
+уровня. id выводится всегда: по нему кэш ответов восстанавливает
+флаги пользователя. Параметр действует только на чтение.
+"""
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDS_PARAM = 'fields'
+
+
+def requested_fields(request):
+    """Множество полей из ?fields= или None, если параметр не задан"""
+    if request is None or request.method not in SAFE_METHODS:
+        return None
+    value = request.query_params.get(FIELDS_PARAM)
+    if not value:
+        return None
+    return {
+        name.strip() for name in value.split(',') if name.strip()
+    } | {'id'}
+
+
+def check_fields(fields, available):
+    unknown = set(fields) - set(available)
+    if unknown:
+        raise ValidationError({
+            FIELDS_PARAM: f'Неизвестные поля: {", ".join(sorted(unknown))}'
+        })
+
+
+class SparseFieldsMixin:
+    """Сериализатор выводит только поля из context['sparse_fields']"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = self.context.get('sparse_fields')
+        if fields is not None:
+            check_fields(fields, self.fields)
+            for name in set(self.fields) - fields:
+                self.fields.pop(name)
@@ -0,0 +1,1289 @@
+import csv
+import gzip
+import io
+import json
+import re
+import shutil
+import struct
+import tempfile
+import zlib
+from base64 import b64encode
+from datetime import timedelta
+from unittest import skipUnless
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.core.checks import run_checks
+from django.db import connection
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from foodgram import autocomplete, counters, search
+from foodgram.models import (Amount, FavouriteRecipe, Ingredient, Recipe,
+                             ShoppingCartIngredient, ShoppingList, Tag,
+                             TagRecipe)
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import (APIRequestFactory, APITestCase,
+                                 force_authenticate)
+from users.models import AuthorStats, Subscription, User
+
+from . import compression, truetype
+from .exporters import TITLE, BaseExporter, PdfExporter
+from .renderers import FastJSONRenderer
+from .views import RecipeViewSet
+
+PNG = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA'
+    'DUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=='
+)
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class QueryCountTests(APITestCase):
+    """
+    Число запросов не зависит от числа рецептов на странице,
+    их тегов и ингредиентов: каждый случай проверяется на двух
+    объёмах данных с одним и тем же ожидаемым числом
+    """
+    recipes_per_author = 4
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@foodgram.ru', password='pass12345!'
+        )
+        cls.authors = [
+            User.objects.create_user(
+                username=f'author{i}', email=f'author{i}@foodgram.ru',
+                password='pass12345!'
+            ) for i in range(3)
+        ]
+        cls.tags = [
+            Tag.objects.create(name=slug, slug=slug, color='#FFA500')
+            for slug in ('breakfast', 'lunch', 'dinner')
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {i}', measurement_unit='г'
+            ) for i in range(10)
+        ]
+        Subscription.objects.bulk_create(
+            Subscription(user=cls.user, author=author)
+            for author in cls.authors
+        )
+
+    def setUp(self):
+        for alias in ('default', 'reference'):
+            caches[alias].clear()
+        self.client.force_authenticate(self.user)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def create_recipes(self, count, parts):
+        """count рецептов у каждого автора, parts тегов и ингредиентов"""
+        recipes = [
+            Recipe.objects.create(
+                author=author, name=f'рецепт {i}', image='recipes/1.png',
+                text='текст', cooking_time=10
+            ) for author in self.authors for i in range(count)
+        ]
+        TagRecipe.objects.bulk_create(
+            TagRecipe(recipe=recipe, tag=tag)
+            for recipe in recipes for tag in self.tags[:parts]
+        )
+        Amount.objects.bulk_create(
+            Amount(recipe=recipe, ingredient=ingredient, amount=5)
+            for recipe in recipes for ingredient in self.ingredients[:parts]
+        )
+        FavouriteRecipe.objects.bulk_create(
+            FavouriteRecipe(user=self.user, recipe=recipe)
+            for recipe in recipes[::2]
+        )
+        ShoppingList.objects.bulk_create(
+            ShoppingList(user=self.user, recipe=recipe)
+            for recipe in recipes[1::2]
+        )
+        return recipes
+
+    def assert_queries_fixed(self, expected, request):
+        for count, parts in ((1, 1), (self.recipes_per_author, 3)):
+            with self.subTest(recipes=count, parts=parts):
+                recipes = self.create_recipes(count, parts)
+                for alias in ('default', 'reference'):
+                    caches[alias].clear()
+                with self.assertNumQueries(expected):
+                    response = request(recipes)
+                self.assertEqual(response.status_code, 200)
+
+    def test_recipe_list(self):
+        self.assert_queries_fixed(
+            7, lambda recipes: self.client.get('/api/recipes/')
+        )
+
+    def test_recipe_list_cursor(self):
+        self.assert_queries_fixed(7, lambda recipes: self.client.get(
+            '/api/recipes/', {'pagination': 'cursor'}
+        ))
+
+    def test_recipe_list_anonymous(self):
+        self.client.force_authenticate(None)
+        self.assert_queries_fixed(
+            6, lambda recipes: self.client.get('/api/recipes/')
+        )
+
+    def test_recipe_detail(self):
+        self.assert_queries_fixed(4, lambda recipes: self.client.get(
+            f'/api/recipes/{recipes[-1].id}/'
+        ))
+
+    def test_subscriptions(self):
+        self.assert_queries_fixed(
+            3, lambda recipes: self.client.get('/api/users/subscriptions/')
+        )
+
+    def recipe_data(self, tags, ingredients, amount=5):
+        return {
+            'tags': [tag.id for tag in tags],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': amount}
+                for ingredient in ingredients
+            ],
+            'name': 'рецепт', 'image': PNG, 'text': 'текст',
+            'cooking_time': 10,
+        }
+
+    def test_recipe_create(self):
+        # Первый рецепт автора создаёт его счётчик и загружает кэш тегов.
+        self.client.post('/api/recipes/', self.recipe_data(
+            self.tags[:1], self.ingredients[:1]
+        ), format='json')
+        for tags, ingredients in ((1, 1), (3, 8)):
+            with self.subTest(tags=tags, ingredients=ingredients):
+                with self.assertNumQueries(9):
+                    response = self.client.post(
+                        '/api/recipes/', self.recipe_data(
+                            self.tags[:tags], self.ingredients[:ingredients]
+                        ), format='json'
+                    )
+                self.assertEqual(response.status_code, 201, response.data)
+
+    def test_recipe_update(self):
+        """Тег и ингредиент удаляются и добавляются, остальные обновляются"""
+        self.client.post('/api/recipes/', self.recipe_data(
+            self.tags[:1], self.ingredients[:1]
+        ), format='json')
+        for ingredients in (2, 8):
+            with self.subTest(ingredients=ingredients):
+                self.client.post('/api/recipes/', self.recipe_data(
+                    self.tags[:2], self.ingredients[:ingredients]
+                ), format='json')
+                recipe = Recipe.objects.latest('id')
+                with self.assertNumQueries(18):
+                    response = self.client.patch(
+                        f'/api/recipes/{recipe.id}/', self.recipe_data(
+                            self.tags[1:3],
+                            self.ingredients[1:ingredients + 1], amount=7
+                        ), format='json'
+                    )
+                self.assertEqual(response.status_code, 200)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class FastSerializationTests(APITestCase):
+    """
+    FastRecipeSerializer с FastJSONRenderer отдаёт побайтно тот же
+    ответ, что RecipeSerializer с JSONRenderer
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@foodgram.ru', password='pass12345!'
+        )
+        authors = [
+            User.objects.create_user(
+                username=f'author{i}', email=f'author{i}@foodgram.ru',
+                first_name='Имя', last_name='Фамилия', password='pass12345!'
+            ) for i in range(2)
+        ]
+        tags = [
+            Tag.objects.create(name=slug, slug=slug, color='#FFA500')
+            for slug in ('breakfast', 'lunch', 'dinner')
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {i}', measurement_unit='г'
+            ) for i in range(5)
+        ]
+        cls.recipes = []
+        for i in range(4):
+            recipe = Recipe.objects.create(
+                author=authors[i % 2], name=f'рецепт "{i}"',
+                image='' if i == 3 else f'recipes/{i}.png',
+                thumbnails_image='recipes/1.png' if i == 1 else '',
+                text='текст\nс переводом строки', cooking_time=10 + i
+            )
+            # Теги и состав добавляются не по порядку id.
+            for tag in reversed(tags[:i + 1]):
+                TagRecipe.objects.create(recipe=recipe, tag=tag)
+            for ingredient in reversed(ingredients[i:]):
+                Amount.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=i + 1
+                )
+            cls.recipes.append(recipe)
+        FavouriteRecipe.objects.create(user=cls.user, recipe=cls.recipes[0])
+        ShoppingList.objects.create(user=cls.user, recipe=cls.recipes[1])
+        Subscription.objects.create(user=cls.user, author=authors[1])
+
+    def setUp(self):
+        for alias in ('default', 'reference'):
+            caches[alias].clear()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def render(self, fast, user, params):
+        request = APIRequestFactory().get('/api/recipes/', params)
+        if user is None:
+            request.user = AnonymousUser()
+        else:
+            force_authenticate(request, user)
+        view = RecipeViewSet(action_map={'get': 'list'}, args=(),
+                             kwargs={}, format_kwarg=None)
+        view.request = view.initialize_request(request)
+        view.headers = {}
+        renderer_class = FastJSONRenderer if fast else JSONRenderer
+        with override_settings(FAST_RECIPE_SERIALIZATION=fast):
+            recipes = list(view.get_queryset().order_by('-pub_date', '-id'))
+            return renderer_class().render(view.serialize_list(recipes))
+
+    def assert_same_output(self, user=None, params=None):
+        body = self.render(True, user, params)
+        self.assertEqual(body, self.render(False, user, params))
+        return {recipe['id']: recipe for recipe in json.loads(body)}
+
+    def test_anonymous(self):
+        recipes = self.assert_same_output()
+        self.assertEqual(len(recipes), len(self.recipes))
+        first, second, _, without_image = (
+            recipes[recipe.id] for recipe in self.recipes
+        )
+        self.assertFalse(first['is_favorited'])
+        self.assertFalse(second['author']['is_subscribed'])
+        self.assertIn('/thumbs/', second['thumbnails']['small'])
+        self.assertTrue(first['thumbnails']['small'].endswith('/0.png'))
+        self.assertIsNone(without_image['image'])
+        self.assertEqual(without_image['thumbnails'], {})
+
+    def test_authenticated_flags(self):
+        recipes = self.assert_same_output(self.user)
+        first, second = (recipes[recipe.id] for recipe in self.recipes[:2])
+        self.assertTrue(first['is_favorited'])
+        self.assertFalse(first['is_in_shopping_cart'])
+        self.assertTrue(second['is_in_shopping_cart'])
+        self.assertFalse(first['author']['is_subscribed'])
+        self.assertTrue(second['author']['is_subscribed'])
+
+    def test_sparse_fields(self):
+        for fields in ('id,name,is_favorited,thumbnails',
+                       'tags,ingredients,author,is_in_shopping_cart',
+                       'image,text,cooking_time'):
+            with self.subTest(fields=fields):
+                recipes = self.assert_same_output(
+                    self.user, {'fields': fields}
+                )
+                for recipe in recipes.values():
+                    self.assertEqual(
+                        set(recipe), set(fields.split(',')) | {'id'}
+                    )
+
+
+class KeysetPaginationTests(APITestCase):
+    """
+    Курсорные страницы в прямом и обратном направлении покрывают
+    выдачу без пропусков и повторов при одинаковых значениях
+    первого поля порядка
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='author', email='author@foodgram.ru',
+            password='pass12345!'
+        )
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=author, name=f'суп {"острый " * (i % 3)}{i}',
+                image='recipes/1.png', text='текст', cooking_time=10
+            ) for i in range(11)
+        )
+        # Три значения pub_date с микросекундами и повторы счётчиков.
+        moment = timezone.now().replace(microsecond=123456)
+        for recipe in Recipe.objects.all():
+            Recipe.objects.filter(id=recipe.id).update(
+                pub_date=moment + timedelta(seconds=recipe.id % 3),
+                favorites_count=recipe.id % 2,
+                cart_count=recipe.id % 4 // 2
+            )
+
+    def setUp(self):
+        for alias in ('default', 'reference'):
+            caches[alias].clear()
+
+    def page_through(self, params):
+        """id рецептов по ссылкам next, затем обратно по previous"""
+        response = self.client.get(
+            '/api/recipes/',
+            {**params, 'pagination': 'cursor', 'page_size': 3}
+        )
+        pages = []
+        while True:
+            self.assertEqual(response.status_code, 200)
+            pages.append([recipe['id'] for recipe in response.data['results']])
+            if response.data['next'] is None:
+                break
+            response = self.client.get(response.data['next'])
+        backward = [pages[-1]]
+        while response.data['previous'] is not None:
+            response = self.client.get(response.data['previous'])
+            self.assertEqual(response.status_code, 200)
+            backward.append(
+                [recipe['id'] for recipe in response.data['results']]
+            )
+        self.assertEqual(backward[::-1], pages)
+        return [pk for page in pages for pk in page]
+
+    def assert_pages(self, params, queryset):
+        expected = list(queryset.values_list('id', flat=True))
+        self.assertEqual(self.page_through(params), expected)
+
+    def test_default_ordering(self):
+        self.assert_pages({}, Recipe.objects.order_by('-pub_date', '-id'))
+
+    def test_newest(self):
+        self.assert_pages(
+            {'ordering': 'newest'},
+            Recipe.objects.order_by('-pub_date', '-id')
+        )
+
+    def test_popular(self):
+        self.assert_pages(
+            {'ordering': 'popular'},
+            Recipe.objects.order_by('-favorites_count', '-cart_count', '-id')
+        )
+
+    def test_search_keeps_rank_ordering(self):
+        self.assert_pages(
+            {'search': 'острый суп'},
+            search.filter_queryset(Recipe.objects.all(), 'острый суп')
+        )
+
+    def test_invalid_cursor(self):
+        for position in ('[1, 2]', '["вчера", 1]', '[null, 1]', '{}'):
+            with self.subTest(position=position):
+                cursor = b64encode(urlencode({'p': position}).encode())
+                response = self.client.get(
+                    '/api/recipes/', {'cursor': cursor.decode()}
+                )
+                self.assertEqual(response.status_code, 404)
+
+
+class ReferenceDataTests(APITestCase):
+    """Объекты справочника из кэшированного словаря по id"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {i}', measurement_unit='г'
+            ) for i in range(3)
+        ]
+
+    def setUp(self):
+        caches['reference'].clear()
+
+    def test_retrieve(self):
+        ingredient = self.ingredients[1]
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/ingredients/{ingredient.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {
+            'id': ingredient.id, 'name': ingredient.name,
+            'measurement_unit': 'г'
+        })
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                f'/api/ingredients/{ingredient.id}/',
+                HTTP_IF_NONE_MATCH=response['ETag']
+            )
+        self.assertEqual(response.status_code, 304)
+
+    def test_missing(self):
+        for pk in (0, 'abc'):
+            with self.subTest(pk=pk):
+                response = self.client.get(f'/api/ingredients/{pk}/')
+                self.assertEqual(response.status_code, 404)
+
+    def test_new_version_after_write(self):
+        ingredient = self.ingredients[0]
+        url = f'/api/ingredients/{ingredient.id}/'
+        etag = self.client.get(url)['ETag']
+        ingredient.name = 'соль'
+        with self.captureOnCommitCallbacks(execute=True):
+            ingredient.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['name'], 'соль')
+
+
+def pdf_objects(data):
+    """
+    Объекты PDF по таблице xref: {номер: тело}. Проверяет startxref,
+    смещения всех объектов и размер в trailer.
+    """
+    match = re.search(rb'trailer\n<< /Size (\d+) /Root 1 0 R >>\n'
+                      rb'startxref\n(\d+)\n%%EOF\n$', data)
+    size, xref = int(match.group(1)), int(match.group(2))
+    header = b'xref\n0 %d\n0000000000 65535 f \n' % size
+    assert data[xref:xref + len(header)] == header
+    entries = data[xref + len(header):match.start()]
+    assert len(entries) == 20 * (size - 1)
+    offsets = []
+    for number in range(1, size):
+        entry = entries[20 * (number - 1):20 * number]
+        assert entry[10:] == b' 00000 n \n'
+        offsets.append(int(entry[:10]))
+    ends = sorted(offsets + [xref])
+    objects = {}
+    for number, offset in enumerate(offsets, 1):
+        body = data[offset:ends[ends.index(offset) + 1]]
+        start, end = b'%d 0 obj\n' % number, b'\nendobj\n'
+        assert body.startswith(start) and body.endswith(end), number
+        objects[number] = body[len(start):-len(end)]
+    return objects
+
+
+def pdf_stream(body):
+    """Словарь и данные потока, длина сверяется с /Length"""
+    match = re.match(rb'<< /Length (\d+)(.*?) >>\nstream\n', body, re.S)
+    data = body[match.end():]
+    assert data[int(match.group(1)):] == b'\nendstream'
+    return match.group(2), data[:int(match.group(1))]
+
+
+def reference(body, key):
+    return int(re.search(rb'/%s (\d+) 0 R' % key, body).group(1))
+
+
+requires_font = skipUnless(PdfExporter.available(), 'нет PDF_FONT_FILE')
+
+
+class ExportTests(APITestCase):
+    """
+    Выгрузка списка покупок: файлы txt, csv и pdf разбираются
+    и сверяются с содержимым списка. В PDF проверяются смещения
+    xref, текст восстанавливается по ToUnicode CMap.
+    """
+    names = ('мука', 'Яйца куриные', 'salt, "extra"', 'ёжевика')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@foodgram.ru', password='pass12345!'
+        )
+        for index, name in enumerate(cls.names):
+            ShoppingCartIngredient.objects.create(
+                user=cls.user, amount=index + 1, recipes_count=1,
+                ingredient=Ingredient.objects.create(
+                    name=name, measurement_unit='г'
+                )
+            )
+        cls.rows = list(ShoppingCartIngredient.objects.values(
+            'ingredient__name', 'ingredient__measurement_unit', 'amount'
+        ).order_by('ingredient__name'))
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def download(self, extension):
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/', {'format': extension}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            f'filename="shopping_list.{extension}"',
+            response['Content-Disposition']
+        )
+        return response['Content-Type'], b''.join(response.streaming_content)
+
+    def test_txt(self):
+        content_type, data = self.download('txt')
+        self.assertEqual(content_type, 'text/plain; charset=utf-8')
+        self.assertEqual(data.decode().splitlines(), [f'{TITLE}:'] + [
+            BaseExporter.format_row(row) for row in self.rows
+        ])
+
+    def test_csv(self):
+        content_type, data = self.download('csv')
+        self.assertEqual(content_type, 'text/csv; charset=utf-8')
+        self.assertEqual(list(csv.reader(io.StringIO(data.decode()))), [
+            ['Ингредиент', 'Количество', 'Единица измерения']
+        ] + [
+            [row['ingredient__name'], str(row['amount']), 'г']
+            for row in self.rows
+        ])
+
+    def test_unknown_format(self):
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/', {'format': 'doc'}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(PDF_FONT_FILE='/nonexistent.ttf')
+    def test_pdf_without_font(self):
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/', {'format': 'pdf'}
+        )
+        self.assertEqual(response.status_code, 400)
+        messages = run_checks(include_deployment_checks=True)
+        self.assertIn('api.W001', [message.id for message in messages])
+
+    def render(self, rows):
+        exporter = PdfExporter(iter(rows))
+        data = b''.join(exporter.render())
+        self.assertTrue(data.startswith(b'%PDF-1.4\n'))
+        return pdf_objects(data)
+
+    @staticmethod
+    def pdf_text(objects):
+        """Строки всех страниц, декодированные по ToUnicode CMap"""
+        _, cmap = pdf_stream(objects[reference(objects[3], b'ToUnicode')])
+        chars = {
+            int(gid, 16): bytes.fromhex(text.decode()).decode('utf-16-be')
+            for gid, text in re.findall(
+                rb'<([0-9A-F]{4})> <([0-9A-F]+)>', cmap
+            )
+        }
+        kids = re.search(rb'/Kids \[(.*?)\]', objects[2]).group(1)
+        lines = []
+        for page in re.findall(rb'(\d+) 0 R', kids):
+            _, content = pdf_stream(
+                objects[reference(objects[int(page)], b'Contents')]
+            )
+            for codes in re.findall(rb'<([0-9A-F]*)> Tj', content):
+                lines.append(''.join(
+                    chars.get(int(codes[index:index + 4], 16), '\ufffd')
+                    for index in range(0, len(codes), 4)
+                ))
+        return lines
+
+    @requires_font
+    def test_pdf(self):
+        content_type, data = self.download('pdf')
+        self.assertEqual(content_type, 'application/pdf')
+        self.assertEqual(self.pdf_text(pdf_objects(data)), [
+            f'{TITLE}:', ''
+        ] + [BaseExporter.format_row(row) for row in self.rows])
+
+    @requires_font
+    def test_pages(self):
+        rows = self.rows * 30
+        objects = self.render(rows)
+        pages = int(re.search(rb'/Count (\d+)', objects[2]).group(1))
+        lines = 2 + len(rows)
+        per_page = PdfExporter.lines_per_page.fget(PdfExporter([]))
+        self.assertEqual(pages, -(-lines // per_page))
+        self.assertEqual(len(self.pdf_text(objects)), lines)
+
+    @requires_font
+    def test_font_subset(self):
+        objects = self.render(self.rows)
+        font = truetype.load(settings.PDF_FONT_FILE)
+        descendant = objects[int(
+            re.search(rb'/DescendantFonts \[(\d+) 0 R\]', objects[3]).group(1)
+        )]
+        widths = dict(
+            (int(gid), int(width)) for gid, width in
+            re.findall(rb'(\d+) \[(\d+)\]', descendant)
+        )
+        text = ''.join(
+            f'{TITLE}:' + BaseExporter.format_row(row) for row in self.rows
+        )
+        used = {font.cmap[ord(char)] for char in text}
+        self.assertEqual(set(widths), used)
+        for gid, width in widths.items():
+            self.assertEqual(width, font.width(gid))
+        extra, stream = pdf_stream(objects[reference(
+            objects[reference(descendant, b'FontDescriptor')], b'FontFile2'
+        )])
+        data = zlib.decompress(stream)
+        self.assertEqual(extra, b' /Length1 %d /Filter /FlateDecode'
+                         % len(data))
+        count = struct.unpack_from('>H', data, 4)[0]
+        tables = {}
+        for index in range(count):
+            tag, checksum, offset, length = struct.unpack_from(
+                '>4sIII', data, 12 + 16 * index
+            )
+            table = data[offset:offset + length]
+            self.assertEqual(truetype.checksum(table), checksum)
+            tables[tag.decode('latin1')] = table
+        self.assertEqual(
+            set(tables),
+            {tag for tag in truetype.SUBSET_TABLES if tag in font.tables}
+        )
+        loca = struct.unpack(
+            '>%dI' % (font.glyph_count + 1), tables['loca']
+        )
+        unused = font.cmap[ord('Z')]
+        self.assertNotIn(unused, used)
+        for gid in used | {unused}:
+            glyph = tables['glyf'][loca[gid]:loca[gid + 1]]
+            expected = font.glyph(gid) if gid in used else b''
+            self.assertEqual(glyph.rstrip(b'\0'), expected.rstrip(b'\0'))
+
+
+class AutocompleteTests(APITestCase):
+    """
+    Поиск ингредиентов по ?name=: сначала совпадения по началу
+    названия, затем по вхождению, без учёта регистра и ё
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г') for name in (
+                'ванильный сахар', 'Сахар', 'творог', 'сахарная пудра',
+                'Ёлочные грибы', 'тростниковый сахар', 'сало'
+            )
+        )
+
+    def setUp(self):
+        caches['reference'].clear()
+        autocomplete.invalidate()
+
+    def names(self, query):
+        response = self.client.get('/api/ingredients/', {'name': query})
+        self.assertEqual(response.status_code, 200)
+        return [item['name'] for item in response.data]
+
+    def test_prefix_matches_first(self):
+        self.assertEqual(self.names('сах'), [
+            'Сахар', 'сахарная пудра', 'ванильный сахар',
+            'тростниковый сахар'
+        ])
+
+    def test_case_and_yo_are_ignored(self):
+        self.assertEqual(self.names('САХАРНАЯ П'), ['сахарная пудра'])
+        self.assertEqual(self.names('елоч'), ['Ёлочные грибы'])
+        self.assertEqual(self.names('грибы'), ['Ёлочные грибы'])
+
+    def test_short_query_matches_prefix_only(self):
+        self.assertEqual(self.names('са'), ['сало', 'Сахар', 'сахарная пудра'])
+        self.assertEqual(self.names('ар'), [])
+
+    def test_new_ingredient_is_found(self):
+        self.assertEqual(self.names('саха'), [
+            'Сахар', 'сахарная пудра', 'ванильный сахар',
+            'тростниковый сахар'
+        ])
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name='сахарин', measurement_unit='г')
+        self.assertEqual(self.names('саха'), [
+            'Сахар', 'сахарин', 'сахарная пудра', 'ванильный сахар',
+            'тростниковый сахар'
+        ])
+
+    def test_not_modified(self):
+        response = self.client.get('/api/ingredients/', {'name': 'сах'})
+        response = self.client.get(
+            '/api/ingredients/', {'name': 'Сах'},
+            HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+
+
+class TagFilterTests(APITestCase):
+    """?tags= с несколькими тегами: каждый рецепт в выдаче один раз"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@foodgram.ru', password='pass12345!'
+        )
+        tags = [
+            Tag.objects.create(name=slug, slug=slug, color='#FFA500')
+            for slug in ('breakfast', 'lunch', 'dinner')
+        ]
+        for name, recipe_tags in (
+                ('все', tags), ('завтрак', tags[:1]),
+                ('обед и ужин', tags[1:]), ('без тегов', [])):
+            recipe = Recipe.objects.create(
+                author=cls.user, name=name, image='recipes/1.png',
+                text='текст', cooking_time=10
+            )
+            TagRecipe.objects.bulk_create(
+                TagRecipe(recipe=recipe, tag=tag) for tag in recipe_tags
+            )
+            FavouriteRecipe.objects.create(user=cls.user, recipe=recipe)
+
+    def setUp(self):
+        for alias in ('default', 'reference'):
+            caches[alias].clear()
+        self.client.force_authenticate(self.user)
+
+    def names(self, params):
+        response = self.client.get('/api/recipes/', params)
+        self.assertEqual(response.status_code, 200)
+        names = [recipe['name'] for recipe in response.data['results']]
+        self.assertEqual(response.data['count'], len(names))
+        return sorted(names)
+
+    def test_any_of_tags(self):
+        for tags, expected in (
+            (['breakfast'], ['все', 'завтрак']),
+            (['lunch', 'dinner'], ['все', 'обед и ужин']),
+            (['breakfast', 'lunch', 'dinner'],
+             ['все', 'завтрак', 'обед и ужин']),
+        ):
+            with self.subTest(tags=tags):
+                self.assertEqual(self.names({'tags': tags}), expected)
+
+    def test_with_other_filters(self):
+        self.assertEqual(self.names({
+            'tags': ['breakfast', 'lunch', 'dinner'], 'is_favorited': 1,
+            'ordering': 'popular'
+        }), ['все', 'завтрак', 'обед и ужин'])
+
+    def test_unknown_and_empty_slugs(self):
+        self.assertEqual(self.names({'tags': ['brunch']}), [])
+        self.assertEqual(
+            self.names({'tags': ['brunch', 'lunch']}), ['все', 'обед и ужин']
+        )
+        self.assertEqual(self.names({'tags': ['']}), [
+            'без тегов', 'все', 'завтрак', 'обед и ужин'
+        ])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_PROCESSING_ASYNC=False)
+class ResponseCacheTests(APITestCase):
+    """
+    Условные запросы (ETag, Last-Modified) и сброс кэша ответов
+    рецептов после изменений
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.user = (
+            User.objects.create_user(
+                username=name, email=f'{name}@foodgram.ru',
+                password='pass12345!'
+            ) for name in ('author', 'user')
+        )
+        cls.tag = Tag.objects.create(
+            name='breakfast', slug='breakfast', color='#FFA500'
+        )
+        cls.ingredient = Ingredient.objects.create(
+            name='мука', measurement_unit='г'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='рецепт', image='recipes/1.png',
+            text='текст', cooking_time=10
+        )
+
+    def setUp(self):
+        for alias in ('default', 'reference'):
+            caches[alias].clear()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def write(self, user, method, url, data=None):
+        self.client.force_authenticate(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = getattr(self.client, method)(url, data, format='json')
+        self.client.force_authenticate(None)
+        self.assertLess(response.status_code, 300, response.data)
+        return response
+
+    def recipe_data(self, name):
+        return {
+            'tags': [self.tag.id],
+            'ingredients': [{'id': self.ingredient.id, 'amount': 5}],
+            'name': name, 'image': PNG, 'text': 'текст', 'cooking_time': 10,
+        }
+
+    def test_anonymous_not_modified(self):
+        for url in ('/api/recipes/', f'/api/recipes/{self.recipe.id}/'):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertFalse(response['ETag'].startswith('W/'))
+                self.assertEqual(self.client.get(
+                    url, HTTP_IF_NONE_MATCH=response['ETag']
+                ).status_code, 304)
+                self.assertEqual(self.client.get(
+                    url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+                ).status_code, 304)
+
+    def test_update_invalidates(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        etag = self.client.get(url)['ETag']
+        self.client.get('/api/recipes/')
+        self.write(self.author, 'patch', url, self.recipe_data('новое'))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['name'], 'новое')
+        response = self.client.get('/api/recipes/')
+        self.assertEqual(response.data['results'][0]['name'], 'новое')
+
+    def test_create_and_delete_invalidate_list(self):
+        self.assertEqual(self.client.get('/api/recipes/').data['count'], 1)
+        self.write(
+            self.author, 'post', '/api/recipes/', self.recipe_data('второй')
+        )
+        response = self.client.get('/api/recipes/')
+        self.assertEqual(
+            [recipe['name'] for recipe in response.data['results']],
+            ['второй', 'рецепт']
+        )
+        self.write(self.author, 'delete', f'/api/recipes/{self.recipe.id}/')
+        response = self.client.get('/api/recipes/')
+        self.assertEqual(
+            [recipe['name'] for recipe in response.data['results']],
+            ['второй']
+        )
+
+    def test_user_flags(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        self.client.force_authenticate(self.user)
+        response = self.client.get(url)
+        self.assertTrue(response['ETag'].startswith('W/'))
+        self.assertFalse(response.data['is_favorited'])
+        self.write(self.user, 'post', f'{url}favorite/')
+        self.client.force_authenticate(self.user)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['is_favorited'])
+        self.assertEqual(self.client.get(
+            url, HTTP_IF_NONE_MATCH=response['ETag']
+        ).status_code, 304)
+        # Запись кэша общая: флаги другого пользователя свои.
+        self.client.force_authenticate(self.author)
+        self.assertFalse(self.client.get(url).data['is_favorited'])
+        self.client.force_authenticate(None)
+        self.assertFalse(self.client.get(url).data['is_favorited'])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_PROCESSING_ASYNC=False)
+class CounterTests(APITestCase):
+    """
+    Счётчики избранного, списков покупок и рецептов автора совпадают
+    с данными после добавления, удаления и удаления рецепта
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.user, cls.other = (
+            User.objects.create_user(
+                username=name, email=f'{name}@foodgram.ru',
+                password='pass12345!'
+            ) for name in ('author', 'user', 'other')
+        )
+        cls.tag = Tag.objects.create(
+            name='breakfast', slug='breakfast', color='#FFA500'
+        )
+        cls.ingredient = Ingredient.objects.create(
+            name='мука', measurement_unit='г'
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def request(self, user, method, url, data=None):
+        self.client.force_authenticate(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            return getattr(self.client, method)(url, data, format='json')
+
+    def create_recipe(self):
+        response = self.request(self.author, 'post', '/api/recipes/', {
+            'tags': [self.tag.id],
+            'ingredients': [{'id': self.ingredient.id, 'amount': 5}],
+            'name': 'рецепт', 'image': PNG, 'text': 'текст',
+            'cooking_time': 10,
+        })
+        self.assertEqual(response.status_code, 201, response.data)
+        return Recipe.objects.latest('id').id
+
+    def assert_counters(self, recipe_id, favorites, cart):
+        recipe = Recipe.objects.get(id=recipe_id)
+        self.assertEqual(
+            (recipe.favorites_count, recipe.cart_count), (favorites, cart)
+        )
+        self.assertEqual(counters.recipe_drift(), {})
+        self.assertEqual(counters.author_drift(), {})
+
+    def recipes_count(self):
+        """Число рецептов автора в подписках пользователя"""
+        response = self.request(self.user, 'get', '/api/users/subscriptions/')
+        return response.data['results'][0]['recipes_count']
+
+    def test_favorite_and_cart(self):
+        recipe = self.create_recipe()
+        url = f'/api/recipes/{recipe}/'
+        for user in (self.user, self.other):
+            self.assertEqual(self.request(
+                user, 'post', f'{url}favorite/').status_code, 201)
+        # Повторное добавление и удаление отсутствующего не меняют счётчик.
+        self.assertEqual(self.request(
+            self.user, 'post', f'{url}favorite/').status_code, 400)
+        self.assertEqual(self.request(
+            self.author, 'delete', f'{url}favorite/').status_code, 400)
+        self.request(self.user, 'post', f'{url}shopping_cart/')
+        self.assert_counters(recipe, 2, 1)
+        self.request(self.user, 'delete', f'{url}favorite/')
+        self.request(self.user, 'delete', f'{url}shopping_cart/')
+        self.assert_counters(recipe, 1, 0)
+
+    def test_bulk_endpoints(self):
+        recipes = [self.create_recipe() for _ in range(2)]
+        self.request(self.user, 'post', f'/api/recipes/{recipes[0]}/favorite/')
+        self.request(self.user, 'post', '/api/recipes/favorite/', {
+            'recipes': recipes + recipes
+        })
+        self.request(self.user, 'post', '/api/recipes/shopping_cart/', {
+            'recipes': recipes
+        })
+        self.assert_counters(recipes[0], 1, 1)
+        self.assert_counters(recipes[1], 1, 1)
+        self.request(self.user, 'delete', '/api/recipes/favorite/', {
+            'recipes': recipes
+        })
+        self.request(self.user, 'delete', '/api/recipes/shopping_cart/all/')
+        self.assert_counters(recipes[0], 0, 0)
+        self.assert_counters(recipes[1], 0, 0)
+
+    def test_author_recipes_after_delete(self):
+        recipes = [self.create_recipe() for _ in range(3)]
+        Subscription.objects.create(user=self.user, author=self.author)
+        self.request(self.user, 'post', f'/api/recipes/{recipes[0]}/favorite/')
+        self.assertEqual(self.recipes_count(), 3)
+        response = self.request(
+            self.author, 'delete', f'/api/recipes/{recipes[0]}/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.recipes_count(), 2)
+        self.assert_counters(recipes[1], 0, 0)
+
+    def test_reconcile(self):
+        recipe = self.create_recipe()
+        self.request(self.user, 'post', f'/api/recipes/{recipe}/favorite/')
+        Recipe.objects.filter(id=recipe).update(favorites_count=5)
+        AuthorStats.objects.filter(user=self.author).update(recipes_count=9)
+        self.assertEqual(counters.reconcile(), 2)
+        self.assert_counters(recipe, 1, 0)
+
+
+@override_settings(IMAGE_PROCESSING_ASYNC=False)
+class FeedTests(APITestCase):
+    """
+    Лента подписок совпадает с выборкой рецептов авторов в порядке
+    (-pub_date, -id) при любом размере закэшированного начала
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@foodgram.ru', password='pass12345!'
+        )
+        cls.authors = [
+            User.objects.create_user(
+                username=f'author{i}', email=f'author{i}@foodgram.ru',
+                password='pass12345!'
+            ) for i in range(4)
+        ]
+        Subscription.objects.bulk_create(
+            Subscription(user=cls.user, author=author)
+            for author in cls.authors[:3]
+        )
+        moment = timezone.now().replace(microsecond=123456)
+        for i in range(18):
+            recipe = Recipe.objects.create(
+                author=cls.authors[i % 4], name=f'рецепт {i}',
+                image='recipes/1.png', text='текст', cooking_time=10
+            )
+            # Пары рецептов разных авторов с одинаковой датой.
+            Recipe.objects.filter(id=recipe.id).update(
+                pub_date=moment - timedelta(seconds=i // 2)
+            )
+
+    def setUp(self):
+        caches['default'].clear()
+        self.client.force_authenticate(self.user)
+
+    def expected(self):
+        return list(Recipe.objects.filter(
+            author__following__user=self.user
+        ).order_by('-pub_date', '-id').values_list('id', flat=True))
+
+    def page_through(self, page_size=4):
+        ids = []
+        response = self.client.get(
+            '/api/recipes/feed/', {'page_size': page_size}
+        )
+        while True:
+            self.assertEqual(response.status_code, 200)
+            ids += [recipe['id'] for recipe in response.data['results']]
+            if response.data['next'] is None:
+                return ids
+            response = self.client.get(response.data['next'])
+
+    def test_pages(self):
+        for head_size in (0, 3, 60):
+            with self.subTest(head_size=head_size):
+                caches['default'].clear()
+                with override_settings(FEED_HEAD_SIZE=head_size):
+                    self.assertEqual(self.page_through(), self.expected())
+                    # Второй проход читает начало ленты из кэша.
+                    self.assertEqual(self.page_through(), self.expected())
+
+    def test_changes_reach_cached_head(self):
+        self.page_through()
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(
+                author=self.authors[0], name='новый', image='recipes/1.png',
+                text='текст', cooking_time=10
+            )
+        feed = self.page_through()
+        self.assertEqual(feed[0], recipe.id)
+        self.assertEqual(feed, self.expected())
+        with self.captureOnCommitCallbacks(execute=True):
+            Subscription.objects.filter(
+                user=self.user, author=self.authors[0]
+            ).delete()
+        self.assertEqual(self.page_through(), self.expected())
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.filter(author=self.authors[1]).first().delete()
+        self.assertEqual(self.page_through(), self.expected())
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/recipes/feed/', {'cursor': 'xyz'})
+        self.assertEqual(response.status_code, 404)
+
+
+class CompressionMiddlewareTests(APITestCase):
+    """Правила сжатия поверх GZipMiddleware на ответах-заглушках"""
+    body = {'items': ['рецепт'] * 200}
+
+    def respond(self, response, path='/api/recipes/', **headers):
+        request = RequestFactory().get(path, **headers)
+        middleware = compression.CompressionMiddleware(lambda _: response)
+        return middleware(request)
+
+    def test_threshold(self):
+        small = self.respond(
+            JsonResponse({'items': []}), HTTP_ACCEPT_ENCODING='gzip'
+        )
+        self.assertFalse(small.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', small['Vary'])
+        large = self.respond(
+            JsonResponse(self.body), HTTP_ACCEPT_ENCODING='gzip'
+        )
+        self.assertEqual(large['Content-Encoding'], 'gzip')
+        self.assertEqual(
+            json.loads(gzip.decompress(large.content)), self.body
+        )
+        self.assertEqual(large['Content-Length'], str(len(large.content)))
+
+    def test_content_types(self):
+        content = json.dumps(self.body).encode()
+        for content_type, encoded in (('application/json', True),
+                                      ('text/csv; charset=utf-8', True),
+                                      ('application/pdf', False),
+                                      ('image/png', False)):
+            with self.subTest(content_type=content_type):
+                response = self.respond(
+                    HttpResponse(content, content_type=content_type),
+                    HTTP_ACCEPT_ENCODING='gzip'
+                )
+                self.assertEqual(
+                    response.get('Content-Encoding') == 'gzip', encoded
+                )
+        with override_settings(COMPRESSION_CONTENT_TYPES={
+                'application/json': len(content) + 1}):
+            response = self.respond(
+                JsonResponse(self.body), HTTP_ACCEPT_ENCODING='gzip'
+            )
+            self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_accept_encoding(self):
+        for header, encoding in (('', None), ('identity', None),
+                                 ('gzip;q=0', None), ('deflate, gzip', 'gzip'),
+                                 ('GZIP; q=0.5', 'gzip'), ('br', None)):
+            if compression.brotli is not None and header == 'br':
+                encoding = 'br'
+            with self.subTest(header=header):
+                response = self.respond(
+                    JsonResponse(self.body), HTTP_ACCEPT_ENCODING=header
+                )
+                self.assertEqual(response.get('Content-Encoding'), encoding)
+
+    @skipUnless(compression.brotli, 'пакет Brotli не установлен')
+    def test_brotli_preferred(self):
+        response = self.respond(
+            JsonResponse(self.body), HTTP_ACCEPT_ENCODING='gzip, br'
+        )
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(json.loads(
+            compression.brotli.decompress(response.content)), self.body)
+
+    def test_auth_excluded(self):
+        response = self.respond(
+            JsonResponse(self.body), path='/api/auth/token/login/',
+            HTTP_ACCEPT_ENCODING='gzip'
+        )
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertFalse(response.has_header('Vary'))
+
+    def test_streaming(self):
+        lines = [f'ингредиент {i}\n'.encode() for i in range(100)]
+        response = self.respond(
+            StreamingHttpResponse(iter(lines), content_type='text/plain'),
+            HTTP_ACCEPT_ENCODING='gzip'
+        )
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(
+            gzip.decompress(b''.join(response.streaming_content)),
+            b''.join(lines)
+        )
+
+    def test_strong_etag_gets_encoding_suffix(self):
+        for etag, expected in (('"abc"', '"abc-gzip"'),
+                               ('W/"abc"', 'W/"abc"')):
+            with self.subTest(etag=etag):
+                response = JsonResponse(self.body)
+                response['ETag'] = etag
+                response = self.respond(response, HTTP_ACCEPT_ENCODING='gzip')
+                self.assertEqual(response['ETag'], expected)
+
+
+class CompressionTests(APITestCase):
+    """Сжатие ответов API и условные запросы к сжатым ответам"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='author', email='author@foodgram.ru',
+            password='pass12345!'
+        )
+        Recipe.objects.bulk_create(
+            Recipe(author=author, name=f'рецепт {i}', image='recipes/1.png',
+                   text='текст рецепта ' * 20, cooking_time=10)
+            for i in range(6)
+        )
+
+    def setUp(self):
+        for alias in ('default', 'reference'):
+            caches[alias].clear()
+
+    def test_conditional_request(self):
+        response = self.client.get(
+            '/api/recipes/', HTTP_ACCEPT_ENCODING='gzip'
+        )
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        etag = response['ETag']
+        self.assertRegex(etag, r'^"[0-9a-f]+-gzip"$')
+        response = self.client.get(
+            '/api/recipes/', HTTP_ACCEPT_ENCODING='gzip',
+            HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        # Несжатый вариант имеет свой ETag.
+        response = self.client.get('/api/recipes/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], etag.replace('-gzip', ''))
+        self.assertEqual(self.client.get(
+            '/api/recipes/', HTTP_IF_NONE_MATCH=response['ETag']
+        ).status_code, 304)
+
+    def test_auth_not_compressed(self):
+        response = self.client.post('/api/auth/token/login/', {
+            'email': 'author@foodgram.ru', 'password': 'pass12345!'
+        }, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+
+class SparseFieldsTests(APITestCase):
+    """?fields= у рецептов и подписок"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, author = (
+            User.objects.create_user(
+                username=name, email=f'{name}@foodgram.ru',
+                password='pass12345!'
+            ) for name in ('user', 'author')
+        )
+        cls.recipe = Recipe.objects.create(
+            author=author, name='рецепт', image='recipes/1.png',
+            text='текст', cooking_time=10
+        )
+        Subscription.objects.create(user=cls.user, author=author)
+
+    def setUp(self):
+        for alias in ('default', 'reference'):
+            caches[alias].clear()
+        self.client.force_authenticate(self.user)
+
+    def test_recipes(self):
+        response = self.client.get(
+            '/api/recipes/', {'fields': 'name,image'}
+        )
+        self.assertEqual(
+            set(response.data['results'][0]), {'id', 'name', 'image'}
+        )
+        response = self.client.get(
+            f'/api/recipes/{self.recipe.id}/', {'fields': 'text'}
+        )
+        self.assertEqual(
+            response.data, {'id': self.recipe.id, 'text': 'текст'}
+        )
+
+    def test_subscriptions(self):
+        response = self.client.get(
+            '/api/users/subscriptions/', {'fields': 'username,recipes'}
+        )
+        author, = response.data['results']
+        self.assertEqual(set(author), {'id', 'username', 'recipes'})
+        self.assertEqual(
+            [recipe['id'] for recipe in author['recipes']], [self.recipe.id]
+        )
+        with CaptureQueriesContext(connection) as full_queries:
+            full = self.client.get('/api/users/subscriptions/')
+        # Без recipes превью рецептов не загружаются.
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                '/api/users/subscriptions/', {'fields': 'username'}
+            )
+        self.assertEqual(len(queries), len(full_queries) - 1)
+        self.assertEqual(
+            response.data['results'],
+            [{'id': author['id'], 'username': 'author'}]
+        )
+        self.assertLess(len(response.content), len(full.content))
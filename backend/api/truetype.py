@@ -0,0 +1,236 @@
+"""
+Чтение шрифта TrueType для встраивания в PDF.
+
+TrueTypeFont читает из файла то, что нужно PDF: метрики, ширины
+глифов и таблицу cmap (символ -> номер глифа). subset() собирает
+шрифт только с таблицами, нужными для вывода, в котором данные
+остальных глифов пусты: номера глифов не меняются, поэтому в PDF
+используется CIDToGIDMap /Identity.
+"""
+import os
+import re
+import struct
+from functools import lru_cache
+
+# Таблицы, достаточные для шрифта, встроенного в PDF (FontFile2).
+SUBSET_TABLES = ('cvt ', 'fpgm', 'glyf', 'head', 'hhea', 'hmtx', 'loca',
+                 'maxp', 'prep')
+
+# Флаги составного глифа: размер аргументов и преобразования.
+ARG_1_AND_2_ARE_WORDS = 0x0001
+WE_HAVE_A_SCALE = 0x0008
+MORE_COMPONENTS = 0x0020
+WE_HAVE_AN_X_AND_Y_SCALE = 0x0040
+WE_HAVE_A_TWO_BY_TWO = 0x0080
+
+# Ошибки чтения файла, который не является шрифтом TrueType.
+FORMAT_ERRORS = (KeyError, IndexError, ValueError, struct.error)
+
+
+def checksum(data):
+    data += b'\0' * (-len(data) % 4)
+    return sum(struct.unpack('>%dI' % (len(data) // 4), data)) & 0xFFFFFFFF
+
+
+class TrueTypeFont:
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self.data = file.read()
+        self.name = re.sub(
+            r'[^A-Za-z0-9-]', '', os.path.splitext(os.path.basename(path))[0]
+        )
+        count = struct.unpack_from('>H', self.data, 4)[0]
+        self.tables = {}
+        for index in range(count):
+            tag, _, offset, length = struct.unpack_from(
+                '>4sIII', self.data, 12 + 16 * index
+            )
+            self.tables[tag.decode('latin1')] = (offset, length)
+        head = self.table('head')
+        self.units_per_em = struct.unpack_from('>H', head, 18)[0]
+        self.bbox = struct.unpack_from('>4h', head, 36)
+        self.long_loca = struct.unpack_from('>h', head, 50)[0] == 1
+        hhea = self.table('hhea')
+        self.ascent, self.descent = struct.unpack_from('>2h', hhea, 4)
+        metrics = struct.unpack_from('>H', hhea, 34)[0]
+        self.glyph_count = struct.unpack_from('>H', self.table('maxp'), 4)[0]
+        advances = struct.unpack_from(
+            '>' + 'Hh' * metrics, self.table('hmtx')
+        )[::2]
+        self.advances = advances + (advances[-1], ) * (
+            self.glyph_count - metrics
+        )
+        self.cap_height = self.ascent
+        os2 = self.table('OS/2')
+        if os2 and struct.unpack_from('>H', os2)[0] >= 2:
+            self.cap_height = struct.unpack_from('>h', os2, 88)[0]
+        self.italic_angle = 0
+        post = self.table('post')
+        if post:
+            self.italic_angle = struct.unpack_from('>i', post, 4)[0] / 65536
+        self.cmap = self.read_cmap()
+        self.locations = self.read_loca()
+
+    def table(self, tag):
+        if tag not in self.tables:
+            return b''
+        offset, length = self.tables[tag]
+        return self.data[offset:offset + length]
+
+    def read_cmap(self):
+        """Символы Unicode -> глифы (подтаблицы форматов 4 и 12)"""
+        cmap = self.table('cmap')
+        count = struct.unpack_from('>H', cmap, 2)[0]
+        subtables = {}
+        for index in range(count):
+            platform, encoding, offset = struct.unpack_from(
+                '>HHI', cmap, 4 + 8 * index
+            )
+            subtables[platform, encoding] = offset
+        for key in ((3, 10), (0, 4), (3, 1), (0, 3)):
+            if key not in subtables:
+                continue
+            offset = subtables[key]
+            subtable_format = struct.unpack_from('>H', cmap, offset)[0]
+            if subtable_format == 12:
+                return self.read_cmap_12(cmap, offset)
+            if subtable_format == 4:
+                return self.read_cmap_4(cmap, offset)
+        raise ValueError('В шрифте нет таблицы cmap для Unicode')
+
+    @staticmethod
+    def read_cmap_4(cmap, offset):
+        segments = struct.unpack_from('>H', cmap, offset + 6)[0] // 2
+        ends_at = offset + 14
+        starts_at = ends_at + 2 * segments + 2
+        deltas_at = starts_at + 2 * segments
+        ranges_at = deltas_at + 2 * segments
+        ends = struct.unpack_from('>%dH' % segments, cmap, ends_at)
+        starts = struct.unpack_from('>%dH' % segments, cmap, starts_at)
+        deltas = struct.unpack_from('>%dh' % segments, cmap, deltas_at)
+        ranges = struct.unpack_from('>%dH' % segments, cmap, ranges_at)
+        result = {}
+        for index in range(segments):
+            for code in range(starts[index], ends[index] + 1):
+                if code == 0xFFFF:
+                    continue
+                if not ranges[index]:
+                    glyph = (code + deltas[index]) & 0xFFFF
+                else:
+                    position = (ranges_at + 2 * index + ranges[index]
+                                + 2 * (code - starts[index]))
+                    glyph = struct.unpack_from('>H', cmap, position)[0]
+                    if glyph:
+                        glyph = (glyph + deltas[index]) & 0xFFFF
+                if glyph:
+                    result[code] = glyph
+        return result
+
+    @staticmethod
+    def read_cmap_12(cmap, offset):
+        count = struct.unpack_from('>I', cmap, offset + 12)[0]
+        result = {}
+        for index in range(count):
+            start, end, glyph = struct.unpack_from(
+                '>3I', cmap, offset + 16 + 12 * index
+            )
+            for code in range(start, end + 1):
+                result[code] = glyph + code - start
+        return result
+
+    def read_loca(self):
+        loca = self.table('loca')
+        count = self.glyph_count + 1
+        if self.long_loca:
+            return struct.unpack_from('>%dI' % count, loca)
+        return tuple(
+            2 * value for value in struct.unpack_from('>%dH' % count, loca)
+        )
+
+    def glyph(self, gid):
+        offset = self.tables['glyf'][0]
+        return self.data[
+            offset + self.locations[gid]:offset + self.locations[gid + 1]
+        ]
+
+    def components(self, gid):
+        """Глифы, из которых составлен глиф gid"""
+        data = self.glyph(gid)
+        if len(data) < 10 or struct.unpack_from('>h', data)[0] >= 0:
+            return []
+        result = []
+        position = 10
+        while True:
+            flags, component = struct.unpack_from('>HH', data, position)
+            result.append(component)
+            position += 4 + (4 if flags & ARG_1_AND_2_ARE_WORDS else 2)
+            if flags & WE_HAVE_A_SCALE:
+                position += 2
+            elif flags & WE_HAVE_AN_X_AND_Y_SCALE:
+                position += 4
+            elif flags & WE_HAVE_A_TWO_BY_TWO:
+                position += 8
+            if not flags & MORE_COMPONENTS:
+                return result
+
+    def width(self, gid):
+        """Ширина глифа в единицах PDF (1/1000 кегля)"""
+        return round(self.advances[gid] * 1000 / self.units_per_em)
+
+    def scale(self, value):
+        return round(value * 1000 / self.units_per_em)
+
+    def subset(self, gids):
+        """Файл шрифта, в котором есть только глифы gids и .notdef"""
+        keep = {0} | set(gids)
+        pending = list(keep)
+        while pending:
+            for component in self.components(pending.pop()):
+                if component not in keep:
+                    keep.add(component)
+                    pending.append(component)
+        glyf, locations = bytearray(), []
+        for gid in range(self.glyph_count):
+            locations.append(len(glyf))
+            if gid in keep:
+                glyf += self.glyph(gid)
+                glyf += b'\0' * (-len(glyf) % 4)
+        locations.append(len(glyf))
+        head = bytearray(self.table('head'))
+        # Длинные смещения loca, контрольную сумму файла не считаем.
+        struct.pack_into('>I', head, 8, 0)
+        struct.pack_into('>h', head, 50, 1)
+        tables = {
+            tag: self.table(tag) for tag in SUBSET_TABLES if tag in self.tables
+        }
+        tables.update({
+            'glyf': bytes(glyf),
+            'head': bytes(head),
+            'loca': struct.pack('>%dI' % len(locations), *locations),
+        })
+        return self.build(tables)
+
+    @staticmethod
+    def build(tables):
+        count = len(tables)
+        power = 1 << (count.bit_length() - 1)
+        header = struct.pack(
+            '>IHHHH', 0x00010000, count, 16 * power,
+            power.bit_length() - 1, 16 * (count - power)
+        )
+        offset = len(header) + 16 * count
+        directory, body = b'', b''
+        for tag in sorted(tables):
+            data = tables[tag]
+            directory += struct.pack(
+                '>4sIII', tag.encode('latin1'), checksum(data),
+                offset + len(body), len(data)
+            )
+            body += data + b'\0' * (-len(data) % 4)
+        return header + directory + body
+
+
+@lru_cache(maxsize=None)
+def load(path):
+    return TrueTypeFont(path)
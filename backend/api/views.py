@@ -1,74 +1,391 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+import hashlib
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Prefetch
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from django_filters.rest_framework import DjangoFilterBackend
+from foodgram import (autocomplete, cart, cookable, counters, feed,
+                      recipe_lists, reference, similar, versions)
 from foodgram.models import (Amount, FavouriteRecipe, Ingredient, Recipe,
-                             ShoppingList, Tag)
+                             ShoppingCartIngredient, ShoppingList, Tag)
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.generics import get_object_or_404
+from rest_framework.permissions import SAFE_METHODS
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from users.models import Subscription
 
-from .filters import IngredientSearchFilter, RecipeFilterSet
-from .pagination import LimitPagePagination
+from .caching import RecipeResponseCacheMixin
+from .exporters import TextExporter, available_exporters
+from .fast_serializers import FastRecipeSerializer
+from .filters import RecipeFilterSet, RecipeOrderingFilter
+from .pagination import (FeedPagination, LimitPagePagination,
+                         OptionalKeysetPaginationMixin)
 from .permissions import IsAdminOrOwnerOrReadOnly, IsAdminOrReadOnly
-from .serializers import (FavouriteRecipeSerializer, IngredientSerializer,
+from .serializers import (CookableQuerySerializer, CookableRecipeSerializer,
+                          FavouriteRecipeSerializer, IngredientSerializer,
+                          RecipeIdsSerializer, RecipeListResultSerializer,
                           RecipePostSerializer, RecipeSerializer,
-                          ShoppingListSerializer, TagSerializer)
+                          ShoppingCartIngredientSerializer,
+                          ShoppingListSerializer, SimilarQuerySerializer,
+                          SimilarRecipeSerializer, TagSerializer)
+from .sparse_fields import requested_fields
+
+
+class ReferenceDataMixin:
+    """
+    Список и объекты справочника отдаются из кэша справочных данных.
+    ETag строится по версии набора, на совпавший If-None-Match
+    возвращается 304 без тела. Объект берётся из словаря по id,
+    который кэшируется рядом со списком.
+    """
+    get_payload = None
+    get_items_by_id = None
+
+    def etag_response(self, request, data, version, *parts):
+        etag = quote_etag('-'.join(map(str, (self.basename, version) + parts)))
+        return get_conditional_response(
+            request, etag=etag, response=Response(data, headers={'ETag': etag})
+        )
+
+    def list(self, request, *args, **kwargs):
+        version, items = self.get_payload()
+        return self.etag_response(request, items, version)
 
+    def retrieve(self, request, *args, **kwargs):
+        version, items = self.get_items_by_id()
+        pk = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        try:
+            item = items[int(pk)]
+        except (KeyError, ValueError):
+            raise NotFound
+        return self.etag_response(request, item, version, item['id'])
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+
+class TagViewSet(ReferenceDataMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
+    get_payload = staticmethod(reference.tags_payload)
+    get_items_by_id = staticmethod(reference.tags_by_id)
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ReferenceDataMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (IsAdminOrReadOnly, )
-    filter_backends = (IngredientSearchFilter, )
-    search_fields = ('^name', )
+    get_payload = staticmethod(reference.ingredients_payload)
+    get_items_by_id = staticmethod(reference.ingredients_by_id)
 
+    def list(self, request, *args, **kwargs):
+        """
+        Поиск по ?name= обслуживается индексом в памяти:
+        сначала совпадения по началу названия, затем по вхождению.
+        """
+        name = request.query_params.get('name')
+        if name is None:
+            return super().list(request, *args, **kwargs)
+        index = autocomplete.get_index()
+        return self.etag_response(
+            request, index.search(name), index.version,
+            hashlib.md5(autocomplete.normalize(name).encode()).hexdigest()
+        )
 
-class RecipeViewSet(viewsets.ModelViewSet):
+
+class RecipeViewSet(RecipeResponseCacheMixin, OptionalKeysetPaginationMixin,
+                    viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     pagination_class = LimitPagePagination
     permission_classes = (IsAdminOrOwnerOrReadOnly, )
-    filter_backends = (DjangoFilterBackend, )
+    filter_backends = (DjangoFilterBackend, RecipeOrderingFilter)
     filterset_class = RecipeFilterSet
+    list_actions = ('list', 'feed', 'cookable', 'similar')
+
+    def use_fast_serialization(self):
+        return (settings.FAST_RECIPE_SERIALIZATION
+                and self.action in self.list_actions)
+
+    def get_queryset(self):
+        """
+        Рецепты для чтения. С ?fields= не загружаются текст,
+        связанные строки и флаги, которых нет в ответе.
+        """
+        if self.request.method not in SAFE_METHODS:
+            return Recipe.objects.all()
+        fields = requested_fields(self.request)
+
+        def wanted(*names):
+            return fields is None or any(name in fields for name in names)
+
+        queryset = Recipe.objects.defer('search_document')
+        if not wanted('text'):
+            queryset = queryset.defer('text')
+        if not wanted('thumbnails'):
+            queryset = queryset.defer('thumbnails_image')
+        if not self.use_fast_serialization():
+            # Теги и состав по id: тот же порядок, что у FastRecipeSerializer.
+            if wanted('author'):
+                queryset = queryset.select_related('author')
+            if wanted('tags'):
+                queryset = queryset.prefetch_related(
+                    Prefetch('tags', queryset=Tag.objects.order_by('id'))
+                )
+            if wanted('ingredients'):
+                queryset = queryset.prefetch_related(Prefetch(
+                    'amount',
+                    queryset=Amount.objects.select_related(
+                        'ingredient').order_by('id')
+                ))
+        user = self.request.user
+        if user.is_anonymous or not wanted(
+                'is_favorited', 'is_in_shopping_cart'):
+            return queryset
+        return queryset.annotate(
+            is_favorited=Exists(FavouriteRecipe.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingList.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            ))
+        )
 
     def get_serializer_class(self):
         if self.request.method in ('POST', 'PUT', 'PATCH'):
             return RecipePostSerializer
         return RecipeSerializer
 
+    def list(self, request, *args, **kwargs):
+        names = [versions.RECIPES]
+        if request.query_params.get('ordering') == 'popular':
+            names.append(versions.POPULARITY)
+        return self.cached_response(
+            request, names, partial(self.build_list, request)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request,
+            [versions.recipe(kwargs[self.lookup_field])],
+            partial(super().retrieve, request, *args, **kwargs)
+        )
+
+    def get_serializer_context(self):
+        return {
+            **super().get_serializer_context(),
+            'sparse_fields': requested_fields(self.request),
+        }
+
+    def get_list_context(self, recipes):
+        """Контекст с подписками на авторов recipes одним запросом"""
+        context = self.get_serializer_context()
+        fields = context['sparse_fields']
+        if self.request.user.is_authenticated and (
+                fields is None or 'author' in fields):
+            context['subscriptions'] = set(
+                Subscription.objects.filter(
+                    user=self.request.user,
+                    author__in={recipe.author_id for recipe in recipes}
+                ).values_list('author_id', flat=True)
+            )
+        return context
+
+    def serialize_list(self, recipes, serializer_class=RecipeSerializer,
+                       extra_fields=()):
+        """
+        Данные страницы рецептов: FastRecipeSerializer, если включена
+        FAST_RECIPE_SERIALIZATION, иначе serializer_class.
+        """
+        context = self.get_list_context(recipes)
+        if self.use_fast_serialization():
+            return FastRecipeSerializer(recipes, context, extra_fields).data
+        return serializer_class(recipes, many=True, context=context).data
+
+    def use_keyset_pagination(self):
+        # Подбор по ингредиентам упорядочен по рангу, а не по полям.
+        return self.action != 'cookable' and super().use_keyset_pagination()
+
+    def build_list(self, request):
+        """
+        Список рецептов за фиксированное число запросов:
+        подписки на авторов страницы загружаются одним запросом.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        data = self.serialize_list(queryset if page is None else page)
+        if page is None:
+            return Response(data)
+        return self.get_paginated_response(data)
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user,)
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        with cart.maintained():
+            cart.remove_recipe(instance)
+            instance.delete()
+        counters.change_author(instance.author_id, -1)
+
+    def perform_content_negotiation(self, request, force=False):
+        # ?format= у выгрузки списка покупок выбирает экспортёр,
+        # а не рендерер DRF.
+        if self.action == 'download_shopping_cart':
+            force = True
+        return super().perform_content_negotiation(request, force)
+
     @action(detail=False,
             methods=['get'],
             permission_classes=[permissions.IsAuthenticated])
     def download_shopping_cart(self, request):
-        ingredient_list = 'Cписок покупок:'
-        ingredients = Amount.objects.filter(
-            recipe__shopping__user=request.user
+        exporters = available_exporters()
+        exporter_class = exporters.get(
+            request.query_params.get('format', TextExporter.extension)
+        )
+        if exporter_class is None:
+            raise ValidationError({
+                'format': f'Доступные форматы: {", ".join(exporters)}'
+            })
+        ingredients = ShoppingCartIngredient.objects.filter(
+            user=request.user
         ).values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(amount=Sum('amount'))
-        for num, i in enumerate(ingredients):
-            ingredient_list += (
-                f'\n{i["ingredient__name"]} - '
-                f'{i["amount"]} {i["ingredient__measurement_unit"]}'
-            )
-            if num < ingredients.count() - 1:
-                ingredient_list += ', '
-        file = 'shopping_list'
-        response = HttpResponse(
-            ingredient_list, 'Content-Type: application/pdf'
+            'ingredient__name', 'ingredient__measurement_unit', 'amount'
+        ).order_by('ingredient__name')
+        exporter = exporter_class(ingredients.iterator())
+        response = StreamingHttpResponse(
+            exporter.render(), content_type=exporter.content_type
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_list.{exporter.extension}"'
         )
-        response['Content-Disposition'] = f'attachment; filename="{file}.pdf"'
         return response
 
+    @action(detail=False,
+            methods=['get'],
+            permission_classes=[permissions.IsAuthenticated])
+    def feed(self, request):
+        """
+        Новые рецепты авторов из подписок, от свежих к старым,
+        с курсорной пагинацией, см. foodgram.feed.
+        """
+        paginator = FeedPagination()
+        size = paginator.get_page_size(request)
+        positions = feed.page(
+            request.user.id, size, paginator.decode_cursor(request)
+        )
+        recipes = self.get_queryset().in_bulk([pk for _, pk in positions])
+        page = [recipes[pk] for _, pk in positions if pk in recipes]
+        return paginator.get_paginated_response(
+            request, positions, self.serialize_list(page), size
+        )
+
+    @action(detail=False, methods=['get'])
+    def cookable(self, request):
+        """
+        Рецепты, которые можно приготовить из ?ingredients=:
+        сначала полностью, затем без одного-двух ингредиентов
+        (?max_missing=, по умолчанию 2).
+        """
+        params = CookableQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        ranked = self.paginate_queryset(cookable.search(
+            params.validated_data['ingredients'],
+            params.validated_data['max_missing']
+        ))
+        recipes = self.get_queryset().in_bulk(
+            [recipe for recipe, _ in ranked]
+        )
+        page = []
+        for recipe_id, missing in ranked:
+            recipe = recipes.get(recipe_id)
+            if recipe is not None:
+                recipe.missing_count = missing
+                page.append(recipe)
+        return self.get_paginated_response(self.serialize_list(
+            page, CookableRecipeSerializer, extra_fields=('missing_count', )
+        ))
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk):
+        """
+        Похожие рецепты по ингредиентам, тегам и совместному
+        избранному (?limit=), см. foodgram.similar.
+        """
+        params = SimilarQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        recipe = get_object_or_404(Recipe.objects.only('id'), pk=pk)
+        ranked = similar.neighbours(
+            recipe.id, settings.SIMILAR_RECIPES_MAX_LIMIT
+        )[:params.validated_data['limit']]
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _ in ranked]
+        )
+        page = []
+        for recipe_id, similarity in ranked:
+            recipe = recipes.get(recipe_id)
+            if recipe is not None:
+                recipe.similarity = similarity
+                page.append(recipe)
+        return Response(self.serialize_list(
+            page, SimilarRecipeSerializer, extra_fields=('similarity', )
+        ))
+
+    @action(detail=False,
+            methods=['get'],
+            permission_classes=[permissions.IsAuthenticated])
+    def shopping_cart_summary(self, request):
+        ingredients = ShoppingCartIngredient.objects.filter(
+            user=request.user
+        ).select_related('ingredient').order_by('ingredient__name')
+        serializer = ShoppingCartIngredientSerializer(ingredients, many=True)
+        return Response(serializer.data)
+
+    def change_recipe_list(self, request, recipe_list):
+        """
+        POST добавляет, DELETE удаляет рецепты {"recipes": [id, ...]}
+        одним запросом на изменение, см. foodgram.recipe_lists.
+        В ответе статус каждого рецепта.
+        """
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        change = (
+            recipe_list.add if request.method == 'POST'
+            else recipe_list.remove
+        )
+        results = change(
+            request.user.id, serializer.validated_data['recipes']
+        )
+        return Response({'results': RecipeListResultSerializer(
+            [{'id': recipe, 'status': result} for recipe, result in results],
+            many=True
+        ).data})
+
+    @action(detail=False,
+            methods=['post', 'delete'],
+            url_path='favorite',
+            permission_classes=[permissions.IsAuthenticated])
+    def favorites(self, request):
+        return self.change_recipe_list(request, recipe_lists.favorites)
+
+    @action(detail=False,
+            methods=['post', 'delete'],
+            permission_classes=[permissions.IsAuthenticated])
+    def shopping_cart(self, request):
+        return self.change_recipe_list(request, recipe_lists.shopping_cart)
+
+    @action(detail=False,
+            methods=['delete'],
+            url_path='shopping_cart/all',
+            permission_classes=[permissions.IsAuthenticated])
+    def clear_shopping_cart(self, request):
+        return Response({
+            'removed': recipe_lists.shopping_cart.clear(request.user.id)
+        })
+
 
 class ShoppingListAPI(APIView):
     permission_classes = (permissions.IsAuthenticated, )
@@ -83,16 +400,24 @@ class ShoppingListAPI(APIView):
             context={'request': request}
         )
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with transaction.atomic(), cart.maintained():
+            serializer.save()
+            cart.add_recipes(request.user.id, [serializer.instance.recipe_id])
+            counters.change_recipes(
+                counters.CART, [serializer.instance.recipe_id], 1
+            )
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete(self, request, id):
         user = request.user
         recipe = get_object_or_404(Recipe, id=id)
-        shopping_list_obj = ShoppingList.objects.filter(
-            user=user, recipe=recipe)
-        if shopping_list_obj.exists():
-            shopping_list_obj.delete()
+        with transaction.atomic(), cart.maintained():
+            deleted, _ = ShoppingList.objects.filter(
+                user=user, recipe=recipe).delete()
+            if deleted:
+                cart.remove_recipes(user.id, [recipe.id])
+                counters.change_recipes(counters.CART, [recipe.id], -1)
+        if deleted:
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(
             'Рецепт не был добавлен в список для покупок',
@@ -113,16 +438,22 @@ class FavouriteRecipeAPI(APIView):
             context={'request': request}
         )
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with transaction.atomic():
+            serializer.save()
+            counters.change_recipes(
+                counters.FAVORITES, [serializer.instance.recipe_id], 1
+            )
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete(self, request, id):
         user = request.user
         recipe = get_object_or_404(Recipe, id=id)
-        favourite_recipe_obj = FavouriteRecipe.objects.filter(
-            user=user, recipe=recipe)
-        if favourite_recipe_obj.exists():
-            favourite_recipe_obj.delete()
+        with transaction.atomic():
+            deleted, _ = FavouriteRecipe.objects.filter(
+                user=user, recipe=recipe).delete()
+            if deleted:
+                counters.change_recipes(counters.FAVORITES, [recipe.id], -1)
+        if deleted:
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(
             'Рецепта не было в избранном',
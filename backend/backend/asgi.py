@@ -0,0 +1,23 @@
+"""
+ASGI config for backend project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Read-heavy endpoints are served by async views, and streaming responses are
+read in a thread pool, see api.async_views.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
+"""
+
+import os
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+os.environ.setdefault('ASYNC_VIEWS', '1')
+
+django.setup(set_prefix=False)
+
+from api.async_views import ASGIHandler  # noqa: E402
+
+application = ASGIHandler()
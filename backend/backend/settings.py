@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -40,6 +41,45 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Сжатие ответов, см. api.compression. Типы содержимого и наименьший
+# размер тела в байтах; PDF и изображения уже сжаты.
+COMPRESSION_ENABLED = os.getenv('COMPRESSION_ENABLED', '1') == '1'
+COMPRESSION_CONTENT_TYPES = {
+    'application/json': 512,
+    'text/html': 1024,
+    'text/plain': 1024,
+    'text/csv': 1024,
+}
+COMPRESSION_ENCODINGS = ('br', 'gzip')
+# gzip сжимает GZipMiddleware Django с уровнем 6.
+COMPRESSION_LEVELS = {'br': 4}
+COMPRESSION_EXCLUDE_PATHS = ('/api/auth/', )
+
+if COMPRESSION_ENABLED:
+    MIDDLEWARE.insert(1, 'api.compression.CompressionMiddleware')
+
+INSTRUMENTATION_ENABLED = os.getenv('INSTRUMENTATION_ENABLED') == '1'
+INSTRUMENTATION_SERVER_TIMING = True
+INSTRUMENTATION_DUPLICATE_THRESHOLD = 3
+INSTRUMENTATION_METRICS_IPS = ('127.0.0.1', '::1')
+
+if INSTRUMENTATION_ENABLED:
+    MIDDLEWARE.insert(0, 'api.instrumentation.InstrumentationMiddleware')
+    LOGGING = {
+        'version': 1,
+        'disable_existing_loggers': False,
+        'handlers': {
+            'console': {'class': 'logging.StreamHandler'},
+        },
+        'loggers': {
+            'api.instrumentation': {
+                'handlers': ['console'],
+                'level': 'INFO',
+                'propagate': False,
+            },
+        },
+    }
+
 ROOT_URLCONF = 'backend.urls'
 
 TEMPLATES = [
@@ -60,6 +100,11 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'backend.wsgi.application'
 
+# Асинхронные представления для частых чтений, см. api.async_views.
+# Включаются в backend/asgi.py.
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS') == '1'
+ASYNC_VIEW_THREADS = int(os.getenv('ASYNC_VIEW_THREADS', 16))
+
 DATABASES = {
     'default': {
         'ENGINE': os.getenv('DB_ENGINE', 'django.db.backends.postgresql'),
@@ -103,13 +148,24 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static/')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+IMAGE_PROCESSING_ASYNC = True
+IMAGE_PROCESSING_WORKERS = 2
+IMAGE_THUMBNAILS_DIR = 'thumbs'
+IMAGE_THUMBNAIL_SIZES = {'small': 320, 'medium': 640, 'large': 1280}
+IMAGE_FORMAT = 'WEBP'
+IMAGE_QUALITY = 80
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.TokenAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.AllowAny',
-    )
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
 }
 
 DJOSER = {
@@ -126,6 +182,65 @@ DJOSER = {
     'HIDE_USERS': False
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Версии справочников и метки рецептов: общий для процессов кэш
+    # (memcached в infra/docker-compose.yml), см. foodgram.reference.
+    'reference': {
+        'BACKEND': os.getenv(
+            'REFERENCE_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('REFERENCE_CACHE_LOCATION', 'reference'),
+    },
+}
+
+REFERENCE_CACHE_ALIAS = 'reference'
+REFERENCE_CACHE_TIMEOUT = 60 * 60
+
+PAGINATION_COUNT_CACHE_TIMEOUT = 60
+
+# Списки админки считают строки не дальше этой границы,
+# см. foodgram.paginators.
+ADMIN_COUNT_LIMIT = 10000
+
+RECIPE_CACHE_TIMEOUT = 5 * 60
+
+# Списки рецептов (лента, подбор) без полей DRF,
+# см. api.fast_serializers.
+FAST_RECIPE_SERIALIZATION = True
+
+# Наибольшее число рецептов в пакетном изменении избранного и покупок.
+RECIPE_LIST_BATCH_SIZE = 100
+
+# Похожие рецепты, см. foodgram.similar: число по умолчанию и наибольшее,
+# файл индекса, который сохраняет команда build_similar_index. Файл
+# лежит во временном каталоге контейнера, общем для его процессов,
+# а не в коде проекта или в раздаваемом nginx media.
+SIMILAR_RECIPES_LIMIT = 10
+SIMILAR_RECIPES_MAX_LIMIT = 50
+SIMILAR_INDEX_FILE = os.getenv(
+    'SIMILAR_INDEX_FILE',
+    os.path.join(tempfile.gettempdir(), 'foodgram_similar_index.npz')
+)
+# Срок жизни индекса в процессе и файла индекса, с: build_similar_index
+# должна запускаться по расписанию чаще.
+SIMILAR_INDEX_TTL = int(os.getenv('SIMILAR_INDEX_TTL', 300))
+
+# Шрифт TrueType для выгрузки списка покупок в PDF (api.exporters),
+# без файла формат pdf недоступен.
+PDF_FONT_FILE = os.getenv(
+    'PDF_FONT_FILE', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+SEARCH_CONFIG = 'russian'
+
+FEED_CACHE_ALIAS = 'default'
+FEED_HEAD_SIZE = 60
+FEED_HEAD_TIMEOUT = 5 * 60
+
 CORS_ORIGIN_ALLOW_ALL = True
 CORS_URLS_REGEX = r'^/api/.*$'
 
@@ -1,3 +1,4 @@
+from api.instrumentation import metrics_view
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
@@ -9,6 +10,13 @@ urlpatterns = [
     path('api/', include('api.urls', namespace='api'))
 ]
 
+if settings.ASYNC_VIEWS:
+    from api.async_views import async_urlpatterns
+    urlpatterns.insert(0, path('api/', include(async_urlpatterns)))
+
+if settings.INSTRUMENTATION_ENABLED:
+    urlpatterns += [path('metrics/', metrics_view)]
+
 if settings.DEBUG:
     urlpatterns += static(
         settings.MEDIA_URL, document_root=settings.MEDIA_ROOT
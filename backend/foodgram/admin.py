@@ -1,7 +1,31 @@
 from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.db.models import Q
 
+from . import search
 from .models import (Amount, FavouriteRecipe, Ingredient, Recipe, ShoppingList,
-                     Tag)
+                     Tag, TagRecipe)
+from .paginators import EstimatedCountPaginator
+
+User = get_user_model()
+
+
+def find_user(search_term):
+    """id пользователя с таким именем или почтой"""
+    if not search_term:
+        return None
+    return User.objects.filter(
+        Q(username=search_term) | Q(email=search_term)
+    ).values_list('id', flat=True).first()
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Список без полного COUNT(*): число строк оценивается,
+    общее число объектов рядом с результатами поиска не выводится.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(Tag)
@@ -11,9 +35,8 @@ class TagAdmin(admin.ModelAdmin):
 
 
 @admin.register(Ingredient)
-class IngredientAdmin(admin.ModelAdmin):
+class IngredientAdmin(LargeTableAdmin):
     list_display = ('name', 'measurement_unit')
-    list_filter = ('name',)
     search_fields = ('^name', )
     ordering = ('name', )
 
@@ -21,29 +44,65 @@ class IngredientAdmin(admin.ModelAdmin):
 class AmountInLine(admin.TabularInline):
     model = Amount
     extra = 0
+    autocomplete_fields = ('ingredient', )
+
+
+class TagRecipeInLine(admin.TabularInline):
+    model = TagRecipe
+    extra = 0
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('author', 'name', 'favourite')
+class RecipeAdmin(LargeTableAdmin):
+    list_display = ('name', 'author', 'favourite', 'cart_count', 'pub_date')
+    list_select_related = ('author', )
     search_fields = ('name', )
-    list_filter = ('author', 'name', 'tags')
-    readonly_fields = ('favourite', )
-    filter_horizontal = ('tags',)
+    list_filter = ('tags', )
+    readonly_fields = ('favourite', 'cart_count')
+    autocomplete_fields = ('author', )
+    inlines = (AmountInLine, TagRecipeInLine)
+    ordering = ('-pub_date', '-id')
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Полнотекстовый поиск по рецептам. Если запрос - имя или почта
+        пользователя, выводятся рецепты этого автора.
+        """
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        author = find_user(search_term)
+        if author is not None:
+            return queryset.filter(author_id=author), False
+        return search.filter_queryset(queryset, search_term), False
 
     def favourite(self, obj):
-        return obj.favourite.all().count()
+        return obj.favorites_count
 
     favourite.short_description = 'Количество добавлений в избранное'
+    favourite.admin_order_field = 'favorites_count'
 
 
-@admin.register(ShoppingList)
-class ShoppingListAdmin(admin.ModelAdmin):
+class UserRecipeAdmin(LargeTableAdmin):
     list_display = ('user', 'recipe')
-    search_fields = ('user', )
+    list_select_related = ('user', 'recipe')
+    autocomplete_fields = ('user', 'recipe')
+    search_fields = ('^recipe__name', )
+    ordering = ('-id', )
+
+    def get_search_results(self, request, queryset, search_term):
+        """Строки пользователя по имени или почте, иначе по началу рецепта"""
+        user = find_user(search_term.strip())
+        if user is not None:
+            return queryset.filter(user_id=user), False
+        return super().get_search_results(request, queryset, search_term)
+
+
+@admin.register(ShoppingList)
+class ShoppingListAdmin(UserRecipeAdmin):
+    pass
 
 
 @admin.register(FavouriteRecipe)
-class FavouriteRecipeAdmin(admin.ModelAdmin):
-    list_display = ('user', 'recipe')
-    search_fields = ('user', 'recipe')
+class FavouriteRecipeAdmin(UserRecipeAdmin):
+    pass
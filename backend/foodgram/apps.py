@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class FoodgramConfig(AppConfig):
     name = 'foodgram'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
@@ -0,0 +1,110 @@
+"""
+Поиск ингредиентов по мере ввода.
+
+Индекс строится в памяти процесса из таблицы Ingredient: отсортированный
+список нормализованных названий для поиска по префиксу (bisect)
+и триграммный индекс для совпадений в середине названия. Сначала
+возвращаются совпадения по началу названия, затем остальные.
+Индекс перестраивается при смене версии ингредиентов в кэше
+справочных данных и не реже, чем раз в INDEX_TTL секунд.
+На PostgreSQL для поиска по началу названия в базе (name__istartswith,
+например в админке) миграция 0003 создаёт индекс PREFIX_INDEX_NAME.
+"""
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from threading import Lock
+
+from . import reference
+from .models import Ingredient
+
+INDEX_TTL = 300
+PREFIX_INDEX_NAME = 'ingredient_name_prefix_idx'
+
+_state = {'index': None}
+_lock = Lock()
+
+
+def normalize(value):
+    return value.casefold().replace('ё', 'е').strip()
+
+
+def trigrams(value):
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+class IngredientIndex:
+
+    def __init__(self, rows, version=None):
+        self.version = version
+        rows = sorted(rows, key=lambda row: (normalize(row[1]), row[0]))
+        self.keys = [normalize(name) for _, name, _ in rows]
+        self.items = [
+            {'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+            for pk, name, measurement_unit in rows
+        ]
+        self.trigrams = defaultdict(set)
+        for position, key in enumerate(self.keys):
+            for trigram in trigrams(key):
+                self.trigrams[trigram].add(position)
+        self.built_at = time.monotonic()
+
+    def prefix_positions(self, query):
+        position = bisect_left(self.keys, query)
+        while (position < len(self.keys)
+               and self.keys[position].startswith(query)):
+            yield position
+            position += 1
+
+    def contains_positions(self, query):
+        if len(query) < 3:
+            return []
+        postings = sorted(
+            (self.trigrams.get(trigram, set()) for trigram in trigrams(query)),
+            key=len
+        )
+        candidates = set.intersection(*postings)
+        return sorted(
+            (position for position in candidates
+             if not self.keys[position].startswith(query)
+             and query in self.keys[position]),
+            key=lambda position: (self.keys[position].find(query), position)
+        )
+
+    def search(self, query, limit=None):
+        query = normalize(query)
+        if not query:
+            return self.items[:limit]
+        positions = list(self.prefix_positions(query))
+        if limit is None or len(positions) < limit:
+            positions += self.contains_positions(query)
+        return [self.items[position] for position in positions[:limit]]
+
+
+def is_stale(index, version):
+    return (
+        index is None
+        or index.version != version
+        or time.monotonic() - index.built_at > INDEX_TTL
+    )
+
+
+def get_index():
+    version = reference.get_version(reference.INGREDIENTS)
+    with _lock:
+        if is_stale(_state['index'], version):
+            _state['index'] = IngredientIndex(
+                Ingredient.objects.values_list(
+                    'id', 'name', 'measurement_unit'
+                ).iterator(),
+                version
+            )
+        return _state['index']
+
+
+def invalidate():
+    _state['index'] = None
+
+
+def search(query, limit=None):
+    return get_index().search(query, limit)
@@ -0,0 +1,226 @@
+"""
+Инкрементальное обслуживание агрегата списка покупок.
+
+ShoppingCartIngredient хранит для пользователя сумму количеств каждого
+ингредиента по рецептам из его списка покупок, поэтому выгрузка списка
+читает готовые строки вместо GROUP BY по Amount. Изменения описываются
+словарём {(user_id, ingredient_id): [amount, recipes_count]}.
+
+API переносит свои изменения в агрегат сам, внутри maintained().
+Остальные изменения Amount и ShoppingList (админка, Recipe.delete(),
+каскадное удаление пользователя или ингредиента) приходят сигналами:
+агрегат затронутых пользователей пересчитывается после фиксации
+транзакции, один раз на транзакцию.
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from .models import Amount, ShoppingCartIngredient, ShoppingList
+from .transactions import after_commit
+
+User = get_user_model()
+
+BATCH_SIZE = 1000
+
+_local = threading.local()
+
+
+def new_deltas():
+    return defaultdict(lambda: [0, 0])
+
+
+@transaction.atomic
+def apply_deltas(deltas):
+    """
+    Применяет изменения к агрегату. Строки пользователей блокируются,
+    чтобы параллельные изменения одного списка шли последовательно.
+    """
+    deltas = {key: value for key, value in deltas.items() if any(value)}
+    if not deltas:
+        return
+    users = sorted({user for user, _ in deltas})
+    list(User.objects.select_for_update().filter(
+        id__in=users).order_by('id').values_list('id', flat=True))
+    existing = {
+        (row.user_id, row.ingredient_id): row
+        for row in ShoppingCartIngredient.objects.filter(
+            user_id__in=users,
+            ingredient_id__in={ingredient for _, ingredient in deltas}
+        )
+    }
+    to_create, to_update, to_delete = [], [], []
+    for (user, ingredient), (amount, count) in deltas.items():
+        row = existing.get((user, ingredient))
+        if row is None:
+            if count > 0:
+                to_create.append(ShoppingCartIngredient(
+                    user_id=user, ingredient_id=ingredient,
+                    amount=amount, recipes_count=count
+                ))
+            continue
+        row.amount += amount
+        row.recipes_count += count
+        if row.recipes_count > 0:
+            to_update.append(row)
+        else:
+            to_delete.append(row.id)
+    ShoppingCartIngredient.objects.bulk_create(to_create, BATCH_SIZE)
+    ShoppingCartIngredient.objects.bulk_update(
+        to_update, ('amount', 'recipes_count'), BATCH_SIZE
+    )
+    ShoppingCartIngredient.objects.filter(id__in=to_delete).delete()
+
+
+def recipe_deltas(pairs, sign):
+    """
+    Изменения при добавлении (sign=1) или удалении (sign=-1)
+    пар (user_id, recipe_id) из списков покупок.
+    """
+    users_by_recipe = defaultdict(list)
+    for user, recipe in pairs:
+        users_by_recipe[recipe].append(user)
+    deltas = new_deltas()
+    amounts = Amount.objects.filter(
+        recipe_id__in=users_by_recipe
+    ).values_list('recipe_id', 'ingredient_id', 'amount')
+    for recipe, ingredient, amount in amounts:
+        for user in users_by_recipe[recipe]:
+            delta = deltas[user, ingredient]
+            delta[0] += sign * amount
+            delta[1] += sign
+    return deltas
+
+
+def add_recipes(user_id, recipe_ids):
+    apply_deltas(recipe_deltas(
+        ((user_id, recipe) for recipe in recipe_ids), 1
+    ))
+
+
+def remove_recipes(user_id, recipe_ids):
+    apply_deltas(recipe_deltas(
+        ((user_id, recipe) for recipe in recipe_ids), -1
+    ))
+
+
+def remove_recipe(recipe):
+    """Убирает рецепт из агрегатов всех пользователей перед удалением"""
+    apply_deltas(recipe_deltas(
+        ShoppingList.objects.filter(
+            recipe=recipe).values_list('user_id', 'recipe_id'),
+        -1
+    ))
+
+
+def change_recipe(recipe, old_amounts, new_amounts):
+    """
+    Переносит изменение состава рецепта в агрегаты пользователей,
+    у которых он в списке покупок. old_amounts и new_amounts -
+    пары (ingredient_id, amount).
+    """
+    users = list(ShoppingList.objects.filter(
+        recipe=recipe).values_list('user_id', flat=True))
+    if not users:
+        return
+    change = new_deltas()
+    for sign, amounts in ((-1, old_amounts), (1, new_amounts)):
+        for ingredient, amount in amounts:
+            change[ingredient][0] += sign * amount
+            change[ingredient][1] += sign
+    apply_deltas({
+        (user, ingredient): list(delta)
+        for user in users
+        for ingredient, delta in change.items()
+    })
+
+
+def filter_users(queryset, users):
+    if users is None:
+        return queryset.all()
+    return queryset.filter(user_id__in=users)
+
+
+def live_totals(users=None):
+    """Агрегат, посчитанный GROUP BY по текущим спискам покупок"""
+    rows = filter_users(ShoppingList.objects, users).filter(
+        recipe__amount__isnull=False
+    ).values('user_id', 'recipe__amount__ingredient_id').annotate(
+        amount=Sum('recipe__amount__amount'),
+        recipes_count=Count('recipe__amount')
+    ).values_list(
+        'user_id', 'recipe__amount__ingredient_id', 'amount', 'recipes_count'
+    )
+    return {
+        (user, ingredient): (amount, count)
+        for user, ingredient, amount, count in rows
+    }
+
+
+def stored_totals(users=None):
+    rows = filter_users(ShoppingCartIngredient.objects, users).values_list(
+        'user_id', 'ingredient_id', 'amount', 'recipes_count'
+    )
+    return {
+        (user, ingredient): (amount, count)
+        for user, ingredient, amount, count in rows
+    }
+
+
+def diff(users=None):
+    """Расхождения агрегата: {(user_id, ingredient_id): (stored, live)}"""
+    stored = stored_totals(users)
+    live = live_totals(users)
+    return {
+        key: (stored.get(key), live.get(key))
+        for key in stored.keys() | live.keys()
+        if stored.get(key) != live.get(key)
+    }
+
+
+@transaction.atomic
+def rebuild(users=None):
+    live = live_totals(users)
+    filter_users(ShoppingCartIngredient.objects, users).delete()
+    ShoppingCartIngredient.objects.bulk_create(
+        (ShoppingCartIngredient(
+            user_id=user, ingredient_id=ingredient,
+            amount=amount, recipes_count=count
+        ) for (user, ingredient), (amount, count) in live.items()),
+        BATCH_SIZE
+    )
+    return len(live)
+
+
+@contextmanager
+def maintained():
+    """Изменения в блоке переносит в агрегат вызывающий код"""
+    _local.depth = getattr(_local, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        _local.depth -= 1
+
+
+def rebuild_affected(user_ids=(), recipe_ids=()):
+    users = set(user_ids)
+    if recipe_ids:
+        users.update(ShoppingList.objects.filter(
+            recipe_id__in=recipe_ids).values_list('user_id', flat=True))
+    if users:
+        rebuild(users)
+
+
+def schedule(user_ids=(), recipe_ids=()):
+    """
+    Пересчитывает после фиксации транзакции агрегат пользователей
+    и тех, у кого рецепты recipe_ids в списке покупок.
+    """
+    if not getattr(_local, 'depth', 0):
+        after_commit(
+            rebuild_affected, user_ids=user_ids, recipe_ids=recipe_ids
+        )
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_reference_cache(app_configs, **kwargs):
+    """
+    Версии справочников и метки рецептов меняет тот процесс, который
+    изменил данные: в памяти процесса остальные их не увидят
+    """
+    alias = settings.REFERENCE_CACHE_ALIAS
+    backend = settings.CACHES[alias]['BACKEND']
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Error(
+        f'Кэш {alias!r} ({backend}) не общий для процессов',
+        hint='Задайте REFERENCE_CACHE_BACKEND и REFERENCE_CACHE_LOCATION, '
+             'например memcached (см. README)',
+        id='foodgram.E001',
+    )]
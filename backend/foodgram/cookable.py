@@ -0,0 +1,171 @@
+"""
+Подбор рецептов по имеющимся ингредиентам.
+
+Индекс хранится в памяти процесса в массивах NumPy: для каждого
+ингредиента - отсортированный массив позиций рецептов, в которые он
+входит (CSR: indptr по id ингредиента и postings), и число
+ингредиентов каждого рецепта. Запрос объединяет posting-списки
+имеющихся ингредиентов и считает совпадения по рецептам, поэтому
+рецепты без совпадений не просматриваются вовсе.
+
+Изменения рецептов копятся в overrides ({recipe_id: ингредиенты или
+None для удалённого}) и учитываются поверх массивов; после
+MAX_OVERRIDES изменений или INDEX_TTL секунд индекс перестраивается.
+Изменения, сделанные в других процессах, видны после перестройки.
+"""
+import time
+from threading import Lock
+
+import numpy as np
+
+from .models import Amount
+from .transactions import after_commit
+
+INDEX_TTL = 300
+MAX_OVERRIDES = 1000
+SPARSE_RATIO = 16
+
+_state = {'index': None}
+_lock = Lock()
+
+
+class CookableIndex:
+
+    def __init__(self, recipe_ids, ingredient_ids):
+        """
+        recipe_ids и ingredient_ids - параллельные массивы пар
+        (рецепт, ингредиент) из Amount.
+        """
+        recipe_ids = np.asarray(recipe_ids, dtype=np.int64)
+        ingredient_ids = np.asarray(ingredient_ids, dtype=np.int64)
+        self.recipe_ids, positions = np.unique(
+            recipe_ids, return_inverse=True
+        )
+        order = np.lexsort((positions, ingredient_ids))
+        ingredients, positions = ingredient_ids[order], positions[order]
+        unique = np.ones(len(order), dtype=bool)
+        unique[1:] = (np.diff(ingredients) != 0) | (np.diff(positions) != 0)
+        ingredients, positions = ingredients[unique], positions[unique]
+        self.sizes = np.bincount(positions, minlength=len(self.recipe_ids))
+        size = int(ingredients.max()) + 2 if len(ingredients) else 1
+        self.indptr = np.zeros(size, dtype=np.int64)
+        np.cumsum(np.bincount(ingredients, minlength=size - 1),
+                  out=self.indptr[1:])
+        self.postings = positions.astype(np.int32)
+        self.overrides = {}
+        self.built_at = time.monotonic()
+
+    def postings_of(self, ingredient):
+        if not 0 <= ingredient < len(self.indptr) - 1:
+            return self.postings[:0]
+        return self.postings[self.indptr[ingredient]:
+                             self.indptr[ingredient + 1]]
+
+    def base_matches(self, owned, max_missing):
+        """
+        Позиции рецептов с совпадениями, которым не хватает не больше
+        max_missing ингредиентов, и число совпадений.
+        """
+        postings = [self.postings_of(ingredient) for ingredient in owned]
+        postings = np.concatenate(postings) if postings else self.postings[:0]
+        if len(postings) * SPARSE_RATIO < len(self.sizes):
+            positions, hits = np.unique(postings, return_counts=True)
+        else:
+            # Длинные списки дешевле посчитать плотным массивом.
+            hits = np.bincount(postings, minlength=len(self.sizes))
+            positions = np.flatnonzero(hits >= self.sizes - max_missing)
+            positions = positions[hits[positions] > 0]
+            hits = hits[positions]
+        return positions, hits
+
+    def search(self, owned, max_missing=2):
+        """
+        Рецепты, для которых не хватает не больше max_missing
+        ингредиентов и есть хотя бы одно совпадение:
+        [(recipe_id, missing)] по возрастанию missing, затем по
+        убыванию числа ингредиентов и id.
+        """
+        owned = set(owned)
+        overrides = self.overrides
+        positions, hits = self.base_matches(owned, max_missing)
+        missing = self.sizes[positions] - hits
+        keep = missing <= max_missing
+        recipes = self.recipe_ids[positions[keep]]
+        missing = missing[keep]
+        sizes = self.sizes[positions[keep]]
+        if overrides:
+            stale = np.isin(
+                recipes, np.fromiter(overrides, dtype=np.int64)
+            )
+            recipes, missing, sizes = (
+                recipes[~stale], missing[~stale], sizes[~stale]
+            )
+            extra = [
+                (recipe, len(ingredients - owned), len(ingredients))
+                for recipe, ingredients in overrides.items()
+                if ingredients and ingredients & owned
+                and len(ingredients - owned) <= max_missing
+            ]
+            if extra:
+                extra_recipes, extra_missing, extra_sizes = zip(*extra)
+                recipes = np.concatenate([recipes, extra_recipes])
+                missing = np.concatenate([missing, extra_missing])
+                sizes = np.concatenate([sizes, extra_sizes])
+        order = np.lexsort((-recipes, -sizes, missing))
+        return list(zip(recipes[order].tolist(), missing[order].tolist()))
+
+    def update(self, recipe_id, ingredients):
+        """Новый состав рецепта, None - рецепт удалён"""
+        # Словарь заменяется целиком: поиск идёт без блокировки.
+        self.overrides = {
+            **self.overrides,
+            recipe_id: None if ingredients is None else frozenset(ingredients)
+        }
+
+
+def load():
+    pairs = Amount.objects.values_list('recipe_id', 'ingredient_id')
+    rows = np.fromiter(
+        (value for pair in pairs.iterator() for value in pair),
+        dtype=np.int64
+    ).reshape(-1, 2)
+    return CookableIndex(rows[:, 0], rows[:, 1])
+
+
+def is_stale(index):
+    return (
+        index is None
+        or len(index.overrides) > MAX_OVERRIDES
+        or time.monotonic() - index.built_at > INDEX_TTL
+    )
+
+
+def get_index():
+    with _lock:
+        if is_stale(_state['index']):
+            _state['index'] = load()
+        return _state['index']
+
+
+def apply_changes(recipe_ids):
+    index = _state['index']
+    if index is None:
+        return
+    ingredients = {recipe: set() for recipe in recipe_ids}
+    for recipe, ingredient in Amount.objects.filter(
+            recipe_id__in=recipe_ids
+    ).values_list('recipe_id', 'ingredient_id'):
+        ingredients[recipe].add(ingredient)
+    with _lock:
+        for recipe, owned in ingredients.items():
+            index.update(recipe, owned or None)
+
+
+def schedule(recipe_ids):
+    """Переносит состав рецептов в индекс после фиксации транзакции"""
+    if _state['index'] is not None:
+        after_commit(apply_changes, recipe_ids=recipe_ids)
+
+
+def search(owned, max_missing=2):
+    return get_index().search(owned, max_missing)
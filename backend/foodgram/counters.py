@@ -0,0 +1,117 @@
+"""
+Денормализованные счётчики.
+
+Recipe.favorites_count и Recipe.cart_count - сколько раз рецепт добавлен
+в избранное и в списки покупок, AuthorStats.recipes_count - сколько
+рецептов у автора. Изменения выполняются как UPDATE ... SET x = x + n
+в транзакции изменения данных, поэтому параллельные запросы не теряют
+приращения. Расхождения (правки в админке, каскадное удаление
+пользователей) исправляет команда reconcile_counters.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, Value
+from django.db.models.functions import Greatest
+from users.models import AuthorStats
+
+from . import versions
+from .models import Recipe
+
+User = get_user_model()
+
+FAVORITES = 'favorites_count'
+CART = 'cart_count'
+
+BATCH_SIZE = 1000
+
+
+def shifted(field, delta):
+    if delta < 0:
+        return Greatest(F(field) + delta, Value(0))
+    return F(field) + delta
+
+
+def change_recipes(field, recipe_ids, delta):
+    """Меняет счётчик field рецептов recipe_ids на delta"""
+    recipe_ids = list(recipe_ids)
+    if not delta or not recipe_ids:
+        return
+    Recipe.objects.filter(id__in=recipe_ids).update(
+        **{field: shifted(field, delta)}
+    )
+    versions.touch(versions.POPULARITY)
+
+
+def change_author(author_id, delta):
+    """
+    Меняет число рецептов автора. Вызывается после сохранения
+    или удаления рецепта: если строки счётчика ещё нет,
+    она создаётся с точным значением.
+    """
+    if AuthorStats.objects.filter(user_id=author_id).update(
+            recipes_count=shifted('recipes_count', delta)):
+        return
+    AuthorStats.objects.bulk_create([AuthorStats(
+        user_id=author_id,
+        recipes_count=Recipe.objects.filter(author_id=author_id).count()
+    )], ignore_conflicts=True)
+
+
+def recipe_drift():
+    """Рецепты, у которых счётчики расходятся с данными"""
+    rows = Recipe.objects.annotate(
+        favorites=Count('favourite', distinct=True),
+        cart=Count('shopping', distinct=True)
+    ).values_list(
+        'id', 'favorites_count', 'favorites', 'cart_count', 'cart'
+    ).order_by()
+    return {
+        recipe: {FAVORITES: (stored_favorites, favorites),
+                 CART: (stored_cart, cart)}
+        for recipe, stored_favorites, favorites, stored_cart, cart
+        in rows.iterator()
+        if stored_favorites != favorites or stored_cart != cart
+    }
+
+
+def author_drift():
+    """Авторы, у которых число рецептов расходится с данными"""
+    rows = User.objects.annotate(
+        recipes_total=Count('recipes')
+    ).values_list('id', 'stats__recipes_count', 'recipes_total').order_by()
+    return {
+        author: (stored, total)
+        for author, stored, total in rows.iterator()
+        if (stored or 0) != total
+    }
+
+
+def reconcile():
+    """Исправляет расхождения, возвращает число исправленных строк"""
+    recipes = recipe_drift()
+    Recipe.objects.bulk_update(
+        [
+            Recipe(id=recipe, favorites_count=values[FAVORITES][1],
+                   cart_count=values[CART][1])
+            for recipe, values in recipes.items()
+        ],
+        (FAVORITES, CART),
+        BATCH_SIZE
+    )
+    if recipes:
+        versions.touch(versions.POPULARITY)
+    authors = author_drift()
+    existing = set(AuthorStats.objects.filter(
+        user_id__in=authors).values_list('user_id', flat=True))
+    stats = [
+        AuthorStats(user_id=author, recipes_count=total)
+        for author, (_, total) in authors.items()
+    ]
+    AuthorStats.objects.bulk_create(
+        [row for row in stats if row.user_id not in existing], BATCH_SIZE
+    )
+    AuthorStats.objects.bulk_update(
+        [row for row in stats if row.user_id in existing],
+        ('recipes_count', ),
+        BATCH_SIZE
+    )
+    return len(recipes) + len(authors)
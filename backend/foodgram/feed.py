@@ -0,0 +1,136 @@
+"""
+Лента новых рецептов авторов, на которых подписан пользователь.
+
+Рецепты каждого автора - отдельный поток в порядке (-pub_date, -id)
+по индексу recipe_author_date_idx. Страница собирается слиянием
+потоков (heapq.merge) за два запроса независимо от числа подписок:
+сначала по одному, самому свежему до курсора, рецепту каждого автора,
+затем по size рецептов только тех авторов, чьи свежие рецепты
+не старше size-го из них: рецепты остальных авторов старше этих
+size рецептов и в страницу не попадут.
+
+Начало ленты (FEED_HEAD_SIZE позиций) может храниться в кэше
+FEED_CACHE_ALIAS: новый рецепт автора добавляется в закэшированные
+начала лент подписчиков, изменение подписок или удаление рецепта
+сбрасывает их.
+"""
+import heapq
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.dateparse import parse_datetime
+from users.models import Subscription
+
+from .queries import latest_recipes_by_author
+
+# Для слияния потоков нужна только позиция рецепта.
+POSITION_FIELDS = ('id', 'author_id', 'pub_date')
+
+
+def position(recipe):
+    return recipe.pub_date, recipe.id
+
+
+def get_cache():
+    return caches[settings.FEED_CACHE_ALIAS]
+
+
+def head_key(user_id):
+    return f'feed:head:{user_id}'
+
+
+def followed_authors(user_id):
+    return list(Subscription.objects.filter(
+        user_id=user_id).values_list('author_id', flat=True))
+
+
+def merge(author_ids, size, before=None):
+    """size самых свежих рецептов авторов строго раньше before"""
+    heads = latest_recipes_by_author(
+        author_ids, 1, before=before, fields=POSITION_FIELDS
+    )
+    newest = heapq.nlargest(
+        size, (recipes[0] for recipes in heads.values()), key=position
+    )
+    if not newest:
+        return []
+    # Если авторов меньше size, страница может уйти ниже их свежих рецептов.
+    since = position(newest[-1]) if len(newest) == size else None
+    streams = latest_recipes_by_author(
+        {recipe.author_id for recipe in newest}, size,
+        before=before, since=since, fields=POSITION_FIELDS
+    )
+    return list(heapq.merge(
+        *streams.values(), key=position, reverse=True
+    ))[:size]
+
+
+def dump(recipes):
+    return [(recipe.pub_date.isoformat(), recipe.id) for recipe in recipes]
+
+
+def load(entries):
+    return [(parse_datetime(pub_date), pk) for pub_date, pk in entries]
+
+
+def head_positions(user_id):
+    """
+    Начало ленты из кэша: [(pub_date, id)]. При промахе собирается
+    слиянием и кэшируется.
+    """
+    cache = get_cache()
+    entries = cache.get(head_key(user_id))
+    if entries is None:
+        entries = dump(merge(
+            followed_authors(user_id), settings.FEED_HEAD_SIZE
+        ))
+        cache.set(head_key(user_id), entries, settings.FEED_HEAD_TIMEOUT)
+    return load(entries)
+
+
+def page(user_id, size, before=None):
+    """
+    Страница ленты: [(pub_date, id)] не длиннее size.
+    Первые страницы берутся из начала ленты в кэше, пока его хватает.
+    """
+    if settings.FEED_HEAD_SIZE:
+        head = head_positions(user_id)
+        # Короткое начало ленты - это вся лента.
+        complete = len(head) < settings.FEED_HEAD_SIZE
+        if before is not None:
+            head = [entry for entry in head if entry < before]
+        if len(head) >= size or complete:
+            return head[:size]
+    return [
+        position(recipe)
+        for recipe in merge(followed_authors(user_id), size, before)
+    ]
+
+
+def add_recipe(recipe):
+    """Добавляет новый рецепт в закэшированные начала лент подписчиков"""
+    if not settings.FEED_HEAD_SIZE:
+        return
+    cache = get_cache()
+    keys = [
+        head_key(user_id)
+        for user_id in Subscription.objects.filter(
+            author_id=recipe.author_id).values_list('user_id', flat=True)
+    ]
+    entry = (recipe.pub_date.isoformat(), recipe.id)
+    cache.set_many({
+        key: [entry, *entries][:settings.FEED_HEAD_SIZE]
+        for key, entries in cache.get_many(keys).items()
+    }, settings.FEED_HEAD_TIMEOUT)
+
+
+def reset_followers(author_id):
+    get_cache().delete_many([
+        head_key(user_id)
+        for user_id in Subscription.objects.filter(
+            author_id=author_id).values_list('user_id', flat=True)
+    ])
+
+
+def reset(user_id):
+    get_cache().delete(head_key(user_id))
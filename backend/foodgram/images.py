@@ -0,0 +1,128 @@
+"""
+Обработка изображений рецептов вне потока запроса.
+
+После сохранения рецепта изображение уходит в пул потоков, где для
+каждого размера из IMAGE_THUMBNAIL_SIZES создаётся перекодированная
+копия с ограничением качества IMAGE_QUALITY. Имя обработанного
+изображения записывается в Recipe.thumbnails_image, и ссылки на копии
+строятся без обращения к хранилищу; пока копий нет (или изображение
+заменено), списки отдают ссылку на оригинал. Копии заменённого или
+удалённого изображения удаляются, если его не использует другой рецепт.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from . import versions
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+_executor = {}
+
+
+def get_executor():
+    if 'pool' not in _executor:
+        _executor['pool'] = ThreadPoolExecutor(
+            settings.IMAGE_PROCESSING_WORKERS, thread_name_prefix='images'
+        )
+    return _executor['pool']
+
+
+def pooled(func, *args):
+    try:
+        return func(*args)
+    finally:
+        # В потоках пула нет request_finished, соединения закрываем сами.
+        close_old_connections()
+
+
+def thumbnail_name(name, size):
+    # Путь оригинала целиком: одинаковые имена в разных каталогах
+    # не должны давать одну копию.
+    base = os.path.splitext(name)[0]
+    extension = settings.IMAGE_FORMAT.lower()
+    return f'{settings.IMAGE_THUMBNAILS_DIR}/{base}_{size}.{extension}'
+
+
+def make_thumbnails(name):
+    with default_storage.open(name, 'rb') as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+    if settings.IMAGE_FORMAT == 'JPEG' or image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGB')
+    for size, width in settings.IMAGE_THUMBNAIL_SIZES.items():
+        thumbnail = image.copy()
+        thumbnail.thumbnail((width, width))
+        buffer = BytesIO()
+        thumbnail.save(buffer, settings.IMAGE_FORMAT,
+                       quality=settings.IMAGE_QUALITY)
+        target = thumbnail_name(name, size)
+        if default_storage.exists(target):
+            default_storage.delete(target)
+        default_storage.save(target, ContentFile(buffer.getvalue()))
+
+
+def mark_processed(name):
+    """Отмечает рецепты с изображением name: копии готовы"""
+    recipes = Recipe.objects.filter(image=name)
+    pks = list(recipes.values_list('pk', flat=True))
+    recipes.update(thumbnails_image=name)
+    versions.touch(versions.RECIPES, *map(versions.recipe, pks))
+
+
+def process(name):
+    try:
+        make_thumbnails(name)
+        mark_processed(name)
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s', name)
+
+
+def remove_thumbnails(name):
+    """Удаляет копии изображения name, если его не использует рецепт"""
+    try:
+        if Recipe.objects.filter(image=name).exists():
+            return
+        for size in settings.IMAGE_THUMBNAIL_SIZES:
+            default_storage.delete(thumbnail_name(name, size))
+    except Exception:
+        logger.exception('Не удалось удалить копии изображения %s', name)
+
+
+def run_after_commit(func, name):
+    if not name:
+        return
+    if settings.IMAGE_PROCESSING_ASYNC:
+        transaction.on_commit(
+            lambda: get_executor().submit(pooled, func, name)
+        )
+    else:
+        transaction.on_commit(lambda: func(name))
+
+
+def schedule(name):
+    """Запускает обработку после фиксации транзакции"""
+    run_after_commit(process, name)
+
+
+def discard(name):
+    """Удаляет копии заменённого изображения после фиксации транзакции"""
+    run_after_commit(remove_thumbnails, name)
+
+
+def thumbnail_urls(recipe, request=None):
+    image = recipe.image
+    ready = recipe.thumbnails_image == image.name
+    urls = {}
+    for size in settings.IMAGE_THUMBNAIL_SIZES:
+        url = default_storage.url(
+            thumbnail_name(image.name, size)) if ready else image.url
+        urls[size] = request.build_absolute_uri(url) if request else url
+    return urls
@@ -0,0 +1,111 @@
+"""
+Подготовка существующих данных к ограничениям модели.
+
+Миграция 0002 перед добавлением ограничений (0003) удаляет строки,
+которые не дадут их применить: связи тегов без рецепта или тега (раньше
+внешние ключи были SET_NULL) и повторы пар рецепт-тег. Повторы
+ингредиента (название и единица измерения) сводятся к первому,
+повторы ингредиента в рецепте объединяются в одну строку с суммарным
+количеством. Команда remove_constraint_conflicts делает то же вручную
+(с --check только сообщает, что будет исправлено); если таблица
+агрегата списков покупок уже есть, он пересчитывается для затронутых
+пользователей.
+"""
+from django.apps import apps as global_apps
+from django.db import connections, transaction
+from django.db.migrations.loader import MigrationLoader
+from django.db.models import Count, Min, Q, Sum
+
+from . import cart
+
+
+def duplicates(queryset, fields):
+    """Группы повторов: (значения fields, id первой строки, агрегаты)"""
+    return queryset.values(*fields).annotate(
+        first=Min('id'), rows=Count('id')
+    ).filter(rows__gt=1).order_by()
+
+
+def remove_tag_conflicts(using, apps):
+    queryset = apps.get_model('foodgram', 'TagRecipe').objects.using(using)
+    removed, _ = queryset.filter(
+        Q(recipe__isnull=True) | Q(tag__isnull=True)
+    ).delete()
+    for group in duplicates(queryset, ('recipe_id', 'tag_id')):
+        removed += queryset.filter(
+            recipe_id=group['recipe_id'], tag_id=group['tag_id']
+        ).exclude(id=group['first']).delete()[0]
+    return removed
+
+
+def merge_ingredients(using, apps):
+    """Повторы ингредиента заменяются в рецептах первым из них"""
+    ingredients = apps.get_model(
+        'foodgram', 'Ingredient').objects.using(using)
+    amounts = apps.get_model('foodgram', 'Amount').objects.using(using)
+    merged = 0
+    for group in duplicates(ingredients, ('name', 'measurement_unit')):
+        extra = ingredients.filter(
+            name=group['name'], measurement_unit=group['measurement_unit']
+        ).exclude(id=group['first'])
+        amounts.filter(ingredient__in=extra).update(
+            ingredient_id=group['first']
+        )
+        merged += extra.delete()[0]
+    return merged
+
+
+def has_table(apps, name, tables):
+    try:
+        model = apps.get_model('foodgram', name)
+    except LookupError:
+        return False
+    return model._meta.db_table in tables
+
+
+def merge_amounts(using, apps, tables):
+    queryset = apps.get_model('foodgram', 'Amount').objects.using(using)
+    recipes = set()
+    groups = duplicates(queryset, ('recipe_id', 'ingredient_id')).annotate(
+        total=Sum('amount')
+    )
+    for group in groups:
+        queryset.filter(id=group['first']).update(amount=group['total'])
+        queryset.filter(
+            recipe_id=group['recipe_id'],
+            ingredient_id=group['ingredient_id']
+        ).exclude(id=group['first']).delete()
+        recipes.add(group['recipe_id'])
+    if recipes and has_table(apps, 'ShoppingCartIngredient', tables):
+        shopping_lists = apps.get_model('foodgram', 'ShoppingList')
+        cart.rebuild(set(shopping_lists.objects.using(using).filter(
+            recipe_id__in=recipes).values_list('user_id', flat=True)))
+    return len(recipes)
+
+
+def applied_apps(using):
+    """Модели в том виде, в каком они есть в базе после её миграций"""
+    loader = MigrationLoader(connections[using])
+    return loader.project_state(
+        [key for key in loader.applied_migrations if key in loader.graph.nodes]
+    ).apps
+
+
+def remove_conflicts(using, dry_run=False, apps=global_apps):
+    """
+    Возвращает число удалённых связей тегов, лишних ингредиентов
+    и исправленных рецептов. С dry_run изменения откатываются.
+    apps - реестр моделей, в миграции исторический
+    """
+    connection = connections[using]
+    tables = set(connection.introspection.table_names())
+    removed = ingredients = merged = 0
+    with transaction.atomic(using):
+        if has_table(apps, 'TagRecipe', tables):
+            removed = remove_tag_conflicts(using, apps)
+        if has_table(apps, 'Amount', tables):
+            ingredients = merge_ingredients(using, apps)
+            merged = merge_amounts(using, apps, tables)
+        if dry_run:
+            transaction.set_rollback(True, using)
+    return removed, ingredients, merged
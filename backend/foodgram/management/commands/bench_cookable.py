@@ -0,0 +1,116 @@
+import json
+import random
+import time
+
+import numpy as np
+from api.benchmarks import (create_ingredients, create_recipes, create_users,
+                            measure, rollback)
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, Q
+from foodgram import cookable
+from foodgram.models import Recipe
+
+
+class Command(BaseCommand):
+    """
+    Замеряем подбор рецептов по ингредиентам: индекс NumPy на
+    синтетических данных и, по желанию, GROUP BY по Amount в базе
+    """
+    help = 'benchmark the "what can I cook" ingredient matching'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=1000000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--per-recipe', type=int, default=8)
+        parser.add_argument('--owned', type=int, default=12)
+        parser.add_argument('--max-missing', type=int, default=2)
+        parser.add_argument('--repeat', type=int, default=100)
+        parser.add_argument('--sql-recipes', type=int, default=0,
+                            help='also compare with SQL on this many '
+                                 'recipes created in the database')
+
+    def popularity(self, count):
+        # Частота ингредиентов убывает по закону Ципфа: соль и лук
+        # встречаются в рецептах гораздо чаще шафрана.
+        weights = 1 / np.arange(1, count + 1) ** 0.9
+        return weights / weights.sum()
+
+    def owned_sets(self, ingredients, weights, options):
+        rng = np.random.default_rng(0)
+        return [
+            set(rng.choice(ingredients, size=options['owned'],
+                           p=weights, replace=False).tolist())
+            for _ in range(options['repeat'])
+        ]
+
+    def run(self, search, queries):
+        queries = iter(queries)
+        return lambda: search(next(queries))
+
+    def synthetic(self, options):
+        rng = np.random.default_rng(0)
+        ingredients = np.arange(1, options['ingredients'] + 1)
+        weights = self.popularity(options['ingredients'])
+        recipe_ids = np.repeat(
+            np.arange(1, options['recipes'] + 1), options['per_recipe']
+        )
+        ingredient_ids = rng.choice(
+            ingredients, size=len(recipe_ids), p=weights
+        )
+        start = time.perf_counter()
+        index = cookable.CookableIndex(recipe_ids, ingredient_ids)
+        build = round((time.perf_counter() - start) * 1000, 3)
+        queries = self.owned_sets(ingredients, weights, options)
+        return {
+            'recipes': options['recipes'],
+            'index_build_ms': build,
+            'index_ms': measure(self.run(
+                lambda owned: index.search(owned, options['max_missing']),
+                queries
+            ), options['repeat']),
+            'matches_last_query': len(
+                index.search(queries[-1], options['max_missing'])
+            ),
+        }
+
+    def sql_search(self, owned, max_missing):
+        return list(Recipe.objects.annotate(
+            total=Count('amount'),
+            hits=Count('amount', filter=Q(amount__ingredient_id__in=owned))
+        ).filter(
+            hits__gt=0, total__lte=F('hits') + max_missing
+        ).order_by(
+            F('total') - F('hits'), '-total', '-id'
+        ).values_list('id', flat=True))
+
+    def database(self, options):
+        with rollback():
+            ingredients = create_ingredients(options['ingredients'])
+            create_recipes(
+                create_users(50), options['sql_recipes'],
+                random.sample(ingredients, len(ingredients)),
+                options['per_recipe']
+            )
+            weights = self.popularity(len(ingredients))
+            queries = self.owned_sets(ingredients, weights, options)
+            start = time.perf_counter()
+            index = cookable.load()
+            build = round((time.perf_counter() - start) * 1000, 3)
+            max_missing = options['max_missing']
+            return {
+                'recipes': options['sql_recipes'],
+                'index_load_ms': build,
+                'sql_ms': measure(self.run(
+                    lambda owned: self.sql_search(owned, max_missing),
+                    queries
+                ), options['repeat']),
+                'index_ms': measure(self.run(
+                    lambda owned: index.search(owned, max_missing), queries
+                ), options['repeat']),
+            }
+
+    def handle(self, *args, **options):
+        results = {'synthetic': self.synthetic(options)}
+        if options['sql_recipes']:
+            results['database'] = self.database(options)
+        self.stdout.write(json.dumps(results, indent=2))
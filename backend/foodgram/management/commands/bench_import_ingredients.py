@@ -0,0 +1,51 @@
+import csv
+import json
+import os
+import tempfile
+import time
+
+from api.benchmarks import rollback
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """
+    Замеряем импорт ингредиентов на синтетическом CSV файле
+    """
+    help = 'benchmark import_ingredients on a synthetic csv file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--batch-size', type=int, nargs='+',
+                            default=[1000, 5000])
+
+    def run(self, path, **options):
+        start = time.perf_counter()
+        call_command('import_ingredients', path, verbosity=0, **options)
+        return round(time.perf_counter() - start, 3)
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        results = []
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'ingredients.csv')
+            with open(path, 'w', encoding='utf-8', newline='') as f:
+                writer = csv.writer(f)
+                for num in range(rows):
+                    writer.writerow((num, f'ингредиент {num}', 'г'))
+            for batch_size in options['batch_size']:
+                with rollback():
+                    first = self.run(path, batch_size=batch_size)
+                    repeat = self.run(path, batch_size=batch_size)
+                    dry_run = self.run(path, batch_size=batch_size,
+                                       dry_run=True)
+                results.append({
+                    'rows': rows,
+                    'batch_size': batch_size,
+                    'import_s': first,
+                    'reimport_s': repeat,
+                    'dry_run_s': dry_run,
+                    'rows_per_s': round(rows / first),
+                })
+        self.stdout.write(json.dumps(results, indent=2))
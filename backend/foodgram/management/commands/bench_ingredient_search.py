@@ -0,0 +1,62 @@
+import json
+import random
+import time
+
+from api.benchmarks import percentile, rollback
+from api.serializers import IngredientSerializer
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from foodgram import autocomplete
+from foodgram.models import Ingredient
+
+
+class Command(BaseCommand):
+    """
+    Замеряем задержку поиска ингредиентов на каждое нажатие клавиши:
+    istartswith по таблице и индекс в памяти
+    """
+    help = 'benchmark per-keystroke ingredient search latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--words', type=int, default=200)
+
+    def database_search(self, query):
+        return IngredientSerializer(
+            Ingredient.objects.filter(name__istartswith=query), many=True
+        ).data
+
+    def keystrokes(self, count):
+        names = list(Ingredient.objects.values_list('name', flat=True))
+        for name in random.sample(names, min(count, len(names))):
+            for length in range(1, len(name) + 1):
+                yield name[:length]
+
+    def measure(self, search, queries):
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            search(query)
+            timings.append((time.perf_counter() - start) * 1000)
+        return {
+            f'p{percent}': round(percentile(timings, percent), 3)
+            for percent in (50, 95, 99)
+        }
+
+    def handle(self, *args, **options):
+        with rollback():
+            if not Ingredient.objects.exists():
+                call_command('import_ingredients', verbosity=0)
+            queries = list(self.keystrokes(options['words']))
+            autocomplete.invalidate()
+            start = time.perf_counter()
+            autocomplete.get_index()
+            build = round((time.perf_counter() - start) * 1000, 3)
+            results = {
+                'ingredients': Ingredient.objects.count(),
+                'keystrokes': len(queries),
+                'index_build_ms': build,
+                'database_ms': self.measure(self.database_search, queries),
+                'index_ms': self.measure(autocomplete.search, queries),
+            }
+            autocomplete.invalidate()
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,61 @@
+import json
+
+from api.benchmarks import (create_recipes, create_tags, create_users, measure,
+                            rollback)
+from api.filters import TagSlugFilter
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from foodgram.models import Recipe, Tag
+
+
+class Command(BaseCommand):
+    """
+    Сравниваем фильтр по тегам через JOIN + DISTINCT
+    с отбором через EXISTS на большом наборе рецептов
+    """
+    help = 'benchmark the recipe tag filter on a large dataset'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=1000000)
+        parser.add_argument('--authors', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    @staticmethod
+    def join_filter(slugs):
+        # Прежний AllValuesMultipleFilter: выборка всех slug для choices,
+        # затем OR по tags__slug и DISTINCT.
+        list(Recipe.objects.values_list(
+            'tags__slug', flat=True).distinct().order_by('tags__slug'))
+        query = Q()
+        for slug in slugs:
+            query |= Q(tags__slug=slug)
+        return Recipe.objects.filter(query).distinct()
+
+    @staticmethod
+    def exists_filter(slugs):
+        return TagSlugFilter().filter(Recipe.objects.all(), slugs)
+
+    def handle(self, *args, **options):
+        results = []
+        with rollback():
+            tags = create_tags()
+            authors = create_users(options['authors'])
+            create_recipes(authors, options['recipes'], [],
+                           per_recipe=0, tags=tags)
+            slugs = list(Tag.objects.values_list('slug', flat=True))
+            for count in range(1, len(slugs) + 1):
+                for name, build in (('join', self.join_filter),
+                                    ('exists', self.exists_filter)):
+                    results.append({
+                        'filter': name,
+                        'tags': count,
+                        'first_page_ms': measure(
+                            lambda: list(build(slugs[:count])[:6]),
+                            options['repeat']
+                        ),
+                        'count_ms': measure(
+                            lambda: build(slugs[:count]).count(),
+                            options['repeat']
+                        ),
+                    })
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,91 @@
+import json
+import time
+
+import numpy as np
+from api.benchmarks import measure
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from foodgram import similar
+
+
+class Command(BaseCommand):
+    """
+    Строим индекс похожих рецептов и сохраняем его исходные массивы
+    в SIMILAR_INDEX_FILE. Процессы читают файл не старше SIMILAR_INDEX_TTL,
+    поэтому команду нужно запускать по расписанию (cron) чаще
+    SIMILAR_INDEX_TTL: иначе каждый процесс перестраивает индекс полной
+    выборкой из базы.
+    С --synthetic индекс строится на случайных данных заданного
+    размера без базы и файла - проверка скорости на объёме каталога
+    """
+    help = 'build the similar recipes index and report query timings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=settings.SIMILAR_INDEX_FILE)
+        parser.add_argument('--repeat', type=int, default=100)
+        parser.add_argument('--synthetic', type=int, metavar='RECIPES',
+                            help='random catalogue of this many recipes')
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--per-recipe', type=int, default=8)
+        parser.add_argument('--users', type=int, default=100000)
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='favorites per user')
+
+    def synthetic(self, options):
+        rng = np.random.default_rng(0)
+        count = options['synthetic']
+        recipe_ids = np.arange(1, count + 1)
+        # Частота ингредиентов убывает по закону Ципфа.
+        weights = 1 / np.arange(1, options['ingredients'] + 1) ** 0.9
+        amounts = np.stack([
+            np.repeat(recipe_ids, options['per_recipe']),
+            rng.choice(np.arange(1, options['ingredients'] + 1),
+                       size=count * options['per_recipe'],
+                       p=weights / weights.sum()),
+        ], axis=1)
+        tags = np.stack([recipe_ids, rng.integers(1, 4, size=count)], axis=1)
+        favorites = np.stack([
+            np.repeat(np.arange(1, options['users'] + 1),
+                      options['favorites']),
+            rng.choice(recipe_ids,
+                       size=options['users'] * options['favorites']),
+        ], axis=1)
+        return {'recipe_ids': recipe_ids, 'amounts': amounts, 'tags': tags,
+                'favorites': favorites}
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        if options['synthetic']:
+            arrays = self.synthetic(options)
+        else:
+            arrays = similar.read_arrays()
+        read = time.perf_counter()
+        index = similar.SimilarIndex(**arrays)
+        built = time.perf_counter()
+        if not options['synthetic']:
+            if not options['output']:
+                raise CommandError('Не задан файл индекса SIMILAR_INDEX_FILE')
+            similar.save(arrays, options['output'])
+        report = {
+            'recipes': len(index.recipe_ids),
+            'amounts': len(arrays['amounts']),
+            'favorites': len(arrays['favorites']),
+            'read_ms': round((read - start) * 1000, 3),
+            'build_ms': round((built - read) * 1000, 3),
+            'output': None if options['synthetic'] else options['output'],
+        }
+        if len(index.recipe_ids):
+            sample = iter(np.random.default_rng(1).choice(
+                index.recipe_ids, size=options['repeat']
+            ).tolist())
+            k = settings.SIMILAR_RECIPES_MAX_LIMIT
+            report['query_ms'] = measure(
+                lambda: index.find_neighbours(next(sample), k),
+                options['repeat']
+            )
+            recipe = int(index.recipe_ids[0])
+            index.neighbours(recipe, k)
+            report['cached_query_ms'] = measure(
+                lambda: index.neighbours(recipe, k), options['repeat']
+            )
+        self.stdout.write(json.dumps(report, indent=2))
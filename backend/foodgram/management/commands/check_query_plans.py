@@ -0,0 +1,135 @@
+import random
+
+from api.benchmarks import (create_carts, create_favorites, create_ingredients,
+                            create_recipes, create_tags, create_users,
+                            rollback)
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from foodgram.autocomplete import PREFIX_INDEX_NAME
+from foodgram.models import (Amount, FavouriteRecipe, Ingredient, Recipe,
+                             ShoppingList, TagRecipe)
+
+
+class Command(BaseCommand):
+    """
+    Проверяем по EXPLAIN, что частые запросы идут по индексам.
+    Данные создаются и удаляются так же, как в бенчмарках,
+    после вставки собирается статистика (ANALYZE)
+    """
+    help = 'check with EXPLAIN that the hot queries use their indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument('--ingredients', type=int, default=1000)
+        parser.add_argument('--plans', action='store_true',
+                            help='print the full query plans')
+
+    def seed(self, options):
+        random.seed(0)
+        users = create_users(options['users'])
+        recipes = create_recipes(
+            users, options['recipes'], create_ingredients(
+                options['ingredients']), tags=create_tags()
+        )
+        create_favorites(users, recipes, 20)
+        create_carts(users, recipes, 5)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        amount = Amount.objects.order_by('?').first()
+        return users[0].id, amount.recipe_id, amount.ingredient_id
+
+    def checks(self, user, recipe, ingredient):
+        """Имя, запрос и ожидаемый индекс: начальные столбцы или имя"""
+        tag = TagRecipe.objects.filter(recipe_id=recipe).first().tag_id
+        return [
+            ('favourite by user and recipe', FavouriteRecipe.objects.filter(
+                user_id=user, recipe_id=recipe), ('user_id', 'recipe_id')),
+            ('favourite by recipe', FavouriteRecipe.objects.filter(
+                recipe_id=recipe), ('recipe_id', )),
+            ('cart by user and recipe', ShoppingList.objects.filter(
+                user_id=user, recipe_id=recipe), ('user_id', 'recipe_id')),
+            ('cart by recipe', ShoppingList.objects.filter(
+                recipe_id=recipe), ('recipe_id', )),
+            ('amounts by recipe', Amount.objects.filter(
+                recipe_id=recipe), ('recipe_id', )),
+            ('amount by recipe and ingredient', Amount.objects.filter(
+                recipe_id=recipe, ingredient_id=ingredient),
+             ('recipe_id', 'ingredient_id')),
+            ('tags by recipe', TagRecipe.objects.filter(
+                recipe_id=recipe), ('recipe_id', )),
+            ('recipes by tag', TagRecipe.objects.filter(
+                tag_id=tag, recipe_id__lt=recipe), ('tag_id', )),
+            ('newest recipes', Recipe.objects.order_by(
+                '-pub_date', '-id')[:10], ('pub_date', 'id')),
+            ('author recipes', Recipe.objects.filter(
+                author_id=user).order_by('-pub_date', '-id')[:10],
+             ('author_id', 'pub_date')),
+            ('ingredient name prefix', Ingredient.objects.filter(
+                name__istartswith='ингредиент 1'), PREFIX_INDEX_NAME),
+        ]
+
+    def indexes(self, table):
+        """Индексы таблицы: {имя: [столбцы]}"""
+        with connection.cursor() as cursor:
+            if connection.vendor != 'sqlite':
+                return {
+                    name: constraint['columns']
+                    for name, constraint in connection.introspection
+                    .get_constraints(cursor, table).items()
+                    if constraint['index'] or constraint['unique']
+                }
+            # Уникальные ограничения SQLite хранит в индексах
+            # sqlite_autoindex_*, которых нет в get_constraints().
+            cursor.execute(f'PRAGMA index_list({table})')
+            names = [row[1] for row in cursor.fetchall()]
+            indexes = {}
+            for name in names:
+                cursor.execute(f'PRAGMA index_info({name})')
+                indexes[name] = [row[2] for row in cursor.fetchall()]
+            return indexes
+
+    def index_names(self, model, expected):
+        """Индексы таблицы, подходящие под ожидание"""
+        if isinstance(expected, str):
+            return {expected}
+        return {
+            name for name, columns in self.indexes(
+                model._meta.db_table).items()
+            if tuple(columns[:len(expected)]) == expected
+        }
+
+    def explain(self, options):
+        results = []
+        user, recipe, ingredient = self.seed(options)
+        for name, queryset, expected in self.checks(user, recipe, ingredient):
+            if (expected == PREFIX_INDEX_NAME
+                    and connection.vendor != 'postgresql'):
+                # Регистронезависимый LIKE по индексу умеет только PostgreSQL.
+                results.append((name, None, [], ''))
+                continue
+            plan = queryset.explain()
+            used = sorted(
+                index for index in self.index_names(queryset.model, expected)
+                if index in plan
+            )
+            results.append((name, bool(used), used, plan))
+        return results
+
+    def handle(self, *args, **options):
+        with rollback():
+            results = self.explain(options)
+        failed = 0
+        for name, passed, used, plan in results:
+            if passed is None:
+                status = self.style.WARNING('skip')
+            elif passed:
+                status = self.style.SUCCESS('ok')
+            else:
+                status = self.style.ERROR('FAIL')
+                failed += 1
+            self.stdout.write(f'{status} {name}: {", ".join(used)}')
+            if options['plans'] or passed is False:
+                self.stdout.write(plan)
+        if failed:
+            raise CommandError(f'Запросов без индекса: {failed}')
@@ -0,0 +1,23 @@
+from functools import partial
+
+from django.core.management.base import BaseCommand
+from foodgram import images
+from foodgram.models import Recipe
+
+
+class Command(BaseCommand):
+    """
+    Создаём уменьшенные копии изображений для уже сохранённых рецептов
+    """
+    help = 'generate thumbnails for existing recipe images'
+
+    def handle(self, *args, **options):
+        names = Recipe.objects.exclude(image='').values_list(
+            'image', flat=True).iterator()
+        results = images.get_executor().map(
+            partial(images.pooled, images.process), names
+        )
+        count = sum(1 for _ in results)
+        self.stdout.write(
+            self.style.SUCCESS(f'Обработано изображений: {count}')
+        )
@@ -1,32 +1,101 @@
 import csv
+import json
 import os
+import time
+from itertools import islice
 
 from django.core.management.base import BaseCommand, CommandError
 
 from backend.settings import BASE_DIR
+from foodgram import reference
 from foodgram.models import Ingredient
 
 
 class Command(BaseCommand):
     """
-    Добавляем ингредиенты из CSV файла
+    Добавляем ингредиенты из CSV или JSON файла пачками.
+    Повторный импорт не создаёт дублей: пары (name, measurement_unit)
+    уникальны, конфликты пропускаются базой.
     """
     help = 'loading ingredients from data in json or csv'
 
     def add_arguments(self, parser):
         parser.add_argument('filename', default='ingredients.csv', nargs='?',
                             type=str)
+        parser.add_argument('--format', choices=('csv', 'json'),
+                            help='file format, by default from extension')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='only show ingredients missing in the base')
+
+    @staticmethod
+    def read_csv(file):
+        for row in csv.reader(file):
+            if row:
+                *_, name, measurement_unit = row
+                yield name.strip(), measurement_unit.strip()
+
+    @staticmethod
+    def read_json(file):
+        for item in json.load(file):
+            yield item['name'].strip(), item['measurement_unit'].strip()
+
+    @staticmethod
+    def missing(chunk):
+        existing = set(Ingredient.objects.filter(
+            name__in={name for name, _ in chunk}
+        ).values_list('name', 'measurement_unit'))
+        return chunk - existing
+
+    def import_chunk(self, chunk):
+        # Существующие пары отсекаются одним запросом по индексу name,
+        # ignore_conflicts оставлен для параллельного импорта.
+        new = self.missing(chunk)
+        Ingredient.objects.bulk_create(
+            (Ingredient(name=name, measurement_unit=measurement_unit)
+             for name, measurement_unit in new),
+            ignore_conflicts=True
+        )
+        return len(new)
 
     def handle(self, *args, **options):
+        path = os.path.join(BASE_DIR, options['filename'])
+        file_format = options['format'] or (
+            'json' if path.endswith('.json') else 'csv'
+        )
+        reader = self.read_json if file_format == 'json' else self.read_csv
+        dry_run = options['dry_run']
+        total = created = 0
+        seen = set()
+        start = time.perf_counter()
         try:
-            with open(os.path.join(BASE_DIR, options['filename']), 'r',
-                      encoding='utf-8') as f:
-                data = csv.reader(f)
-                for row in data:
-                    pk, name, measurement_unit = row
-                    Ingredient.objects.get_or_create(
-                        name=name,
-                        measurement_unit=measurement_unit
-                    )
+            with open(path, 'r', encoding='utf-8') as f:
+                rows = reader(f)
+                chunk = list(islice(rows, options['batch_size']))
+                while chunk:
+                    total += len(chunk)
+                    chunk = set(chunk)
+                    if dry_run:
+                        new = self.missing(chunk) - seen
+                        seen |= new
+                        created += len(new)
+                        for name, measurement_unit in sorted(new):
+                            self.stdout.write(f'+ {name}, {measurement_unit}')
+                    else:
+                        created += self.import_chunk(chunk)
+                    if options['verbosity'] > 1:
+                        self.stdout.write(f'Обработано строк: {total}')
+                    chunk = list(islice(rows, options['batch_size']))
         except FileNotFoundError:
             raise CommandError('Добавьте файл ingredients в директорию data')
+        if created and not dry_run:
+            reference.bump(reference.INGREDIENTS)
+        if not options['verbosity']:
+            return
+        elapsed = time.perf_counter() - start
+        action = 'будет добавлено' if dry_run else 'добавлено'
+        self.stdout.write(self.style.SUCCESS(
+            f'Строк: {total}, {action}: {created}, '
+            f'время: {elapsed:.2f} с, '
+            f'{total / elapsed if elapsed else 0:.0f} строк/с'
+        ))
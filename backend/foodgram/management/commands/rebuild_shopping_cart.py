@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from foodgram import cart
+
+
+class Command(BaseCommand):
+    """
+    Пересчитываем агрегат списков покупок или сверяем его с GROUP BY
+    """
+    help = 'rebuild or check the materialized shopping cart totals'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, nargs='+',
+                            help='only these user ids')
+        parser.add_argument('--check', action='store_true',
+                            help='compare with the live GROUP BY only')
+
+    def handle(self, *args, **options):
+        users = options['users']
+        if not options['check']:
+            rows = cart.rebuild(users)
+            self.stdout.write(self.style.SUCCESS(f'Пересчитано строк: {rows}'))
+            return
+        mismatches = cart.diff(users)
+        for (user, ingredient), (stored, live) in sorted(mismatches.items()):
+            self.stdout.write(
+                f'user={user} ingredient={ingredient} '
+                f'stored={stored} live={live}'
+            )
+        if mismatches:
+            raise CommandError(f'Расхождений: {len(mismatches)}')
+        self.stdout.write(self.style.SUCCESS('Агрегат совпадает с данными'))
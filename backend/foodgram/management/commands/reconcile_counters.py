@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from foodgram import counters
+
+
+class Command(BaseCommand):
+    """
+    Сверяем денормализованные счётчики с данными и исправляем расхождения
+    """
+    help = 'reconcile recipe and author counters with the source tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='report the drift without fixing it')
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            rows = counters.reconcile()
+            self.stdout.write(self.style.SUCCESS(f'Исправлено строк: {rows}'))
+            return
+        recipes = counters.recipe_drift()
+        for recipe, values in sorted(recipes.items()):
+            self.stdout.write(f'recipe={recipe} ' + ' '.join(
+                f'{field}={stored}/{live}'
+                for field, (stored, live) in values.items()
+            ))
+        authors = counters.author_drift()
+        for author, (stored, live) in sorted(authors.items()):
+            self.stdout.write(
+                f'author={author} recipes_count={stored}/{live}'
+            )
+        if recipes or authors:
+            raise CommandError(f'Расхождений: {len(recipes) + len(authors)}')
+        self.stdout.write(self.style.SUCCESS('Счётчики совпадают с данными'))
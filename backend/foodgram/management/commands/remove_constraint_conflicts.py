@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+from foodgram import integrity
+
+
+class Command(BaseCommand):
+    """
+    Удаляем данные, нарушающие ограничения моделей; миграция 0002
+    делает то же сама (см. foodgram/integrity.py)
+    """
+    help = 'remove or merge rows that would violate the model constraints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument('--check', action='store_true',
+                            help='report the conflicts without fixing them')
+
+    def handle(self, *args, **options):
+        removed, ingredients, merged = integrity.remove_conflicts(
+            options['database'], dry_run=options['check'],
+            apps=integrity.applied_apps(options['database'])
+        )
+        verb = 'Найдено' if options['check'] else 'Исправлено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb}: лишних связей тегов {removed}, '
+            f'повторов ингредиентов {ingredients}, '
+            f'рецептов с повторами ингредиентов {merged}'
+        ))
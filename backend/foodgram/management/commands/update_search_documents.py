@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from foodgram import search
+from foodgram.models import Recipe
+
+
+class Command(BaseCommand):
+    """
+    Заполняем тексты для поиска у уже сохранённых рецептов
+    """
+    help = 'rebuild Recipe.search_document for all recipes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        ids = list(Recipe.objects.values_list('id', flat=True))
+        size = options['batch_size']
+        for start in range(0, len(ids), size):
+            search.update_documents(ids[start:start + size])
+        self.stdout.write(
+            self.style.SUCCESS(f'Обновлено рецептов: {len(ids)}')
+        )
@@ -0,0 +1,123 @@
+# Generated by Django 3.2.15 on 2026-10-18 19:31
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Amount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.PositiveIntegerField(verbose_name='Количество от ингредиента')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Ingredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=150, verbose_name='Наименование ингредиента')),
+                ('measurement_unit', models.CharField(max_length=50, verbose_name='Единица измерения')),
+            ],
+            options={
+                'verbose_name': 'Ингредиент',
+                'verbose_name_plural': 'Ингредиенты',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Recipe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, verbose_name='Название рецепта')),
+                ('image', models.ImageField(blank=True, upload_to='media/', verbose_name='Изображение рецепта')),
+                ('text', models.TextField(verbose_name='Описание рецепта')),
+                ('cooking_time', models.PositiveIntegerField(verbose_name='Время приготовления, мин.')),
+                ('pub_date', models.DateTimeField(auto_now_add=True, verbose_name='Дата публикации')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipes', to=settings.AUTH_USER_MODEL, verbose_name='Автор рецепта')),
+                ('ingredients', models.ManyToManyField(through='foodgram.Amount', to='foodgram.Ingredient', verbose_name='Ингредиенты')),
+            ],
+            options={
+                'verbose_name': 'Рецепт',
+                'verbose_name_plural': 'Рецепты',
+                'ordering': ['-pub_date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=40, verbose_name='Наименование тэга')),
+                ('color', models.CharField(choices=[('#FFA500', 'Orange'), ('#008000', 'Green'), ('#9400D3', 'DarkViolet')], max_length=40, verbose_name='Цвет тэга')),
+                ('slug', models.SlugField(max_length=40, unique=True)),
+            ],
+            options={
+                'verbose_name': 'Тэг',
+                'verbose_name_plural': 'Тэги',
+            },
+        ),
+        migrations.CreateModel(
+            name='TagRecipe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipe', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tag_recipe', to='foodgram.recipe')),
+                ('tag', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tag_recipe', to='foodgram.tag')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ShoppingList',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping', to='foodgram.recipe')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Список покупок',
+                'verbose_name_plural': 'Списки покупок',
+            },
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='tags',
+            field=models.ManyToManyField(through='foodgram.TagRecipe', to='foodgram.Tag', verbose_name='Тэги рецептов'),
+        ),
+        migrations.CreateModel(
+            name='FavouriteRecipe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='favourite', to='foodgram.recipe')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Рецепт в избранном',
+                'verbose_name_plural': 'Избранные рецепты',
+            },
+        ),
+        migrations.AddField(
+            model_name='amount',
+            name='ingredient',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='amount', to='foodgram.ingredient'),
+        ),
+        migrations.AddField(
+            model_name='amount',
+            name='recipe',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='amount', to='foodgram.recipe'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglist',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_shopping_cart'),
+        ),
+        migrations.AddConstraint(
+            model_name='favouriterecipe',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_favourite_recipes'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+from foodgram import integrity
+
+
+def remove_conflicts(apps, schema_editor):
+    integrity.remove_conflicts(schema_editor.connection.alias, apps=apps)
+
+
+class Migration(migrations.Migration):
+    """
+    Данные, которые не дадут добавить ограничения в 0003. Отдельная
+    миграция: в PostgreSQL таблицу с отложенными проверками внешних
+    ключей нельзя изменять в той же транзакции.
+    """
+
+    dependencies = [
+        ('foodgram', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_conflicts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.15 on 2026-10-18 19:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram', '0003_constraints_counters_and_cart'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='thumbnails_image',
+            field=models.CharField(blank=True, editable=False, max_length=100, verbose_name='Изображение, для которого созданы копии'),
+        ),
+    ]
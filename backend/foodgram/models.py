@@ -17,9 +17,15 @@ class Ingredient(models.Model):
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
         ordering = ['name']
+        constraints = [
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient'
+            )
+        ]
 
     def __str__(self):
-        return {self.name}
+        return self.name
 
 
 class Tag(models.Model):
@@ -59,6 +65,8 @@ class Recipe(models.Model):
         User,
         on_delete=models.CASCADE,
         related_name='recipes',
+        # Поиск по автору идёт по recipe_author_date_idx.
+        db_index=False,
         verbose_name='Автор рецепта'
     )
     name = models.CharField(
@@ -90,11 +98,46 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Дата публикации'
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Добавлений в избранное'
+    )
+    cart_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Добавлений в списки покупок'
+    )
+    search_document = models.TextField(
+        blank=True,
+        editable=False,
+        verbose_name='Текст для поиска'
+    )
+    thumbnails_image = models.CharField(
+        max_length=100,
+        blank=True,
+        editable=False,
+        verbose_name='Изображение, для которого созданы копии'
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(
+                fields=('-favorites_count', '-cart_count', '-id'),
+                name='recipe_popular_idx'
+            ),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='recipe_author_date_idx'
+            ),
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_date_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -107,16 +150,27 @@ class TagRecipe(models.Model):
     recipe = models.ForeignKey(
         Recipe,
         related_name='tag_recipe',
-        on_delete=models.SET_NULL,
-        null=True
+        on_delete=models.CASCADE,
+        db_index=False
     )
     tag = models.ForeignKey(
         Tag,
         related_name='tag_recipe',
-        on_delete=models.SET_NULL,
-        null=True
+        on_delete=models.CASCADE,
+        db_index=False
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=('tag', 'recipe'), name='tag_recipe_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=('recipe', 'tag'),
+                name='unique_recipe_tag'
+            )
+        ]
+
 
 class Amount(models.Model):
     """
@@ -134,9 +188,18 @@ class Amount(models.Model):
     recipe = models.ForeignKey(
         Recipe,
         related_name='amount',
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_index=False
     )
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('recipe', 'ingredient'),
+                name='unique_recipe_ingredient'
+            )
+        ]
+
 
 class FavouriteRecipe(models.Model):
     """
@@ -146,11 +209,13 @@ class FavouriteRecipe(models.Model):
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
+        db_index=False
     )
     recipe = models.ForeignKey(
         Recipe,
         related_name='favourite',
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_index=False
     )
 
     class Meta:
@@ -162,6 +227,14 @@ class FavouriteRecipe(models.Model):
                 name='unique_favourite_recipes'
             )
         ]
+        # Отдельные индексы по user и recipe не нужны: их заменяют
+        # уникальное ограничение (user, recipe) и индекс (recipe, user).
+        indexes = [
+            models.Index(
+                fields=('recipe', 'user'),
+                name='favourite_recipe_user_idx'
+            ),
+        ]
 
 
 class ShoppingList(models.Model):
@@ -171,12 +244,14 @@ class ShoppingList(models.Model):
     """
     user = models.ForeignKey(
         User,
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_index=False
     )
     recipe = models.ForeignKey(
         Recipe,
         related_name='shopping',
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_index=False
     )
 
     class Meta:
@@ -188,3 +263,43 @@ class ShoppingList(models.Model):
                 name='unique_shopping_cart'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=('recipe', 'user'),
+                name='shopping_recipe_user_idx'
+            ),
+        ]
+
+
+class ShoppingCartIngredient(models.Model):
+    """
+    Суммарное количество ингредиента в списке покупок пользователя.
+    Поддерживается инкрементально при изменении списка покупок
+    и состава рецептов, см. foodgram.cart.
+    """
+    user = models.ForeignKey(
+        User,
+        related_name='cart_ingredients',
+        on_delete=models.CASCADE
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        related_name='cart_ingredients',
+        on_delete=models.CASCADE
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Суммарное количество'
+    )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Количество строк рецептов'
+    )
+
+    class Meta:
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Ингредиенты в списках покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_cart_ingredient'
+            )
+        ]
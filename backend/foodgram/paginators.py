@@ -0,0 +1,56 @@
+"""
+Постраничный вывод больших таблиц в админке.
+
+COUNT(*) по таблице в миллионы строк читает её целиком. Без фильтров
+число строк берётся из статистики СУБД (pg_class.reltuples или
+sqlite_stat1 после ANALYZE), если оно больше ADMIN_COUNT_LIMIT.
+Иначе строки считаются, но не дальше ADMIN_COUNT_LIMIT: страницы
+за этой границей в списке не показываются, сузить выборку можно
+поиском и фильтрами.
+"""
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+def estimated_count(queryset):
+    """Оценка числа строк таблицы по статистике СУБД или None"""
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class '
+                'WHERE oid = to_regclass(%s)',
+                [connection.ops.quote_name(table)]
+            )
+        elif connection.vendor == 'sqlite':
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE name = 'sqlite_stat1'"
+            )
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute(
+                "SELECT CAST(stat AS INTEGER) FROM sqlite_stat1 "
+                "WHERE tbl = %s LIMIT 1", [table]
+            )
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] <= 0:
+        return None
+    return row[0]
+
+
+class EstimatedCountPaginator(Paginator):
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        limit = settings.ADMIN_COUNT_LIMIT
+        if not queryset.query.where and not queryset.query.distinct:
+            estimate = estimated_count(queryset)
+            if estimate is not None and estimate > limit:
+                return estimate
+        return queryset[:limit].count()
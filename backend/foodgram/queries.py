@@ -0,0 +1,88 @@
+"""
+Запросы к рецептам, которые неудобно выразить через ORM.
+"""
+from collections import defaultdict
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Recipe
+
+# Поля превью рецепта в подписках (ShowFavouriteShoppingSerializer).
+PREVIEW_FIELDS = (
+    'id', 'author_id', 'name', 'image', 'thumbnails_image', 'cooking_time'
+)
+
+
+def position_filter(before=None, since=None):
+    """
+    Условие на позицию (pub_date, id) в порядке (-pub_date, -id):
+    строго раньше before и не раньше since.
+    """
+    condition = Q()
+    if before is not None:
+        pub_date, pk = before
+        condition &= Q(pub_date__lt=pub_date) | Q(pub_date=pub_date,
+                                                  id__lt=pk)
+    if since is not None:
+        pub_date, pk = since
+        condition &= Q(pub_date__gt=pub_date) | Q(pub_date=pub_date,
+                                                  id__gte=pk)
+    return condition
+
+
+def position_sql(before=None, since=None):
+    """То же условие для сырого SQL: (фрагменты, параметры)"""
+    parts, params = [], []
+    for bound, operator in ((before, '<'), (since, '>=')):
+        if bound is None:
+            continue
+        pub_date = connection.ops.adapt_datetimefield_value(bound[0])
+        parts.append(
+            f'(recipe.pub_date {operator[0]} %s OR '
+            f'(recipe.pub_date = %s AND recipe.id {operator} %s))'
+        )
+        params += [pub_date, pub_date, bound[1]]
+    return parts, params
+
+
+def latest_recipes_by_author(author_ids, limit=None, before=None,
+                             since=None, fields=PREVIEW_FIELDS):
+    """
+    Последние рецепты каждого автора одним запросом:
+    {author_id: [Recipe, ...]} в порядке (-pub_date, -id).
+    Ограничение limit на автора считается через ROW_NUMBER(),
+    before и since ограничивают позицию, см. position_filter.
+    Загружаются только поля fields (и author_id), остальные отложены.
+    """
+    recipes = defaultdict(list)
+    author_ids = list(author_ids)
+    if not author_ids:
+        return recipes
+    fields = tuple(dict.fromkeys(('id', 'author_id') + tuple(fields)))
+    if limit is None:
+        queryset = Recipe.objects.filter(
+            position_filter(before, since), author_id__in=author_ids
+        ).only(*fields).order_by('-pub_date', '-id')
+    else:
+        columns = [Recipe._meta.get_field(field).column for field in fields]
+        columns_of_recipe = ', '.join(f'recipe.{column}' for column in columns)
+        columns = ', '.join(columns)
+        placeholders = ', '.join(['%s'] * len(author_ids))
+        parts, params = position_sql(before, since)
+        conditions = ''.join(f' AND {part}' for part in parts)
+        queryset = Recipe.objects.raw(
+            f'SELECT {columns} FROM ('
+            f'SELECT {columns_of_recipe}, ROW_NUMBER() OVER ('
+            f'PARTITION BY recipe.author_id '
+            f'ORDER BY recipe.pub_date DESC, recipe.id DESC'
+            f') AS author_position '
+            f'FROM {Recipe._meta.db_table} recipe '
+            f'WHERE recipe.author_id IN ({placeholders}){conditions}'
+            f') ranked WHERE author_position <= %s '
+            f'ORDER BY author_id, author_position',
+            [*author_ids, *params, limit]
+        )
+    for recipe in queryset:
+        recipes[recipe.author_id].append(recipe)
+    return recipes
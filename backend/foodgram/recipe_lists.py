@@ -0,0 +1,122 @@
+"""
+Пакетные изменения избранного и списка покупок.
+
+Рецепты добавляются одним bulk_create(ignore_conflicts=True)
+и удаляются одним DELETE, вместе с ними в той же транзакции меняются
+счётчики рецептов и, для списка покупок, агрегат ShoppingCartIngredient.
+Строка пользователя блокируется, как в cart.apply_deltas: параллельные
+изменения одного списка идут последовательно, и счётчики меняются
+только на действительно добавленные или удалённые рецепты. Удаление
+идёт внутри cart.maintained(): агрегат меняется здесь же, а не сигналом.
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from . import cart, counters
+from .models import (FavouriteRecipe, Recipe, ShoppingCartIngredient,
+                     ShoppingList)
+
+User = get_user_model()
+
+ADDED = 'added'
+PRESENT = 'present'
+REMOVED = 'removed'
+ABSENT = 'absent'
+NOT_FOUND = 'not_found'
+
+
+def lock_user(user_id):
+    list(User.objects.select_for_update().filter(
+        id=user_id).values_list('id', flat=True))
+
+
+class RecipeList:
+
+    def __init__(self, model, counter):
+        self.model = model
+        self.counter = counter
+
+    def stored(self, user_id, recipe_ids):
+        return set(self.model.objects.filter(
+            user_id=user_id, recipe_id__in=recipe_ids
+        ).values_list('recipe_id', flat=True))
+
+    def added(self, user_id, recipe_ids):
+        pass
+
+    def removed(self, user_id, recipe_ids):
+        pass
+
+    def cleared(self, user_id):
+        pass
+
+    def add(self, user_id, recipe_ids):
+        """Добавляет рецепты: [(recipe_id, статус)] в порядке запроса"""
+        recipe_ids = list(dict.fromkeys(recipe_ids))
+        with transaction.atomic():
+            lock_user(user_id)
+            existing = set(Recipe.objects.filter(
+                id__in=recipe_ids).values_list('id', flat=True))
+            present = self.stored(user_id, recipe_ids)
+            new = [
+                recipe for recipe in recipe_ids
+                if recipe in existing and recipe not in present
+            ]
+            self.model.objects.bulk_create(
+                (self.model(user_id=user_id, recipe_id=recipe)
+                 for recipe in new),
+                ignore_conflicts=True
+            )
+            if new:
+                counters.change_recipes(self.counter, new, 1)
+                self.added(user_id, new)
+        return [
+            (recipe, NOT_FOUND if recipe not in existing
+             else PRESENT if recipe in present else ADDED)
+            for recipe in recipe_ids
+        ]
+
+    def remove(self, user_id, recipe_ids):
+        """Удаляет рецепты: [(recipe_id, статус)] в порядке запроса"""
+        recipe_ids = list(dict.fromkeys(recipe_ids))
+        with transaction.atomic(), cart.maintained():
+            lock_user(user_id)
+            present = self.stored(user_id, recipe_ids)
+            self.model.objects.filter(
+                user_id=user_id, recipe_id__in=present
+            ).delete()
+            if present:
+                counters.change_recipes(self.counter, present, -1)
+                self.removed(user_id, present)
+        return [
+            (recipe, REMOVED if recipe in present else ABSENT)
+            for recipe in recipe_ids
+        ]
+
+    def clear(self, user_id):
+        """Удаляет все рецепты пользователя, возвращает их число"""
+        with transaction.atomic(), cart.maintained():
+            lock_user(user_id)
+            present = list(self.model.objects.filter(
+                user_id=user_id).values_list('recipe_id', flat=True))
+            self.model.objects.filter(user_id=user_id).delete()
+            counters.change_recipes(self.counter, present, -1)
+            self.cleared(user_id)
+        return len(present)
+
+
+class ShoppingCart(RecipeList):
+
+    def added(self, user_id, recipe_ids):
+        cart.add_recipes(user_id, recipe_ids)
+
+    def removed(self, user_id, recipe_ids):
+        cart.remove_recipes(user_id, recipe_ids)
+
+    def cleared(self, user_id):
+        # Пустой список - пустой агрегат, пересчёт по рецептам не нужен.
+        ShoppingCartIngredient.objects.filter(user_id=user_id).delete()
+
+
+favorites = RecipeList(FavouriteRecipe, counters.FAVORITES)
+shopping_cart = ShoppingCart(ShoppingList, counters.CART)
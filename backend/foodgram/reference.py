@@ -0,0 +1,110 @@
+"""
+Кэш справочных данных: теги, ингредиенты и их единицы измерения.
+
+У каждого набора есть номер версии, который входит в ключи записей,
+поэтому сброс кэша - это увеличение версии: старые записи больше
+не читаются и истекают сами. Версия же служит ETag для ответов API.
+Хранилище - кэш Django с псевдонимом REFERENCE_CACHE_ALIAS. Версии
+(и метки foodgram.versions) должны быть общими для всех процессов,
+поэтому при развёртывании это memcached (проверка foodgram.E001
+в manage.py check --deploy); память процесса годится только
+для одного процесса: тестов и локального запуска.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .models import Ingredient, Tag
+
+TAGS = 'tags'
+INGREDIENTS = 'ingredients'
+
+
+def get_cache():
+    return caches[settings.REFERENCE_CACHE_ALIAS]
+
+
+def version_key(name):
+    return f'reference:{name}:version'
+
+
+def new_version():
+    return time.time_ns() // 1000
+
+
+def get_version(name):
+    cache = get_cache()
+    version = cache.get(version_key(name))
+    if version is not None:
+        return version
+    cache.add(version_key(name), new_version(), None)
+    return cache.get(version_key(name))
+
+
+def bump(name):
+    """Новая версия после фиксации транзакции, как versions.touch"""
+    def apply():
+        cache = get_cache()
+        try:
+            cache.incr(version_key(name))
+        except ValueError:
+            cache.set(version_key(name), new_version(), None)
+    transaction.on_commit(apply)
+
+
+def get(name, part, build):
+    """
+    Возвращает (версия, значение) записи part набора name.
+    При промахе значение вычисляется build() и сохраняется.
+    """
+    cache = get_cache()
+    version = get_version(name)
+    key = f'reference:{name}:{version}:{part}'
+    value = cache.get(key)
+    if value is None:
+        value = build()
+        cache.set(key, value, settings.REFERENCE_CACHE_TIMEOUT)
+    return version, value
+
+
+def tags():
+    """Теги по id: {id: Tag}"""
+    return get(TAGS, 'objects', lambda: Tag.objects.in_bulk())[1]
+
+
+def tag_ids_by_slug():
+    return get(TAGS, 'ids', lambda: dict(
+        Tag.objects.values_list('slug', 'id')
+    ))[1]
+
+
+def tags_payload():
+    return get(TAGS, 'payload', lambda: list(
+        Tag.objects.order_by('id').values('id', 'name', 'color', 'slug')
+    ))
+
+
+def ingredients_payload():
+    return get(INGREDIENTS, 'payload', lambda: list(
+        Ingredient.objects.values('id', 'name', 'measurement_unit')
+    ))
+
+
+def items_by_id(name, payload):
+    """
+    (версия, {id: элемент}) для payload набора name: объект справочника
+    находится без просмотра всего списка.
+    """
+    return get(name, 'by_id', lambda: {
+        item['id']: item for item in payload()[1]
+    })
+
+
+def tags_by_id():
+    return items_by_id(TAGS, tags_payload)
+
+
+def ingredients_by_id():
+    return items_by_id(INGREDIENTS, ingredients_payload)
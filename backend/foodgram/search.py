@@ -0,0 +1,178 @@
+"""
+Полнотекстовый поиск рецептов.
+
+Recipe.search_document хранит текст рецепта и названия его ингредиентов
+и обновляется после фиксации изменений рецепта, состава или ингредиента
+(см. signals). На PostgreSQL поиск идёт по tsvector из названия (вес A)
+и search_document (вес B), для которого миграция 0003 создаёт
+GIN-индекс INDEX_NAME по тому же выражению. На остальных СУБД
+используется инвертированный индекс в памяти процесса: слова запроса
+без окончания ищутся по началу слов рецепта, рецепт должен содержать
+все слова запроса, ранг - сумма tf-idf с удвоенным весом слов названия.
+"""
+import math
+import re
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from threading import Lock
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Case, FloatField, Value, When
+from django.db.models.functions import Cast
+
+from . import versions
+from .autocomplete import normalize
+from .models import Amount, Recipe
+from .transactions import after_commit
+
+INDEX_NAME = 'recipe_search_idx'
+NAME_WEIGHT = 2
+ENDINGS = 'аеиоуыэюяйь'
+
+_state = {'index': None}
+_lock = Lock()
+
+
+def tokenize(value):
+    return re.findall(r'\w+', normalize(value))
+
+
+def stem(token):
+    """Грубое отсечение окончания: свёклой -> свекл"""
+    if len(token) <= 4:
+        return token
+    return token[:3] + token[3:].rstrip(ENDINGS)
+
+
+def build_documents(recipe_ids):
+    """Текст для поиска: {recipe_id: search_document}"""
+    parts = defaultdict(list)
+    for recipe, text in Recipe.objects.filter(
+            id__in=recipe_ids).values_list('id', 'text'):
+        parts[recipe].append(text)
+    for recipe, name in Amount.objects.filter(
+            recipe_id__in=recipe_ids
+    ).values_list('recipe_id', 'ingredient__name').order_by('id'):
+        parts[recipe].append(name)
+    return {recipe: '\n'.join(texts) for recipe, texts in parts.items()}
+
+
+def update_documents(recipe_ids):
+    documents = build_documents(set(recipe_ids))
+    Recipe.objects.bulk_update(
+        [Recipe(id=recipe, search_document=document)
+         for recipe, document in documents.items()],
+        ('search_document', )
+    )
+    versions.touch(versions.RECIPES)
+
+
+def schedule(recipe_ids):
+    """Обновляет тексты рецептов после фиксации транзакции"""
+    after_commit(update_documents, recipe_ids=recipe_ids)
+
+
+def uses_postgres(queryset):
+    return connections[queryset.db].vendor == 'postgresql'
+
+
+def vector():
+    from django.contrib.postgres.search import SearchVector
+    config = settings.SEARCH_CONFIG
+    return (
+        SearchVector('name', weight='A', config=config)
+        + SearchVector('search_document', weight='B', config=config)
+    )
+
+
+class RecipeIndex:
+
+    def __init__(self, rows, version=None):
+        self.version = version
+        self.postings = defaultdict(dict)
+        count = 0
+        for recipe, name, document in rows:
+            count += 1
+            weights = Counter(tokenize(document))
+            for token in tokenize(name):
+                weights[token] += NAME_WEIGHT
+            for token, weight in weights.items():
+                self.postings[token][recipe] = weight
+        self.terms = sorted(self.postings)
+        self.idf = {
+            term: math.log(1 + count / len(recipes))
+            for term, recipes in self.postings.items()
+        }
+
+    def matching_terms(self, token):
+        position = bisect_left(self.terms, token)
+        while (position < len(self.terms)
+               and self.terms[position].startswith(token)):
+            yield self.terms[position]
+            position += 1
+
+    def search(self, query):
+        """Ранги рецептов, содержащих все слова запроса: {id: rank}"""
+        ranks = None
+        for token in {stem(token) for token in tokenize(query)}:
+            scores = defaultdict(float)
+            for term in self.matching_terms(token):
+                for recipe, weight in self.postings[term].items():
+                    scores[recipe] += weight * self.idf[term]
+            if ranks is None:
+                ranks = scores
+            else:
+                ranks = {
+                    recipe: rank + scores[recipe]
+                    for recipe, rank in ranks.items() if recipe in scores
+                }
+            if not ranks:
+                return {}
+        return dict(ranks or {})
+
+
+def get_index():
+    version = versions.get_many([versions.RECIPES])[versions.RECIPES]
+    with _lock:
+        index = _state['index']
+        if index is None or index.version != version:
+            _state['index'] = RecipeIndex(
+                Recipe.objects.values_list(
+                    'id', 'name', 'search_document'
+                ).iterator(),
+                version
+            )
+        return _state['index']
+
+
+def filter_queryset(queryset, query):
+    """
+    Рецепты, найденные по запросу, с рангом search_rank,
+    упорядоченные по убыванию ранга. Ранг в PostgreSQL приводится
+    к double precision: значение из курсора пагинации сравнивается
+    с ним без потери точности.
+    """
+    if not tokenize(query):
+        return queryset
+    if uses_postgres(queryset):
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+        search_query = SearchQuery(query, config=settings.SEARCH_CONFIG)
+        queryset = queryset.annotate(search_vector=vector()).filter(
+            search_vector=search_query
+        ).annotate(search_rank=Cast(
+            SearchRank(vector(), search_query), FloatField()
+        ))
+    else:
+        ranks = get_index().search(query)
+        if not ranks:
+            return queryset.none()
+        queryset = queryset.filter(id__in=ranks).annotate(
+            search_rank=Case(
+                *(When(id=recipe, then=Value(rank))
+                  for recipe, rank in ranks.items()),
+                default=Value(0.0),
+                output_field=FloatField()
+            )
+        )
+    return queryset.order_by('-search_rank', '-pub_date', '-id')
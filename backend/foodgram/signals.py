@@ -0,0 +1,73 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from users.models import Subscription, User
+
+from . import (autocomplete, cart, cookable, feed, images, reference, search,
+               similar, versions)
+from .models import Amount, Ingredient, Recipe, ShoppingList, Tag, TagRecipe
+
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredients_changed(instance, **kwargs):
+    reference.bump(reference.INGREDIENTS)
+    autocomplete.invalidate()
+    if kwargs.get('created') is False:
+        search.schedule(Amount.objects.filter(
+            ingredient=instance).values_list('recipe_id', flat=True))
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tags_changed(**kwargs):
+    reference.bump(reference.TAGS)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_changed(instance, **kwargs):
+    versions.touch(versions.RECIPES, versions.recipe(instance.pk))
+    cookable.schedule([instance.pk])
+    similar.schedule([instance.pk])
+    if 'created' in kwargs:
+        search.schedule([instance.pk])
+    if kwargs.get('created'):
+        transaction.on_commit(lambda: feed.add_recipe(instance))
+    elif 'created' not in kwargs:
+        transaction.on_commit(
+            lambda: feed.reset_followers(instance.author_id)
+        )
+        images.discard(instance.image.name)
+
+
+@receiver((post_save, post_delete), sender=Amount)
+@receiver((post_save, post_delete), sender=TagRecipe)
+def recipe_part_changed(instance, sender, **kwargs):
+    versions.touch(versions.RECIPES, versions.recipe(instance.recipe_id))
+    similar.schedule([instance.recipe_id])
+    if sender is Amount:
+        cookable.schedule([instance.recipe_id])
+        search.schedule([instance.recipe_id])
+        cart.schedule(recipe_ids=[instance.recipe_id])
+
+
+@receiver((post_save, post_delete), sender=ShoppingList)
+def shopping_list_changed(instance, **kwargs):
+    cart.schedule(user_ids=[instance.user_id])
+
+
+@receiver(post_save, sender=User)
+def author_changed(instance, created, update_fields, **kwargs):
+    # Автор входит в ответ рецепта; вход (last_login) его не меняет.
+    if created or (update_fields is not None
+                   and not AUTHOR_FIELDS & set(update_fields)):
+        return
+    versions.touch(versions.RECIPES, *(
+        versions.recipe(pk) for pk in Recipe.objects.filter(
+            author=instance).values_list('id', flat=True)
+    ))
+
+
+@receiver((post_save, post_delete), sender=Subscription)
+def subscriptions_changed(instance, **kwargs):
+    transaction.on_commit(lambda: feed.reset(instance.user_id))
@@ -0,0 +1,383 @@
+"""
+Похожие рецепты.
+
+Сходство рецептов - сумма трёх оценок:
+- коэффициент Жаккара по ингредиентам с весом 1 - TAG_WEIGHT;
+- коэффициент Жаккара по тегам с весом TAG_WEIGHT;
+- косинусная мера совместных добавлений в избранное
+  (сколько пользователей добавили оба рецепта) с весом FAVORITES_WEIGHT.
+Кандидаты - рецепты с общими ингредиентами или общими добавлениями
+в избранное, теги только уточняют оценку.
+
+Индекс хранится в памяти процесса в массивах NumPy, как в
+foodgram.cookable: разреженные матрицы рецепт - ингредиент
+и пользователь - рецепт в формате CSR в обе стороны и плотная
+булева матрица тегов (тегов немного). Соседи рецепта кэшируются
+в LRU-кэше индекса (CACHE_SIZE рецептов).
+
+Изменения состава и тегов копятся в overrides поверх массивов,
+как в cookable, и сбрасывают кэш соседей. Избранное обновляется
+при перестройке индекса: после MAX_OVERRIDES изменений или
+SIMILAR_INDEX_TTL секунд. Команда build_similar_index сохраняет исходные
+массивы в SIMILAR_INDEX_FILE: процессы, которым нужен индекс, читают
+файл не старше SIMILAR_INDEX_TTL вместо трёх полных выборок из базы.
+Если команда не запускается по расписанию чаще SIMILAR_INDEX_TTL,
+каждый процесс раз в SIMILAR_INDEX_TTL читает Amount, TagRecipe
+и FavouriteRecipe целиком.
+"""
+import os
+import time
+from functools import lru_cache
+from threading import Lock
+
+import numpy as np
+from django.conf import settings
+
+from .models import Amount, FavouriteRecipe, Recipe, TagRecipe
+from .transactions import after_commit
+
+MAX_OVERRIDES = 1000
+CACHE_SIZE = 10000
+TAG_WEIGHT = 0.3
+FAVORITES_WEIGHT = 0.5
+# Для популярных рецептов совместное избранное считается
+# по первым MAX_FANS добавившим.
+MAX_FANS = 1000
+SPARSE_RATIO = 16
+
+_state = {'index': None}
+_lock = Lock()
+
+
+def csr(keys, values, size):
+    """values, сгруппированные по keys: indptr и данные"""
+    order = np.argsort(keys, kind='stable')
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=size), out=indptr[1:])
+    return indptr, values[order]
+
+
+def pairs_array(queryset, *fields):
+    return np.fromiter(
+        (value for row in queryset.values_list(*fields).iterator()
+         for value in row),
+        dtype=np.int64
+    ).reshape(-1, len(fields))
+
+
+def unique(values):
+    """Отсортированные значения без повторов (сортировка, без хеширования)"""
+    values = np.sort(np.asarray(values, dtype=np.int64))
+    keep = np.ones(len(values), dtype=bool)
+    keep[1:] = values[1:] != values[:-1]
+    return values[keep]
+
+
+def lookup(sorted_ids, ids):
+    """Позиции ids в отсортированном sorted_ids и маска найденных"""
+    ids = np.asarray(ids, dtype=np.int64)
+    positions = np.searchsorted(sorted_ids, ids)
+    found = positions < len(sorted_ids)
+    found[found] = sorted_ids[positions[found]] == ids[found]
+    return positions, found
+
+
+def jaccard(size, other_sizes, intersections):
+    union = size + other_sizes - intersections
+    return np.divide(
+        intersections, union, out=np.zeros(np.shape(union)), where=union > 0
+    )
+
+
+class SimilarIndex:
+
+    def __init__(self, recipe_ids, amounts, tags, favorites):
+        """
+        recipe_ids - id всех рецептов, amounts, tags и favorites -
+        массивы пар (рецепт, ингредиент), (рецепт, тег)
+        и (пользователь, рецепт) формы (n, 2).
+        """
+        self.recipe_ids = unique(recipe_ids)
+        count = len(self.recipe_ids)
+
+        recipes, ingredients = self.pairs(amounts[:, 0], amounts[:, 1])
+        self.ingredients_ptr, self.ingredients = csr(
+            recipes, ingredients, count
+        )
+        self.ingredient_sizes = np.diff(self.ingredients_ptr)
+        size = int(ingredients.max()) + 1 if len(ingredients) else 0
+        self.postings_ptr, self.postings = csr(ingredients, recipes, size)
+
+        recipes, tag_ids = self.pairs(tags[:, 0], tags[:, 1])
+        self.tag_ids = unique(tag_ids)
+        self.tags = np.zeros((count, len(self.tag_ids)), dtype=bool)
+        self.tags[recipes, np.searchsorted(self.tag_ids, tag_ids)] = True
+        self.tag_sizes = self.tags.sum(axis=1)
+
+        recipes, users = self.pairs(favorites[:, 1], favorites[:, 0])
+        self.fans_ptr, self.fans = csr(recipes, users, count)
+        self.fan_counts = np.minimum(np.diff(self.fans_ptr), MAX_FANS)
+        size = int(users.max()) + 1 if len(users) else 0
+        self.favorites_ptr, self.favorites = csr(users, recipes, size)
+
+        self.overrides = {}
+        self.built_at = time.monotonic()
+        self.neighbours = lru_cache(maxsize=CACHE_SIZE)(self.find_neighbours)
+
+    def pairs(self, recipe_ids, values):
+        """Пары (позиция рецепта, значение) без повторов"""
+        positions, known = lookup(self.recipe_ids, recipe_ids)
+        positions, values = positions[known], np.asarray(values)[known]
+        # Пара кодируется одним числом: уникальность по одномерному массиву.
+        base = int(values.max()) + 1 if len(values) else 1
+        keys = unique(positions * base + values)
+        return keys // base, keys % base
+
+    def position(self, recipe_id):
+        positions, known = lookup(self.recipe_ids, [recipe_id])
+        return int(positions[0]) if known[0] else None
+
+    def knows(self, recipe_id):
+        return recipe_id in self.overrides or (
+            self.position(recipe_id) is not None
+        )
+
+    def features(self, recipe_id):
+        """Ингредиенты и теги рецепта или None для неизвестного"""
+        if recipe_id in self.overrides:
+            return self.overrides[recipe_id]
+        position = self.position(recipe_id)
+        if position is None:
+            return None
+        return (
+            frozenset(self.ingredients[
+                self.ingredients_ptr[position]:
+                self.ingredients_ptr[position + 1]
+            ].tolist()),
+            frozenset(self.tag_ids[self.tags[position]].tolist()),
+        )
+
+    def slices(self, indptr, data, keys):
+        parts = [
+            data[indptr[key]:indptr[key + 1]]
+            for key in keys if 0 <= key < len(indptr) - 1
+        ]
+        return np.concatenate(parts) if parts else data[:0]
+
+    def count(self, postings):
+        """Позиции рецептов и число их вхождений в postings"""
+        if len(postings) * SPARSE_RATIO < len(self.recipe_ids):
+            return np.unique(postings, return_counts=True)
+        # Длинные списки дешевле посчитать плотным массивом.
+        hits = np.bincount(postings, minlength=len(self.recipe_ids))
+        positions = np.flatnonzero(hits)
+        return positions, hits[positions]
+
+    def ingredient_scores(self, ingredients):
+        positions, hits = self.count(
+            self.slices(self.postings_ptr, self.postings, ingredients)
+        )
+        return positions, jaccard(
+            len(ingredients), self.ingredient_sizes[positions], hits
+        )
+
+    def favorite_scores(self, recipe_id):
+        """Позиции рецептов и косинусная мера совместного избранного"""
+        position = self.position(recipe_id)
+        if position is None:
+            return self.postings[:0], np.zeros(0)
+        users = self.fans[
+            self.fans_ptr[position]:self.fans_ptr[position + 1]
+        ][:MAX_FANS]
+        positions, hits = self.count(
+            self.slices(self.favorites_ptr, self.favorites, users)
+        )
+        return positions, hits / np.sqrt(
+            len(users) * self.fan_counts[positions]
+        )
+
+    def tag_scores(self, positions, tags):
+        columns, found = lookup(self.tag_ids, sorted(tags))
+        hits = self.tags[positions][:, columns[found]].sum(axis=1)
+        return jaccard(len(tags), self.tag_sizes[positions], hits)
+
+    def override_scores(self, recipe_id, features, favorites):
+        """Сходство с изменёнными рецептами: [(recipe_id, сходство)]"""
+        ingredients, tags = features
+        scores = []
+        for other, other_features in self.overrides.items():
+            if other_features is None or other == recipe_id:
+                continue
+            other_ingredients, other_tags = other_features
+            common = len(ingredients & other_ingredients)
+            if not common and other not in favorites:
+                continue
+            scores.append((other, float(
+                (1 - TAG_WEIGHT) * jaccard(
+                    len(ingredients), len(other_ingredients), common
+                )
+                + TAG_WEIGHT * jaccard(
+                    len(tags), len(other_tags), len(tags & other_tags)
+                )
+                + favorites.get(other, 0)
+            )))
+        return scores
+
+    def find_neighbours(self, recipe_id, k):
+        """
+        k самых похожих рецептов: ((recipe_id, сходство), ...)
+        по убыванию сходства, затем id.
+        """
+        features = self.features(recipe_id)
+        if features is None:
+            return ()
+        ingredients, tags = features
+        ingredient_positions, ingredient_scores = self.ingredient_scores(
+            ingredients
+        )
+        favorite_positions, favorite_scores = self.favorite_scores(
+            recipe_id
+        )
+        # Плотный массив по всем рецептам дешевле объединения позиций.
+        scores = np.zeros(len(self.recipe_ids))
+        scores[ingredient_positions] += (1 - TAG_WEIGHT) * ingredient_scores
+        favorites = FAVORITES_WEIGHT * favorite_scores
+        scores[favorite_positions] += favorites
+        positions = np.flatnonzero(scores)
+        scores = scores[positions] + TAG_WEIGHT * self.tag_scores(
+            positions, tags
+        )
+        ids = self.recipe_ids[positions]
+        overrides = self.overrides
+        stale = np.isin(
+            ids, np.fromiter([recipe_id, *overrides], dtype=np.int64)
+        )
+        ids, scores = ids[~stale], scores[~stale]
+        if overrides:
+            extra = self.override_scores(recipe_id, features, dict(zip(
+                self.recipe_ids[favorite_positions].tolist(),
+                favorites.tolist()
+            )))
+            if extra:
+                extra_ids, extra_scores = zip(*extra)
+                ids = np.concatenate([ids, extra_ids])
+                scores = np.concatenate([scores, extra_scores])
+        if len(scores) > k:
+            threshold = np.partition(scores, len(scores) - k)[-k]
+            keep = scores >= threshold
+            ids, scores = ids[keep], scores[keep]
+        order = np.lexsort((-ids, -scores))[:k]
+        return tuple(zip(
+            ids[order].tolist(), np.round(scores[order], 4).tolist()
+        ))
+
+    def update(self, recipe_id, features):
+        """Новые ингредиенты и теги рецепта, None - рецепт удалён"""
+        # Словарь заменяется целиком: поиск идёт без блокировки.
+        self.overrides = {**self.overrides, recipe_id: features}
+        self.neighbours.cache_clear()
+
+
+def read_arrays():
+    """Исходные массивы индекса из базы"""
+    return {
+        'recipe_ids': np.fromiter(
+            Recipe.objects.values_list('id', flat=True).iterator(),
+            dtype=np.int64
+        ),
+        'amounts': pairs_array(Amount.objects, 'recipe_id', 'ingredient_id'),
+        'tags': pairs_array(TagRecipe.objects, 'recipe_id', 'tag_id'),
+        'favorites': pairs_array(
+            FavouriteRecipe.objects, 'user_id', 'recipe_id'
+        ),
+    }
+
+
+def save(arrays, path):
+    # Файл заменяется целиком: процессы не прочитают его недописанным.
+    temporary = f'{path}.tmp.npz'
+    np.savez(temporary, **arrays)
+    os.replace(temporary, path)
+
+
+def read_file(path):
+    """Массивы из файла, если он не старше SIMILAR_INDEX_TTL, иначе None"""
+    try:
+        if time.time() - os.path.getmtime(path) > settings.SIMILAR_INDEX_TTL:
+            return None
+        with np.load(path) as data:
+            return {name: data[name] for name in data.files}
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def load():
+    arrays = None
+    if settings.SIMILAR_INDEX_FILE:
+        arrays = read_file(settings.SIMILAR_INDEX_FILE)
+    return SimilarIndex(**(arrays or read_arrays()))
+
+
+def is_stale(index):
+    return (
+        index is None
+        or len(index.overrides) > MAX_OVERRIDES
+        or time.monotonic() - index.built_at > settings.SIMILAR_INDEX_TTL
+    )
+
+
+def get_index():
+    with _lock:
+        if is_stale(_state['index']):
+            _state['index'] = load()
+        return _state['index']
+
+
+def read_features(recipe_ids):
+    """Ингредиенты и теги рецептов из базы, None для удалённых"""
+    ingredients = {recipe: set() for recipe in recipe_ids}
+    tags = {recipe: set() for recipe in recipe_ids}
+    for recipe, ingredient in Amount.objects.filter(
+            recipe_id__in=recipe_ids
+    ).values_list('recipe_id', 'ingredient_id'):
+        ingredients[recipe].add(ingredient)
+    for recipe, tag in TagRecipe.objects.filter(
+            recipe_id__in=recipe_ids
+    ).values_list('recipe_id', 'tag_id'):
+        tags[recipe].add(tag)
+    existing = set(Recipe.objects.filter(
+        id__in=recipe_ids).values_list('id', flat=True))
+    return {
+        recipe: (
+            (frozenset(ingredients[recipe]), frozenset(tags[recipe]))
+            if recipe in existing else None
+        )
+        for recipe in recipe_ids
+    }
+
+
+def apply_changes(recipe_ids, index=None):
+    index = index or _state['index']
+    if index is None:
+        return
+    features = read_features(recipe_ids)
+    with _lock:
+        for recipe, value in features.items():
+            index.update(recipe, value)
+
+
+def schedule(recipe_ids):
+    """Переносит состав и теги рецептов в индекс после фиксации транзакции"""
+    if _state['index'] is not None:
+        after_commit(apply_changes, recipe_ids=recipe_ids)
+
+
+def neighbours(recipe_id, k):
+    """
+    k похожих рецептов. Рецепт, созданный в другом процессе
+    после построения индекса, читается из базы.
+    """
+    index = get_index()
+    if not index.knows(recipe_id):
+        apply_changes([recipe_id], index)
+    return index.neighbours(recipe_id, k)
@@ -0,0 +1,136 @@
+from functools import partial
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase
+from users.models import User
+
+from .models import Recipe
+from .queries import PREVIEW_FIELDS, latest_recipes_by_author
+
+
+class QueryPlanTests(TestCase):
+    """Частые запросы идут по индексам (check_query_plans)"""
+
+    def test_hot_queries_use_indexes(self):
+        out = StringIO()
+        call_command('check_query_plans', stdout=out)
+        self.assertNotIn('FAIL', out.getvalue())
+
+
+class LatestRecipesTests(TestCase):
+    """Последние рецепты авторов: порядок, limit и загружаемые поля"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.authors = [
+            User.objects.create_user(
+                username=f'author{i}', email=f'author{i}@foodgram.ru',
+                password='pass12345!'
+            ) for i in range(3)
+        ]
+        for i in range(12):
+            Recipe.objects.create(
+                author=cls.authors[i % 3], name=f'рецепт {i}',
+                image='recipes/1.png', text='текст', cooking_time=i + 1
+            )
+
+    def expected(self, limit):
+        return {
+            author.id: list(Recipe.objects.filter(author=author).order_by(
+                '-pub_date', '-id').values_list('id', flat=True)[:limit])
+            for author in self.authors[:2]
+        }
+
+    def test_order_limit_and_fields(self):
+        deferred = {
+            field.attname for field in Recipe._meta.concrete_fields
+        } - set(PREVIEW_FIELDS)
+        for limit in (None, 2):
+            with self.subTest(limit=limit):
+                with self.assertNumQueries(1):
+                    recipes = latest_recipes_by_author(
+                        [author.id for author in self.authors[:2]], limit
+                    )
+                self.assertEqual({
+                    author: [recipe.id for recipe in items]
+                    for author, items in recipes.items()
+                }, self.expected(limit))
+                for items in recipes.values():
+                    for recipe in items:
+                        self.assertEqual(
+                            recipe.get_deferred_fields(), deferred
+                        )
+
+
+class ConstraintConflictsTests(TestCase):
+
+    def test_consistent_data_is_unchanged(self):
+        out = StringIO()
+        call_command('remove_constraint_conflicts', stdout=out)
+        self.assertIn('лишних связей тегов 0', out.getvalue())
+        self.assertIn('повторами ингредиентов 0', out.getvalue())
+        self.assertIn('повторов ингредиентов 0', out.getvalue())
+
+
+class ConstraintMigrationTests(TransactionTestCase):
+    """Миграция 0002 готовит данные старой схемы к ограничениям 0003"""
+    migrate_from = [('foodgram', '0001_initial')]
+    migrate_to = [('foodgram', '0003_constraints_counters_and_cart')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+        super().tearDown()
+
+    def test_conflicts_are_removed_before_constraints(self):
+        apps = self.migrate(self.migrate_from)
+        model = partial(apps.get_model, 'foodgram')
+        author = apps.get_model('auth', 'User').objects.create(
+            username='author', email='author@foodgram.ru'
+        )
+        recipe = model('Recipe').objects.create(
+            author_id=author.id, name='рецепт', text='текст', cooking_time=5
+        )
+        tag = model('Tag').objects.create(
+            name='завтрак', slug='breakfast', color='#FFA500'
+        )
+        salt, salt_copy, pepper = (
+            model('Ingredient').objects.create(
+                name=name, measurement_unit='г'
+            ) for name in ('соль', 'соль', 'перец')
+        )
+        for recipe_id, tag_id in ((recipe.id, tag.id), (recipe.id, tag.id),
+                                  (None, tag.id), (recipe.id, None)):
+            model('TagRecipe').objects.create(
+                recipe_id=recipe_id, tag_id=tag_id
+            )
+        for ingredient, amount in ((salt, 5), (salt_copy, 7), (pepper, 3),
+                                   (pepper, 2)):
+            model('Amount').objects.create(
+                recipe_id=recipe.id, ingredient_id=ingredient.id,
+                amount=amount
+            )
+
+        apps = self.migrate(self.migrate_to)
+        model = partial(apps.get_model, 'foodgram')
+        self.assertEqual(
+            list(model('TagRecipe').objects.values_list('recipe', 'tag')),
+            [(recipe.id, tag.id)]
+        )
+        self.assertEqual(
+            list(model('Ingredient').objects.order_by('id').values_list(
+                'id', flat=True)),
+            [salt.id, pepper.id]
+        )
+        self.assertEqual(
+            dict(model('Amount').objects.values_list('ingredient', 'amount')),
+            {salt.id: 12, pepper.id: 5}
+        )
@@ -0,0 +1,43 @@
+"""
+Действия над наборами id после фиксации транзакции.
+
+Сигналы приходят на каждую строку (изменение состава рецепта,
+каскадное удаление), а пересчёт нужен один на транзакцию:
+after_commit() объединяет наборы всех вызовов с одной функцией
+и вызывает её один раз. Вне транзакции функция вызывается сразу.
+"""
+import threading
+from collections import defaultdict
+
+from django.db import transaction
+
+_local = threading.local()
+
+
+def after_commit(func, **sets):
+    """func(**sets) после фиксации, наборы объединяются по имени"""
+    sets = {name: set(values) for name, values in sets.items()}
+    if not any(sets.values()):
+        return
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        func(**sets)
+        return
+    if not hasattr(_local, 'pending'):
+        _local.pending = {}
+    pending = _local.pending
+    entry = pending.get(func)
+    if entry is None or not any(
+            callback is entry[0] for _, callback in connection.run_on_commit):
+        # Вызов откаченной транзакции снят вместе с ней.
+        collected = defaultdict(set)
+
+        def callback():
+            if pending.get(func, (None, ))[0] is callback:
+                del pending[func]
+            func(**collected)
+
+        entry = pending[func] = (callback, collected)
+        transaction.on_commit(callback)
+    for name, values in sets.items():
+        entry[1][name].update(values)
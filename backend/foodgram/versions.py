@@ -0,0 +1,46 @@
+"""
+Метки версий рецептов для кэширования ответов API.
+
+Метка - время последнего изменения в микросекундах: общая RECIPES
+для списков, своя у каждого рецепта для детальной страницы
+и POPULARITY для порядка по счётчикам. Метки хранятся в кэше
+справочных данных и меняются после фиксации транзакции, чтобы
+параллельный запрос не закэшировал старые данные под новой меткой.
+"""
+from django.db import transaction
+
+from . import reference
+
+RECIPES = 'recipes'
+POPULARITY = 'popularity'
+
+
+def recipe(pk):
+    return f'recipe:{pk}'
+
+
+def cache_key(name):
+    return f'versions:{name}'
+
+
+def get_many(names):
+    """Метки наборов names: {name: version}"""
+    cache = reference.get_cache()
+    keys = {cache_key(name): name for name in names}
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        version = reference.new_version()
+        for key in missing:
+            cache.add(key, version, None)
+        found.update(cache.get_many(missing))
+    return {keys[key]: version for key, version in found.items()}
+
+
+def touch(*names):
+    def apply():
+        version = reference.new_version()
+        reference.get_cache().set_many(
+            {cache_key(name): version for name in names}, None
+        )
+    transaction.on_commit(apply)
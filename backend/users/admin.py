@@ -1,5 +1,8 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from django.db.models import Q
+from foodgram.admin import LargeTableAdmin, find_user
+from foodgram.paginators import EstimatedCountPaginator
 
 from .models import Subscription, User
 
@@ -10,11 +13,23 @@ admin.site.unregister(User)
 class CustomUserAdmin(UserAdmin):
     list_display = ('id', 'username', 'email',
                     'first_name', 'last_name', 'is_staff')
-    list_filter = ('username', 'email')
+    list_filter = ('is_staff', 'is_superuser', 'is_active')
     list_display_links = ('id', 'username')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(Subscription)
-class SubscriptionAdmin(admin.ModelAdmin):
+class SubscriptionAdmin(LargeTableAdmin):
     list_display = ('user', 'author')
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
+    search_fields = ('=user__username', '=author__username')
     ordering = ('user', )
+
+    def get_search_results(self, request, queryset, search_term):
+        """Подписки и подписчики пользователя по имени или почте"""
+        user = find_user(search_term.strip())
+        if user is not None:
+            return queryset.filter(Q(user_id=user) | Q(author_id=user)), False
+        return super().get_search_results(request, queryset, search_term)
@@ -27,3 +27,25 @@ class Subscription(models.Model):
                 name='unique_subscription'
             )
         ]
+
+
+class AuthorStats(models.Model):
+    """
+    Счётчики пользователя, которые нельзя хранить в модели User.
+    Поддерживаются через foodgram.counters.
+    """
+    user = models.OneToOneField(
+        User,
+        related_name='stats',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        verbose_name='Пользователь'
+    )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество рецептов'
+    )
+
+    class Meta:
+        verbose_name = 'Статистика автора'
+        verbose_name_plural = 'Статистика авторов'
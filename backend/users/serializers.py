@@ -44,4 +44,7 @@ class CustomUserSerializer(UserSerializer):
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
+        subscriptions = self.context.get('subscriptions')
+        if subscriptions is not None:
+            return obj.id in subscriptions
         return Subscription.objects.filter(user=user, author=obj).exists()
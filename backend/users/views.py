@@ -1,7 +1,12 @@
-from api.pagination import LimitPagePagination
-from api.serializers import SubscriptionSerializer
+from api.pagination import LimitPagePagination, OptionalKeysetPaginationMixin
+from api.serializers import (ShowSubscriptionSerializer,
+                             SubscriptionSerializer, get_recipes_limit)
+from api.sparse_fields import requested_fields
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
+from foodgram.queries import latest_recipes_by_author
 from rest_framework import permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
@@ -10,10 +15,11 @@ from .models import Subscription, User
 from .serializers import CustomUserSerializer
 
 
-class CustomUserViewSet(UserViewSet):
+class CustomUserViewSet(OptionalKeysetPaginationMixin, UserViewSet):
     queryset = User.objects.all()
     serializer_class = CustomUserSerializer
     pagination_class = LimitPagePagination
+    cursor_ordering = ('-id', )
 
     @action(
         detail=True,
@@ -47,13 +53,30 @@ class CustomUserViewSet(UserViewSet):
         permission_classes=(permissions.IsAuthenticated, )
     )
     def subscriptions(self, request):
-        user = request.user
-        pages = self.paginate_queryset(
-            Subscription.objects.filter(user=user)
+        """
+        Подписки за фиксированное число запросов: число рецептов
+        берётся из счётчика автора в том же запросе, а превью рецептов
+        всех авторов страницы загружаются одним запросом.
+        ?fields= ограничивает поля авторов, без recipes превью
+        не загружаются.
+        """
+        limit = get_recipes_limit(request)
+        fields = requested_fields(request)
+        authors = self.paginate_queryset(
+            User.objects.filter(following__user=request.user).annotate(
+                subscription_id=F('following__id'),
+                recipes_count=Coalesce('stats__recipes_count', Value(0))
+            ).order_by('subscription_id')
         )
-        serializer = SubscriptionSerializer(
-            pages,
-            many=True,
-            context={'request': request}
+        author_ids = [author.id for author in authors]
+        context = {
+            'request': request,
+            'subscriptions': set(author_ids),
+            'sparse_fields': fields,
+        }
+        if fields is None or 'recipes' in fields:
+            context['recipes'] = latest_recipes_by_author(author_ids, limit)
+        serializer = ShowSubscriptionSerializer(
+            authors, many=True, context=context
         )
         return self.get_paginated_response(serializer.data)